@@ -17,6 +17,7 @@ SECRET_KEY = os.environ.get('SECRET_KEY')
 
 
 MIDDLEWARE = [
+    'WearUpBack.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -24,6 +25,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'WearUpBack.profiling.ProfilingMiddleware',
+    'WearUpBack.db_routing.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -43,6 +46,18 @@ STORAGES = {
        }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', '/tmp/wearup-cache/default'),
+    },
+    'objects': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('OBJECT_CACHE_DIR', '/tmp/wearup-cache/objects'),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
 DATABASES = {
     'default': dj_database_url.config(
         default=os.environ.get('DATABASE_URL'),
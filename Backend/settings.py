@@ -55,12 +55,15 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 MIDDLEWARE = [
+    'WearUpBack.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'WearUpBack.profiling.ProfilingMiddleware',
+    'WearUpBack.db_routing.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -170,12 +173,33 @@ else:
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# 'objects' is the shared tier behind the per-process caches in
+# WearUpBack/object_cache.py; deployment points it at a file cache so every
+# worker on the host shares it.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'wearup-default',
+    },
+    'objects': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'wearup-objects',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'WearUpBack.token_auth.ClaimsJWTAuthentication',
     ),
 }
 
+# Access tokens carry the claims read requests are authenticated from; see
+# WearUpBack/token_auth.py.
+SIMPLE_JWT = {
+    'TOKEN_REFRESH_SERIALIZER': 'WearUpBack.token_auth.ClaimsTokenRefreshSerializer',
+}
+
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
@@ -185,3 +209,54 @@ CSRF_TRUSTED_ORIGINS = ['https://wearup-backend.onrender.com']
 import os
 if os.environ.get('DATABASE_URL'):
     from .deployment_settings import *
+
+# Read replicas, e.g. DATABASE_REPLICA_URLS=postgres://replica-1/db,postgres://replica-2/db
+# Safe requests to REPLICA_READ_PATHS read from them; see WearUpBack/db_routing.py.
+import dj_database_url
+DATABASE_REPLICAS = []
+for _index, _url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(','))):
+    _alias = f'replica{_index + 1}'
+    DATABASES[_alias] = dj_database_url.parse(_url.strip(), conn_max_age=600)
+    # Tests run against the primary's test database
+    DATABASES[_alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ['WearUpBack.db_routing.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 5
+REPLICA_READ_PATHS = [
+    '/api/products/',
+    '/api/async/products/',
+    '/api/product-comments/',
+    '/api/users/',
+]
+
+# Request instrumentation (WearUpBack/instrumentation.py): queries slower than
+# this are logged with the code that issued them, and /metrics requires
+# `Authorization: Bearer <METRICS_TOKEN>`. Without a token only a local
+# debug server serves it; deployments refuse it until METRICS_TOKEN is set.
+SLOW_QUERY_SECONDS = 0.2
+METRICS_FLUSH_SECONDS = 10
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOW_ANONYMOUS = DEBUG and not os.environ.get('DATABASE_URL')
+
+# Staff can profile a request with ?_profile=1 or an X-Profile header
+# (WearUpBack/profiling.py). Raw .prof files are kept on local disk; the
+# newest PROFILE_REPORTS_KEEP reports are kept.
+PROFILE_REPORTS_ROOT = BASE_DIR / 'profiles'
+PROFILE_REPORTS_KEEP = 200
+
+# Login by email goes through WearUpBack/auth_backends.py: one lookup on the
+# LOWER(email) index, and after LOGIN_FAILURE_LIMIT failed attempts on an
+# address within LOGIN_FAILURE_WINDOW seconds it answers 429 without hashing.
+# Counters are kept per worker process.
+AUTHENTICATION_BACKENDS = [
+    'WearUpBack.auth_backends.EmailBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+LOGIN_FAILURE_LIMIT = 5
+LOGIN_FAILURE_WINDOW = 15 * 60
+
+# Refresh-token revocation checks go through a per-worker Bloom filter of the
+# blacklist, rebuilt this often (WearUpBack/revocation.py). Expired tokens are
+# deleted by `manage.py purge_tokens`.
+REVOCATION_SNAPSHOT_SECONDS = 60
@@ -20,7 +20,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
-from WearUpBack.views import ProductViewSet, CartViewSet, CartItemViewSet, OrderViewSet, OrderItemViewSet, register_user, login_user, logout_user, user_profile, public_user_profile, ProductLikeViewSet, ProductCommentViewSet, ProductShareViewSet, toggle_product_like, share_product
+from WearUpBack import async_views, instrumentation
+from WearUpBack.views import ProductViewSet, CartViewSet, CartItemViewSet, OrderViewSet, OrderItemViewSet, register_user, login_user, logout_user, user_profile, public_user_profile, storefront, ProductLikeViewSet, ProductCommentViewSet, ProductShareViewSet, toggle_product_like, share_product, validate_coupon, redeem_coupon_view, bulk_reprice, import_catalog, export_products, export_orders, seller_analytics, seller_top_products, seller_low_stock, bulk_update_stock
 
 router = DefaultRouter()
 # router.register(r'categories', CategoryViewSet)
@@ -39,15 +40,31 @@ router.register(r'order-items', OrderItemViewSet, basename='orderitem')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', instrumentation.metrics, name='metrics'),
     path('api/', include(router.urls)),
     path('api/auth/register/', register_user, name='register'),
     path('api/auth/login/', login_user, name='login'),
     path('api/auth/logout/', logout_user, name='logout'),
     path('api/auth/profile/', user_profile, name='profile'),
     path('api/users/<int:user_id>/', public_user_profile, name='public_user_profile'),
+    path('api/users/<int:user_id>/storefront/', storefront, name='storefront'),
     path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/products/<int:product_id>/toggle-like/', toggle_product_like, name='toggle_product_like'),
     path('api/products/<int:product_id>/share/', share_product, name='share_product'),
+    path('api/coupons/validate/', validate_coupon, name='validate_coupon'),
+    path('api/coupons/redeem/', redeem_coupon_view, name='redeem_coupon'),
+    path('api/pricing/bulk-reprice/', bulk_reprice, name='bulk_reprice'),
+    path('api/catalog/import/', import_catalog, name='import_catalog'),
+    path('api/seller/export/products/', export_products, name='export_products'),
+    path('api/seller/export/orders/', export_orders, name='export_orders'),
+    path('api/seller/analytics/', seller_analytics, name='seller_analytics'),
+    path('api/seller/analytics/top-products/', seller_top_products, name='seller_top_products'),
+    path('api/seller/low-stock/', seller_low_stock, name='seller_low_stock'),
+    path('api/inventory/bulk-update/', bulk_update_stock, name='bulk_update_stock'),
+    path('api/async/products/', async_views.product_list, name='async_product_list'),
+    path('api/async/products/<int:product_id>/', async_views.product_detail, name='async_product_detail'),
+    path('api/async/products/<int:product_id>/like-state/', async_views.product_like_state, name='async_product_like_state'),
+    path('api/async/products/<int:product_id>/comments/', async_views.product_comments, name='async_product_comments'),
 ]
 
 if settings.DEBUG:
@@ -1,8 +1,16 @@
 from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
 from .models import (
     Product, Category, Size, Color, ProductImage, ProductVariant, UserProfile, Address,
-    Cart, CartItem, Order, OrderItem, Coupon, ProductView
+    Cart, CartItem, Order, OrderItem, Coupon, ProductView, PriceCampaign, Job,
+    ProductDailyStats, LowStockAlert, StockMovement, StockSnapshot, ProfileReport
 )
+from .pricing import apply_campaign, end_campaign
+from .profiling import profile_storage
 
 
 @admin.register(Product)
@@ -11,7 +19,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ['gender', 'status', 'is_featured', 'categories']
     search_fields = ['product_name', 'description', 'seller__username', 'sku']
     filter_horizontal = ['categories']
-    readonly_fields = ['final_price', 'average_rating', 'views']
+    readonly_fields = ['final_price', 'average_rating', 'views', 'campaign', 'pre_campaign_discount', 'is_low_stock']
 
 
 @admin.register(Category)
@@ -42,9 +50,10 @@ class ProductImageAdmin(admin.ModelAdmin):
 
 @admin.register(ProductVariant)
 class ProductVariantAdmin(admin.ModelAdmin):
-    list_display = ['product', 'size', 'color', 'stock_quantity', 'price_adjustment']
+    list_display = ['product', 'size', 'color', 'stock_quantity', 'price_adjustment', 'final_price']
     list_filter = ['size', 'color']
     search_fields = ['product__product_name', 'sku']
+    readonly_fields = ['final_price']
 
 
 @admin.register(UserProfile)
@@ -111,7 +120,7 @@ class OrderItemAdmin(admin.ModelAdmin):
 
 @admin.register(Coupon)
 class CouponAdmin(admin.ModelAdmin):
-    list_display = ['code', 'discount_type', 'discount_value', 'is_active', 'valid_from', 'valid_to']
+    list_display = ['code', 'discount_type', 'discount_value', 'used_count', 'usage_limit', 'is_active', 'valid_from', 'valid_to']
     list_filter = ['discount_type', 'is_active', 'valid_from', 'valid_to']
     search_fields = ['code', 'description']
 
@@ -121,3 +130,124 @@ class ProductViewAdmin(admin.ModelAdmin):
     list_display = ['user', 'product', 'viewed_at', 'session_id']
     list_filter = ['viewed_at']
     search_fields = ['user__username', 'product__product_name', 'session_id']
+
+
+@admin.register(LowStockAlert)
+class LowStockAlertAdmin(admin.ModelAdmin):
+    list_display = ['product', 'seller', 'stock_quantity', 'threshold', 'detected_at', 'notified_at', 'resolved_at']
+    list_filter = ['detected_at', 'notified_at', 'resolved_at']
+    search_fields = ['product__product_name', 'product__sku', 'seller__username']
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ['item', 'product', 'variant', 'kind', 'quantity', 'reference', 'created_by', 'created_at']
+    list_filter = ['kind', 'created_at']
+    search_fields = ['item', 'reference', 'product__product_name', 'product__sku', 'variant__sku']
+    raw_id_fields = ['product', 'variant', 'created_by']
+
+    # The ledger is append-only; corrections are new adjustment movements
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['item', 'quantity', 'last_movement_id', 'taken_at']
+    search_fields = ['item']
+    list_filter = ['taken_at']
+
+
+@admin.register(ProductDailyStats)
+class ProductDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ['product', 'seller', 'day', 'views', 'likes', 'add_to_carts', 'orders', 'units_sold', 'revenue']
+    list_filter = ['day']
+    search_fields = ['product__product_name', 'seller__username']
+    date_hierarchy = 'day'
+
+
+@admin.register(PriceCampaign)
+class PriceCampaignAdmin(admin.ModelAdmin):
+    list_display = ['name', 'discount_percentage', 'category', 'seller', 'tag', 'starts_at', 'ends_at', 'status']
+    list_filter = ['status', 'starts_at']
+    search_fields = ['name', 'tag', 'seller__username']
+    readonly_fields = ['status', 'created_by', 'created_at']
+    actions = ['apply_now', 'end_now']
+
+    def save_model(self, request, obj, form, change):
+        if not obj.created_by_id:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+    @admin.action(description='Apply selected campaigns now')
+    def apply_now(self, request, queryset):
+        updated = sum(apply_campaign(campaign) for campaign in queryset.exclude(status='active'))
+        self.message_user(request, f'{updated} products repriced.')
+
+    @admin.action(description='End selected campaigns now')
+    def end_now(self, request, queryset):
+        updated = sum(end_campaign(campaign) for campaign in queryset.filter(status='active'))
+        self.message_user(request, f'{updated} products restored.')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'queue', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'updated_at']
+    list_filter = ['status', 'queue', 'name']
+    search_fields = ['name', 'last_error']
+    readonly_fields = ['locked_by', 'locked_at', 'created_at', 'updated_at']
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected jobs now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='running').update(status='queued', run_at=timezone.now(), locked_by='', locked_at=None)
+        self.message_user(request, f'{updated} job(s) queued.')
+
+
+@admin.register(ProfileReport)
+class ProfileReportAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'method', 'path', 'view_name', 'user', 'status_code', 'duration_ms', 'query_count', 'db_ms']
+    list_filter = ['created_at', 'view_name', 'status_code']
+    search_fields = ['path', 'view_name', 'user__username']
+    fields = ['created_at', 'method', 'path', 'view_name', 'user', 'status_code', 'duration_ms', 'query_count', 'db_ms',
+              'download', 'profile', 'sql_log']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        download = path('<int:pk>/download/', self.admin_site.admin_view(self.download_view), name='WearUpBack_profilereport_download')
+        return [download] + super().get_urls()
+
+    def download_view(self, request, pk):
+        report = get_object_or_404(ProfileReport, pk=pk)
+        storage = profile_storage()
+        if not report.profile_file or not storage.exists(report.profile_file):
+            raise Http404('The profile file is gone')
+        return FileResponse(storage.open(report.profile_file, 'rb'), as_attachment=True, filename=report.profile_file)
+
+    @admin.display(description='Raw profile')
+    def download(self, obj):
+        if not obj.profile_file:
+            return '-'
+        url = reverse('admin:WearUpBack_profilereport_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a> (open with pstats or snakeviz)', url, obj.profile_file)
+
+    @admin.display(description='Profile (cumulative time)')
+    def profile(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto">{}</pre>', obj.stats)
+
+    @admin.display(description='SQL')
+    def sql_log(self, obj):
+        rows = format_html_join(
+            '', '<tr><td>{}</td><td>{}</td><td><code>{}</code></td></tr>',
+            ((query['ms'], query['origin'], query['sql']) for query in obj.queries),
+        )
+        return format_html('<table><tr><th>ms</th><th>Issued by</th><th>Query</th></tr>{}</table>', rows)
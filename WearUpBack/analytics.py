@@ -0,0 +1,193 @@
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .db_routing import unpinned
+from .jobs import job
+from .models import CartItem, Order, OrderItem, Product, ProductDailyStats, ProductLike, RollupCursor, StaleStatsDay
+from .storefront import EXCLUDED_ORDER_STATUSES
+
+ROLLUP_CURSOR = 'product-daily-stats'
+# Re-read a little before the cursor so rows committed late aren't missed
+ROLLUP_OVERLAP = timedelta(minutes=5)
+ROLLED_UP_FIELDS = ['likes', 'add_to_carts', 'orders', 'units_sold', 'revenue']
+METRICS = ['views', *ROLLED_UP_FIELDS]
+
+
+def record_view(product_id):
+    """Bump the product's view counter and today's stats row. Doesn't pin the client to the primary."""
+    today = timezone.localdate()
+    with unpinned():
+        if not Product.objects.filter(pk=product_id).update(views=F('views') + 1):
+            return
+        daily = ProductDailyStats.objects.filter(product_id=product_id, day=today)
+        if daily.update(views=F('views') + 1):
+            return
+        seller_id = Product.objects.filter(pk=product_id).values_list('seller_id', flat=True).first()
+        try:
+            with transaction.atomic():
+                ProductDailyStats.objects.create(product_id=product_id, seller_id=seller_id, day=today, views=1)
+        except IntegrityError:
+            # Another request created today's row first
+            daily.update(views=F('views') + 1)
+
+
+def _bounds(start, end):
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+
+def _aggregate_sources(start, end):
+    """{(product_id, day): {metric: value}} for the rolled-up metrics between two dates inclusive."""
+    lower, upper = _bounds(start, end)
+    facts = {}
+
+    def collect(queryset, day_field, **aggregates):
+        rows = (
+            queryset.filter(**{f'{day_field}__gte': lower, f'{day_field}__lt': upper})
+            .annotate(day=TruncDate(day_field)).values('product_id', 'day').order_by()
+            .annotate(**aggregates)
+        )
+        for row in rows:
+            key = (row.pop('product_id'), row.pop('day'))
+            facts.setdefault(key, {}).update({name: value or 0 for name, value in row.items()})
+
+    collect(ProductLike.objects.all(), 'created_at', likes=Count('pk'))
+    collect(CartItem.objects.all(), 'added_at', add_to_carts=Count('pk'))
+    collect(
+        OrderItem.objects.exclude(order__status__in=EXCLUDED_ORDER_STATUSES), 'order__created_at',
+        orders=Count('order', distinct=True), units_sold=Sum('quantity'), revenue=Sum('total_price'),
+    )
+    return facts
+
+
+def rollup_days(start, end=None):
+    """Recompute the rolled-up metrics of every product for the given days; returns rows written.
+
+    Days are rebuilt from scratch, so running this twice is harmless. View
+    counts are left alone since they're recorded live.
+    """
+    end = end or start
+    facts = _aggregate_sources(start, end)
+    sellers = dict(Product.objects.filter(pk__in={pk for pk, _ in facts}).values_list('pk', 'seller_id'))
+    rows = [
+        ProductDailyStats(
+            product_id=product_id, seller_id=sellers.get(product_id), day=day,
+            **{field: metrics.get(field, 0) for field in ROLLED_UP_FIELDS},
+        )
+        for (product_id, day), metrics in facts.items()
+        if product_id in sellers
+    ]
+    upsert = {'update_conflicts': True, 'update_fields': ['seller', *ROLLED_UP_FIELDS]}
+    if connection.features.supports_update_conflicts_with_target:
+        upsert['unique_fields'] = ['product', 'day']
+
+    with transaction.atomic():
+        # Zero first so rows whose source records were deleted don't keep stale numbers
+        ProductDailyStats.objects.filter(day__gte=start, day__lte=end).update(**{field: 0 for field in ROLLED_UP_FIELDS})
+        ProductDailyStats.objects.bulk_create(rows, batch_size=1000, **upsert)
+    return len(rows)
+
+
+def touched_days(since, until):
+    """Days whose rolled-up metrics may have changed between two instants."""
+    days = {timezone.localdate(until)}
+    for queryset, changed_field, day_field in (
+        (ProductLike.objects.all(), 'created_at', 'created_at'),
+        (CartItem.objects.all(), 'added_at', 'added_at'),
+        # A status change moves an older order in or out of the sales figures
+        (Order.objects.all(), 'updated_at', 'created_at'),
+    ):
+        days.update(
+            queryset.filter(**{f'{changed_field}__gt': since, f'{changed_field}__lte': until})
+            .annotate(day=TruncDate(day_field)).order_by().values_list('day', flat=True).distinct()
+        )
+    return sorted(days)
+
+
+def mark_stale(moment):
+    """Have the next run_rollup() rebuild the day of `moment`, for changes touched_days() can't see."""
+    if moment is not None:
+        StaleStatsDay.objects.bulk_create([StaleStatsDay(day=timezone.localdate(moment))], ignore_conflicts=True)
+
+
+@receiver(post_delete, sender=ProductLike)
+def _like_deleted(sender, instance, **kwargs):
+    mark_stale(instance.created_at)
+
+
+@receiver(post_delete, sender=CartItem)
+def _cart_item_deleted(sender, instance, **kwargs):
+    mark_stale(instance.added_at)
+
+
+@receiver(post_delete, sender=OrderItem)
+def _order_item_deleted(sender, instance, **kwargs):
+    # Deleting an order deletes its items first, so the order row is still there
+    mark_stale(Order.objects.filter(pk=instance.order_id).values_list('created_at', flat=True).first())
+
+
+@job('analytics.rollup')
+def run_rollup(now=None):
+    """Roll up everything that changed since the last run. Run from cron via `manage.py rollup_analytics`."""
+    now = now or timezone.now()
+    cursor, _ = RollupCursor.objects.get_or_create(name=ROLLUP_CURSOR)
+    since = (cursor.position or now - timedelta(days=1)) - ROLLUP_OVERLAP
+    stale = dict(StaleStatsDay.objects.values_list('pk', 'day'))
+    days = sorted(set(touched_days(since, now)) | set(stale.values()))
+    written = sum(rollup_days(day) for day in days)
+    # Days marked while this ran keep their marks for the next run
+    StaleStatsDay.objects.filter(pk__in=list(stale)).delete()
+    RollupCursor.objects.filter(pk=cursor.pk).update(position=now)
+    return days, written
+
+
+def _window(start, end, seller, product_id=None):
+    queryset = ProductDailyStats.objects.filter(seller=seller, day__gte=start, day__lte=end)
+    if product_id is not None:
+        queryset = queryset.filter(product_id=product_id)
+    return queryset
+
+
+def _with_conversion(row):
+    row['conversion_rate'] = round(row['orders'] / row['views'], 4) if row['views'] else None
+    return row
+
+
+def _sums():
+    return {metric: Sum(metric) for metric in METRICS}
+
+
+def time_series(seller, start, end, product_id=None):
+    """Per-day totals for a seller (optionally one product), with empty days filled in."""
+    rows = {
+        row.pop('day'): row
+        for row in _window(start, end, seller, product_id).values('day').order_by('day').annotate(**_sums())
+    }
+    empty = {metric: 0 for metric in METRICS}
+    series = []
+    day = start
+    while day <= end:
+        series.append(_with_conversion({'day': day, **rows.get(day, empty)}))
+        day += timedelta(days=1)
+    totals = {metric: sum(point[metric] for point in series) for metric in METRICS}
+    return _with_conversion(totals), series
+
+
+def top_products(seller, start, end, metric='revenue', limit=10):
+    rows = (
+        _window(start, end, seller).values('product_id', 'product__product_name').order_by()
+        .annotate(**_sums()).order_by(f'-{metric}', 'product_id')[:limit]
+    )
+    return [
+        _with_conversion({'product_id': row.pop('product_id'), 'product_name': row.pop('product__product_name'), **row})
+        for row in rows
+    ]
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class WearupbackConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'WearUpBack'
+
+    def ready(self):
+        # Register signal receivers
+        from . import analytics, coupons, instrumentation, inventory, jobs, object_cache, profiling, reference_data, revocation, seller_cards, stock_ledger, storefront  # noqa: F401
+        from .images import connect_signals
+        connect_signals()
+        instrumentation.instrument_serializers()
@@ -0,0 +1,176 @@
+"""Async versions of the hottest read endpoints.
+
+These are plain Django async views (DRF views are sync-only) using the async
+ORM, so under ASGI (uvicorn) a slow query doesn't hold a worker thread.
+Response shapes match the DRF endpoints they mirror.
+
+The views are sequential: each query is awaited before the next starts.
+Django runs every async ORM call on the one thread-sensitive executor, so
+gathering them would not overlap them, and running them on other threads
+would need a connection per thread.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed
+
+from .analytics import record_view
+from .models import Product, ProductComment, ProductLike, UserProfile
+from .serializers import cached_product_detail, ProductCommentSerializer, ProductSerializer, UserSerializer
+from .token_auth import ClaimsJWTAuthentication
+
+PAGE_SIZE = 20
+RELATED_PRODUCTS = 8
+
+
+class _Request:
+    """Minimal stand-in for a DRF request, for serializers that read context['request']."""
+
+    def __init__(self, request, user):
+        self._request = request
+        self.user = user
+
+    def build_absolute_uri(self, location=None):
+        return self._request.build_absolute_uri(location)
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=DjangoJSONEncoder)
+
+
+async def _authenticate(request):
+    try:
+        result = await sync_to_async(ClaimsJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else AnonymousUser()
+
+
+async def _serialize_products(products, request, user):
+    context = {'request': _Request(request, user)}
+    return await sync_to_async(lambda: ProductSerializer(products, many=True, context=context).data)()
+
+
+def _count_view(product_id):
+    record_view(product_id)
+    return Product.objects.filter(pk=product_id).values_list('views', flat=True).first()
+
+
+def _filtered_products(params):
+    """Products matching ?seller=/?user= and ?search=; raises ValueError for a non-numeric seller."""
+    queryset = Product.objects.all()
+    seller_id = params.get('seller') or params.get('user')
+    if seller_id:
+        if not seller_id.isdigit():
+            raise ValueError('seller must be an id.')
+        queryset = queryset.filter(seller_id=seller_id)
+    search_query = params.get('search')
+    if search_query:
+        queryset = queryset.filter(
+            Q(product_name__icontains=search_query)
+            | Q(description__icontains=search_query)
+            | Q(categories__name__icontains=search_query)
+        ).distinct()
+    return queryset
+
+
+@require_GET
+async def product_list(request):
+    user = await _authenticate(request)
+    if user is None:
+        return _json({'detail': 'Invalid token'}, status=401)
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    start = (page - 1) * PAGE_SIZE
+
+    try:
+        products = _filtered_products(request.GET)
+    except ValueError as e:
+        return _json({'error': str(e)}, status=400)
+    queryset = ProductSerializer.setup_eager_loading(products, user).order_by('-created_at', '-pk')
+    products = [product async for product in queryset[start:start + PAGE_SIZE]]
+    return _json(await _serialize_products(products, request, user))
+
+
+@require_GET
+async def product_detail(request, product_id):
+    user = await _authenticate(request)
+    if user is None:
+        return _json({'detail': 'Invalid token'}, status=401)
+
+    try:
+        product_data = await sync_to_async(cached_product_detail)(product_id, request)
+    except Product.DoesNotExist:
+        return _json({'error': 'Product not found'}, status=404)
+
+    user_liked = user.is_authenticated and await ProductLike.objects.filter(product_id=product_id, user_id=user.pk).aexists()
+
+    seller = await User.objects.filter(products__pk=product_id).select_related('profile').afirst()
+    seller_data = None
+    if seller is not None:
+        try:
+            profile = seller.profile
+        except UserProfile.DoesNotExist:
+            profile = None
+        seller_data = {
+            'user': UserSerializer(seller).data,
+            'business_name': profile.business_name if profile else '',
+            'location': profile.location if profile else '',
+            'product_count': await Product.objects.filter(seller=seller).acount(),
+        }
+
+    thread = (
+        ProductComment.objects.filter(product_id=product_id, parent__isnull=True)
+        .select_related('user').prefetch_related('replies__user').order_by('-created_at')[:PAGE_SIZE]
+    )
+    comments = [comment async for comment in thread]
+
+    category_ids = Product.categories.through.objects.filter(product_id=product_id).values('category_id')
+    related_products = ProductSerializer.setup_eager_loading(
+        Product.objects.filter(categories__in=category_ids, status='active').exclude(pk=product_id).distinct(), user
+    ).order_by('-created_at')[:RELATED_PRODUCTS]
+    related = [product async for product in related_products]
+    views = await sync_to_async(_count_view)(product_id)
+
+    related_data = await _serialize_products(related, request, user)
+    comment_data = await sync_to_async(lambda: ProductCommentSerializer(comments, many=True).data)()
+    return _json({
+        **product_data,
+        'views': views,
+        'user_liked': user_liked,
+        'seller_profile': seller_data,
+        'comment_thread': comment_data,
+        'related_products': related_data,
+    })
+
+
+@require_GET
+async def product_like_state(request, product_id):
+    user = await _authenticate(request)
+    if user is None:
+        return _json({'detail': 'Invalid token'}, status=401)
+
+    likes = ProductLike.objects.filter(product_id=product_id)
+    liked = user.is_authenticated and await likes.filter(user_id=user.pk).aexists()
+    likes_count = await likes.acount()
+    return _json({'liked': liked, 'likes_count': likes_count})
+
+
+@require_GET
+async def product_comments(request, product_id):
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    start = (page - 1) * PAGE_SIZE
+    top_level = ProductComment.objects.filter(product_id=product_id, parent__isnull=True)
+    queryset = top_level.select_related('user').prefetch_related('replies__user').order_by('-created_at')
+    comments = [comment async for comment in queryset[start:start + PAGE_SIZE]]
+    total = await top_level.acount()
+    data = await sync_to_async(lambda: ProductCommentSerializer(comments, many=True).data)()
+    return _json({'count': total, 'page': page, 'results': data})
@@ -0,0 +1,131 @@
+"""Email + password authentication.
+
+EmailBackend finds the user with a single lookup on NULLIF(LOWER(email), ''),
+which the unique index from migration 0031 serves, instead of a scan followed by a
+second lookup by username. Failed attempts are counted per address and
+client (the IP DRF throttles by, see its NUM_PROXIES setting) in a sliding
+window. Once a pair is over settings.LOGIN_FAILURE_LIMIT its attempts are
+refused before any password hashing. Failures from one client don't lock
+the owner out from another. The counter lives in process memory, so each
+worker enforces the limit separately.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.db.models import CharField, Func
+from django.db.models.functions import Lower
+from rest_framework.throttling import BaseThrottle
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def email_key():
+    """NULLIF(LOWER(email), ''), the expression migration 0031 indexes uniquely.
+
+    The '' is part of the SQL rather than a parameter: SQLite only uses an
+    expression index for a textually identical expression.
+    """
+    return Func(Lower('email'), template="NULLIF(%(expressions)s, '')", output_field=CharField())
+
+
+def users_with_email(email):
+    """Users whose address matches case-insensitively, through the email index.
+
+    Empty emails are NULL in the index, so they never match.
+    """
+    return User.objects.alias(email_key=email_key()).filter(email_key=normalize_email(email))
+
+
+class SlidingWindowCounter:
+    """Counts events per key over the last `window` seconds, keeping at most `max_keys` keys."""
+
+    def __init__(self, limit, window, max_keys=10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._events = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def hit(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            events = self._recent(key, now)
+            if events is None:
+                events = self._events[key] = deque()
+            events.append(now)
+            self._events.move_to_end(key)
+            while len(self._events) > self.max_keys:
+                self._events.popitem(last=False)
+
+    def retry_after(self, key, now=None):
+        """Seconds until the key is back under the limit; 0 if it is now."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            events = self._recent(key, now)
+            if events is None or len(events) < self.limit:
+                return 0
+            return events[-self.limit] + self.window - now
+
+    def reset(self, key=None):
+        with self._lock:
+            if key is None:
+                self._events.clear()
+            else:
+                self._events.pop(key, None)
+
+
+LOGIN_FAILURES = SlidingWindowCounter(
+    limit=getattr(settings, 'LOGIN_FAILURE_LIMIT', 5),
+    window=getattr(settings, 'LOGIN_FAILURE_WINDOW', 15 * 60),
+)
+
+
+class LoginThrottled(Exception):
+    def __init__(self, wait):
+        super().__init__(f'Too many failed login attempts; try again in {wait:.0f} seconds')
+        self.wait = wait
+
+
+def failure_key(request, email):
+    """(normalized email, client ident); the ident is None without a request."""
+    return normalize_email(email), BaseThrottle().get_ident(request) if request is not None else None
+
+
+class EmailBackend(ModelBackend):
+    """Authenticates authenticate(email=..., password=...) calls; see the module docstring."""
+
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if not email or password is None:
+            return None
+        key = failure_key(request, email)
+        wait = LOGIN_FAILURES.retry_after(key)
+        if wait:
+            raise LoginThrottled(wait)
+
+        # The profile comes along for the role claim of the tokens login issues
+        user = users_with_email(email).select_related('profile').first()
+        if user is None:
+            # Hash anyway so unknown addresses take as long as wrong passwords
+            User().set_password(password)
+        elif user.check_password(password) and self.user_can_authenticate(user):
+            LOGIN_FAILURES.reset(key)
+            return user
+        LOGIN_FAILURES.hit(key)
+        return None
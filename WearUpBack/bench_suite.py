@@ -0,0 +1,435 @@
+"""Synthetic dataset and per-endpoint load scenarios for `manage.py bench`.
+
+seed() bulk-creates a dataset owned by users named bench-*, sized by one of
+SCALES. run_suite() then drives every named route in Backend/urls.py through
+SCENARIOS at each concurrency level. Requests go in-process through the Django
+test client, or over HTTP to a running server. The report gives latency
+percentiles, throughput and queries per request; the query count is read from
+the Server-Timing header that WearUpBack.instrumentation adds.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import URLPattern, get_resolver
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .analytics import rollup_days
+from .benchmarking import run_requests, server_timing_queries
+from .inventory import refresh_low_stock
+from .models import (
+    Cart, CartItem, Category, Coupon, Order, OrderItem, Product, ProductComment, ProductImage, ProductLike,
+    ProductShare, ProductVariant, Size, StockMovement, UserProfile,
+)
+from .stock_ledger import record_movements
+from .token_auth import ClaimsAccessToken
+
+PREFIX = 'bench-'
+PASSWORD = 'bench-pass-123'
+COUPON_CODE = 'BENCH10'
+BATCH_SIZE = 5000
+SIZE_NAMES = ('XS', 'S', 'M', 'L', 'XL')
+ORDER_DAYS = 30
+
+SCALES = {
+    'smoke': {
+        'users': 50, 'sellers': 5, 'products': 500, 'variants': 2, 'likes': 5_000,
+        'comments': 2_500, 'shares': 500, 'carts': 20, 'orders': 250,
+    },
+    'default': {
+        'users': 5_000, 'sellers': 100, 'products': 10_000, 'variants': 3, 'likes': 100_000,
+        'comments': 50_000, 'shares': 10_000, 'carts': 1_000, 'orders': 5_000,
+    },
+    'large': {
+        'users': 50_000, 'sellers': 1_000, 'products': 100_000, 'variants': 3, 'likes': 1_000_000,
+        'comments': 500_000, 'shares': 100_000, 'carts': 10_000, 'orders': 50_000,
+    },
+}
+
+
+def _catalog_csv(ids):
+    rows = [f"Bench import {ids['run']}-{ids['n']}-{i},Unisex,19.99,5,BENCH-IMP-{ids['run']}-{ids['n']}-{i}" for i in range(10)]
+    content = 'product_name,gender,base_price,stock_quantity,sku\n' + '\n'.join(rows)
+    return {'file': SimpleUploadedFile('catalog.csv', content.encode(), content_type='text/csv')}
+
+
+# route name: (method, path, caller, body). Routes that change data run as
+# 'writer' (bench-seller-1) or 'shopper' (bench-buyer-1), so the data read as
+# 'seller' and 'buyer' stays the same within and across runs. Paths are formatted with the
+# fixture ids; bodies are built from them per request. ids['n'] is unique to
+# each request, ids['any_product'] cycles through the writer's products and
+# ids['refresh'] is a fresh refresh token for the buyer. A body holding files
+# is sent as multipart, anything else as JSON.
+SCENARIOS = {
+    'api-root': ('get', '/api/', None, None),
+    # Unfiltered, the list returns the whole catalogue in one response
+    'product-list': ('get', '/api/products/?seller={seller_id}', None, None),
+    'product-detail': ('get', '/api/products/{product}/', 'seller', None),
+    'productlike-list': ('get', '/api/product-likes/', 'buyer', None),
+    'productlike-detail': ('get', '/api/product-likes/{like}/', 'buyer', None),
+    'productcomment-list': ('get', '/api/product-comments/?product={product}', None, None),
+    'productcomment-detail': ('get', '/api/product-comments/{comment}/', 'buyer', None),
+    'productshare-list': ('get', '/api/product-shares/', 'buyer', None),
+    'productshare-detail': ('get', '/api/product-shares/{share}/', 'buyer', None),
+    'cart-list': ('get', '/api/carts/', 'buyer', None),
+    'cart-detail': ('get', '/api/carts/{cart}/', 'buyer', None),
+    'cartitem-list': ('get', '/api/cart-items/', 'buyer', None),
+    'cartitem-detail': ('get', '/api/cart-items/{cart_item}/', 'buyer', None),
+    'order-list': ('get', '/api/orders/', 'buyer', None),
+    'order-detail': ('get', '/api/orders/{order}/', 'buyer', None),
+    'orderitem-list': ('get', '/api/order-items/', 'buyer', None),
+    'orderitem-detail': ('get', '/api/order-items/{order_item}/', 'buyer', None),
+    'register': ('post', '/api/auth/register/', None, lambda ids: {
+        'username': f"{PREFIX}new-{ids['run']}-{ids['n']}", 'email': f"{PREFIX}new-{ids['run']}-{ids['n']}@example.com",
+        'password': PASSWORD,
+    }),
+    'login': ('post', '/api/auth/login/', None, lambda ids: {'email': ids['buyer_email'], 'password': PASSWORD}),
+    'logout': ('post', '/api/auth/logout/', 'buyer', lambda ids: {'refresh_token': ids['refresh']}),
+    'profile': ('get', '/api/auth/profile/', 'buyer', None),
+    'token_refresh': ('post', '/api/auth/token/refresh/', None, lambda ids: {'refresh': ids['refresh']}),
+    'public_user_profile': ('get', '/api/users/{seller_id}/', None, None),
+    'storefront': ('get', '/api/users/{seller_id}/storefront/', None, None),
+    'toggle_product_like': ('post', '/api/products/{any_product}/toggle-like/', 'shopper', lambda ids: {}),
+    'share_product': ('post', '/api/products/{any_product}/share/', 'shopper', lambda ids: {'platform': 'copy_link'}),
+    'validate_coupon': ('post', '/api/coupons/validate/', None, lambda ids: {'code': COUPON_CODE, 'subtotal': '100'}),
+    'redeem_coupon': ('post', '/api/coupons/redeem/', 'shopper', lambda ids: {'code': COUPON_CODE, 'subtotal': '100'}),
+    'bulk_reprice': ('post', '/api/pricing/bulk-reprice/', 'writer', lambda ids: {'discount_percentage': str(ids['n'] % 30)}),
+    'import_catalog': ('post', '/api/catalog/import/', 'writer', _catalog_csv),
+    'export_products': ('get', '/api/seller/export/products/', 'seller', None),
+    'export_orders': ('get', '/api/seller/export/orders/', 'seller', None),
+    'seller_analytics': ('get', '/api/seller/analytics/?days=30', 'seller', None),
+    'seller_top_products': ('get', '/api/seller/analytics/top-products/', 'seller', None),
+    'seller_low_stock': ('get', '/api/seller/low-stock/', 'seller', None),
+    'bulk_update_stock': ('post', '/api/inventory/bulk-update/', 'writer', lambda ids: {
+        'items': [{'sku': sku, 'quantity': 5 + ids['n'] % 20} for sku in ids['writer_skus']],
+    }),
+    'async_product_list': ('get', '/api/async/products/?seller={seller_id}', None, None),
+    'async_product_detail': ('get', '/api/async/products/{product}/', None, None),
+    'async_product_like_state': ('get', '/api/async/products/{product}/like-state/', 'buyer', None),
+    'async_product_comments': ('get', '/api/async/products/{product}/comments/', None, None),
+    'metrics': ('get', '/metrics', 'metrics', None),
+}
+
+
+def route_names(patterns=None):
+    """Names of the routes in the root URLconf, leaving out namespaced apps such as the admin."""
+    names = set()
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        if isinstance(pattern, URLPattern):
+            if pattern.name:
+                names.add(pattern.name)
+        elif not pattern.namespace:
+            names |= route_names(pattern.url_patterns)
+    return names
+
+
+def bench_data_exists():
+    return User.objects.filter(username=f'{PREFIX}seller-0').exists()
+
+
+def _create(model, objs, key):
+    """bulk_create in batches and make sure every object has its pk, looked up by `key` where the backend can't return it."""
+    for start in range(0, len(objs), BATCH_SIZE):
+        batch = model.objects.bulk_create(objs[start:start + BATCH_SIZE])
+        if not connection.features.can_return_rows_from_bulk_insert:
+            ids = dict(model.objects.filter(**{f'{key}__in': [getattr(obj, key) for obj in batch]}).values_list(key, 'pk'))
+            for obj in batch:
+                obj.pk = ids[getattr(obj, key)]
+    return objs
+
+
+def _insert(model, objs):
+    for start in range(0, len(objs), BATCH_SIZE):
+        model.objects.bulk_create(objs[start:start + BATCH_SIZE])
+
+
+def _pairs(rng, count, rows, columns, first=(0, 0)):
+    """`count` distinct (row, column) index pairs, always including `first`."""
+    count = min(count, rows * columns)
+    picked = rng.sample(range(rows * columns), count)
+    pairs = [divmod(index, columns) for index in picked]
+    if count and first not in pairs:
+        pairs[0] = first
+    return pairs
+
+
+def seed(scale, rng=None, log=print):
+    """Create the bench dataset in one transaction; returns the row counts."""
+    rng = rng or random.Random(0)
+    now = timezone.now()
+    # Scenarios need two of each: one to measure reads on, one to write as
+    sellers_count = max(2, min(scale['sellers'], scale['users'] - 2))
+    buyers_count = scale['users'] - sellers_count
+
+    with transaction.atomic():
+        log(f"Users: {scale['users']}")
+        password = make_password(PASSWORD)
+        users = [
+            User(username=f'{PREFIX}{role}-{i}', email=f'{PREFIX}{role}-{i}@example.com', password=password)
+            for role, count in (('seller', sellers_count), ('buyer', buyers_count))
+            for i in range(count)
+        ]
+        _create(User, users, 'username')
+        sellers, buyers = users[:sellers_count], users[sellers_count:]
+        _insert(UserProfile, [
+            UserProfile(user_id=user.pk, role='seller', business_name=f'Bench shop {i}') for i, user in enumerate(sellers)
+        ] + [UserProfile(user_id=user.pk) for user in buyers])
+
+        sizes = [Size.objects.get_or_create(name=name)[0] for name in SIZE_NAMES]
+        categories = [Category.objects.get_or_create(name=f'Bench category {i}')[0] for i in range(20)]
+        Coupon.objects.get_or_create(code=COUPON_CODE, defaults={
+            'discount_type': 'percentage', 'discount_value': Decimal('10'),
+            'valid_from': now - timedelta(days=1), 'valid_to': now + timedelta(days=365),
+        })
+
+        log(f"Products: {scale['products']} with {scale['variants']} variant(s) each")
+        genders = [choice for choice, _ in Product.GENDER_CHOICES]
+        products = []
+        for i in range(scale['products']):
+            price = Decimal(rng.randint(500, 20000)) / 100
+            products.append(Product(
+                seller_id=sellers[i % sellers_count].pk, product_name=f'Bench product {i}', slug=f'{PREFIX}product-{i}',
+                gender=rng.choice(genders), base_price=price, final_price=price, stock_quantity=rng.randint(0, 200),
+                sku=f'BENCH-{i}', barcode=f'2{i:012d}', created_at=now - timedelta(minutes=i),
+            ))
+        _create(Product, products, 'slug')
+
+        variants = []
+        size_rows = []
+        category_rows = []
+        images = []
+        for i, product in enumerate(products):
+            for size in rng.sample(sizes, min(scale['variants'], len(sizes))):
+                variants.append(ProductVariant(
+                    product_id=product.pk, size_id=size.pk, sku=f'BENCH-{i}-{size.name}',
+                    stock_quantity=rng.randint(0, 50), final_price=product.final_price,
+                ))
+                size_rows.append(Product.sizes.through(product_id=product.pk, size_id=size.pk))
+            for category in rng.sample(categories, 2):
+                category_rows.append(Product.categories.through(product_id=product.pk, category_id=category.pk))
+            images.append(ProductImage(product_id=product.pk, image=f'products/bench/{i}.jpg', is_main=True))
+        _create(ProductVariant, variants, 'sku')
+        _insert(Product.sizes.through, size_rows)
+        _insert(Product.categories.through, category_rows)
+        _insert(ProductImage, images)
+
+        log('Opening stock')
+        movements = [
+            StockMovement(product_id=product.pk, kind='adjustment', quantity=product.stock_quantity, note='Opening stock')
+            for product in products if product.stock_quantity
+        ] + [
+            StockMovement(product_id=variant.product_id, variant_id=variant.pk, kind='adjustment',
+                          quantity=variant.stock_quantity, note='Opening stock')
+            for variant in variants if variant.stock_quantity
+        ]
+        for start in range(0, len(movements), BATCH_SIZE):
+            record_movements(movements[start:start + BATCH_SIZE])
+        for start in range(0, len(products), BATCH_SIZE):
+            refresh_low_stock([product.pk for product in products[start:start + BATCH_SIZE]])
+
+        log(f"Likes: {scale['likes']}, comments: {scale['comments']}, shares: {scale['shares']}")
+        _insert(ProductLike, [
+            ProductLike(user_id=buyers[row].pk, product_id=products[column].pk)
+            for row, column in _pairs(rng, scale['likes'], buyers_count, len(products))
+        ])
+        replies = scale['comments'] // 10
+        _insert(ProductComment, [
+            ProductComment(user_id=buyers[0 if i == 0 else rng.randrange(buyers_count)].pk,
+                           product_id=products[0 if i == 0 else rng.randrange(len(products))].pk, content=f'Bench comment {i}')
+            for i in range(scale['comments'] - replies)
+        ])
+        parents = list(
+            ProductComment.objects.filter(product__slug__startswith=PREFIX, parent=None)
+            .order_by('pk').values_list('pk', 'product_id')[:replies]
+        )
+        _insert(ProductComment, [
+            ProductComment(user_id=rng.choice(sellers).pk, product_id=product_id, parent_id=pk, content='Thanks!')
+            for pk, product_id in parents
+        ])
+        _insert(ProductShare, [
+            ProductShare(user_id=buyers[0 if i == 0 else rng.randrange(buyers_count)].pk,
+                         product_id=products[rng.randrange(len(products))].pk,
+                         platform=rng.choice(['copy_link', 'whatsapp', 'facebook']))
+            for i in range(scale['shares'])
+        ])
+
+        log(f"Carts: {scale['carts']}, orders: {scale['orders']}")
+        carts = _create(Cart, [Cart(user_id=user.pk) for user in buyers[:scale['carts']]], 'user_id')
+        _insert(CartItem, [
+            CartItem(cart_id=cart.pk, product_id=product.pk, quantity=rng.randint(1, 3))
+            for cart in carts
+            for product in rng.sample(products, min(3, len(products)))
+        ])
+
+        orders = []
+        lines = []
+        for i in range(scale['orders']):
+            items = [(product, rng.randint(1, 3)) for product in rng.sample(products, min(rng.randint(1, 3), len(products)))]
+            subtotal = sum(product.final_price * quantity for product, quantity in items)
+            orders.append(Order(
+                user_id=buyers[i % buyers_count].pk, order_number=f'BENCH-{i}',
+                status=rng.choice(['pending', 'confirmed', 'shipped', 'delivered']),
+                subtotal=subtotal, total_amount=subtotal,
+            ))
+            lines.append(items)
+        _create(Order, orders, 'order_number')
+        _insert(OrderItem, [
+            OrderItem(order_id=order.pk, product_id=product.pk, quantity=quantity,
+                      unit_price=product.final_price, total_price=product.final_price * quantity)
+            for order, items in zip(orders, lines)
+            for product, quantity in items
+        ])
+        # created_at is auto_now_add; spread the orders over the analytics window afterwards
+        pks = sorted(order.pk for order in orders)
+        for day in range(ORDER_DAYS):
+            chunk = pks[day * len(pks) // ORDER_DAYS:(day + 1) * len(pks) // ORDER_DAYS]
+            if chunk:
+                Order.objects.filter(pk__gte=chunk[0], pk__lte=chunk[-1], order_number__startswith='BENCH-').update(
+                    created_at=now - timedelta(days=day)
+                )
+
+    log('Analytics rollup')
+    today = timezone.localdate()
+    rollup_days(today - timedelta(days=ORDER_DAYS), today)
+    return {
+        'users': len(users), 'products': len(products), 'variants': len(variants),
+        'likes': ProductLike.objects.filter(user__username__startswith=PREFIX).count(),
+        'comments': scale['comments'] - replies + len(parents), 'shares': scale['shares'],
+        'carts': len(carts), 'orders': len(orders),
+    }
+
+
+def fixtures():
+    """The rows the scenarios address: reads hit bench-seller-0 and bench-buyer-0, writes their -1 twins."""
+    seller = User.objects.get(username=f'{PREFIX}seller-0')
+    buyer = User.objects.get(username=f'{PREFIX}buyer-0')
+    writer = User.objects.get(username=f'{PREFIX}seller-1')
+    product = Product.objects.filter(seller=seller).order_by('pk').first()
+    order = Order.objects.filter(user=buyer).order_by('pk').first()
+    cart = Cart.objects.get(user=buyer)
+    return {
+        'seller': seller,
+        'buyer': buyer,
+        'writer': writer,
+        'shopper': User.objects.get(username=f'{PREFIX}buyer-1'),
+        'seller_id': seller.pk,
+        'buyer_email': buyer.email,
+        'product': product.pk,
+        'like': ProductLike.objects.filter(user=buyer).values_list('pk', flat=True).first(),
+        'comment': ProductComment.objects.filter(user=buyer).values_list('pk', flat=True).first(),
+        'share': ProductShare.objects.filter(user=buyer).values_list('pk', flat=True).first(),
+        'cart': cart.pk,
+        'cart_item': cart.items.values_list('pk', flat=True).first(),
+        'order': order.pk,
+        'order_item': order.items.values_list('pk', flat=True).first(),
+        'products': list(Product.objects.filter(seller=writer).order_by('pk').values_list('pk', flat=True)[:1000]),
+        'writer_skus': list(Product.objects.filter(seller=writer).order_by('pk').values_list('sku', flat=True)[:100]),
+        'run': int(time.time()),
+    }
+
+
+class Scenario:
+    """Sends one route's requests, in-process (base_url None) or over HTTP."""
+
+    def __init__(self, name, ids, base_url=None, metrics_token='', timeout=60):
+        self.name = name
+        self.method, self.path, self.caller, self.body = SCENARIOS[name]
+        self.ids = ids
+        self.base_url = base_url
+        self.metrics_token = metrics_token
+        self.timeout = timeout
+        self._numbers = itertools.count()
+        self._local = threading.local()
+
+    def _prepare(self):
+        n = next(self._numbers)
+        ids = {**self.ids, 'n': n, 'any_product': self.ids['products'][n % len(self.ids['products'])]}
+        if self.body is not None and self.name in ('logout', 'token_refresh'):
+            ids['refresh'] = str(RefreshToken.for_user(self.ids['buyer']))
+        headers = {}
+        if self.caller == 'metrics':
+            if self.metrics_token:
+                headers['Authorization'] = f'Bearer {self.metrics_token}'
+        elif self.caller:
+            headers['Authorization'] = f'Bearer {ClaimsAccessToken.for_user(self.ids[self.caller])}'
+        body = self.body(ids) if self.body is not None else None
+        return self.path.format(**ids), body, headers
+
+    def send(self, worker, i):
+        path, body, headers = self._prepare()
+        if self.base_url:
+            return self._send_http(path, body, headers)
+        return self._send_client(path, body, headers)
+
+    def _send_client(self, path, body, headers):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            # Server errors count as failed requests rather than stopping the worker
+            client = self._local.client = Client(raise_request_exception=False, HTTP_HOST='localhost')
+        extra = {f"HTTP_{name.upper().replace('-', '_')}": value for name, value in headers.items()}
+        if body is None:
+            args = ()
+        elif any(hasattr(value, 'read') for value in body.values()):
+            args = (body,)
+        else:
+            args = (json.dumps(body),)
+            extra['content_type'] = 'application/json'
+        started = time.perf_counter()
+        response = getattr(client, self.method)(path, *args, **extra)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        seconds = time.perf_counter() - started
+        return seconds, response.status_code < 400, server_timing_queries(response.headers.get('Server-Timing'))
+
+    def _send_http(self, path, body, headers):
+        data = None
+        if body is not None:
+            if any(hasattr(value, 'read') for value in body.values()):
+                data = encode_multipart(BOUNDARY, body)
+                headers['Content-Type'] = MULTIPART_CONTENT
+            else:
+                data = json.dumps(body).encode()
+                headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.base_url.rstrip('/') + path, data=data, headers=headers, method=self.method.upper())
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                ok = True
+        except urllib.error.HTTPError as e:
+            response = e
+            ok = False
+        except (urllib.error.URLError, OSError):
+            return time.perf_counter() - started, False, None
+        return time.perf_counter() - started, ok, server_timing_queries(response.headers.get('Server-Timing'))
+
+
+def run_suite(levels, requests_per_worker, names=None, base_url=None, metrics_token='', log=print):
+    """{concurrency: {route name: summary}} for the given routes (default: all of SCENARIOS)."""
+    ids = fixtures()
+    scenarios = {name: Scenario(name, ids, base_url, metrics_token) for name in names or SCENARIOS}
+    # One untimed pass so first-request costs (imports, caches) stay out of the numbers
+    for scenario in scenarios.values():
+        scenario.send(0, 0)
+    results = {}
+    for level in levels:
+        results[str(level)] = {}
+        for name, scenario in scenarios.items():
+            log(f'{name} at concurrency {level}')
+            results[str(level)][name] = run_requests(
+                scenario.send, level, requests_per_worker, on_exit=None if base_url else connections.close_all,
+            )
+    return results
@@ -0,0 +1,151 @@
+import json
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed, queries=None):
+    """Latency percentiles (ms) and throughput for one load run, plus queries per request when known."""
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None
+    result = {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(statistics.fmean(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+    }
+    if queries:
+        result['queries_per_request'] = round(statistics.fmean(queries), 1)
+        result['max_queries'] = max(queries)
+    return result
+
+
+def server_timing_queries(header):
+    """The query count WearUpBack.instrumentation puts in Server-Timing, or None."""
+    match = re.search(r'desc="(\d+) queries"', header or '')
+    return int(match.group(1)) if match else None
+
+
+def run_requests(send, concurrency=16, requests_per_worker=50, on_exit=None):
+    """Call send(worker, i) `requests_per_worker` times from each of `concurrency` threads.
+
+    send returns (seconds, ok, queries), timing only the request itself so
+    per-request setup isn't counted; queries may be None. on_exit runs at the
+    end of each thread, e.g. to close its database connections. A single
+    worker runs in the calling thread.
+    """
+    latencies = []
+    queries = []
+    errors = 0
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(concurrency)
+
+    def worker(offset, threaded=True):
+        nonlocal errors
+        local_latencies = []
+        local_queries = []
+        local_errors = 0
+        start_barrier.wait()
+        try:
+            for i in range(requests_per_worker):
+                seconds, ok, count = send(offset, i)
+                if ok:
+                    local_latencies.append(seconds)
+                else:
+                    local_errors += 1
+                if count is not None:
+                    local_queries.append(count)
+        finally:
+            if threaded and on_exit is not None:
+                on_exit()
+        with lock:
+            latencies.extend(local_latencies)
+            queries.extend(local_queries)
+            errors += local_errors
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        worker(0, threaded=False)
+    else:
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return summarize(latencies, errors, time.perf_counter() - started, queries)
+
+
+def run_load(urls, concurrency=16, requests_per_worker=50, headers=None, timeout=30):
+    """Hit `urls` round-robin from `concurrency` threads and summarize the latencies.
+
+    Each worker keeps exactly one request in flight, so both servers see the same
+    offered concurrency. Non-2xx responses and connection errors count as errors.
+    """
+    def send(offset, i):
+        request = urllib.request.Request(urls[(offset + i) % len(urls)], headers=headers or {})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+            return time.perf_counter() - started, True, server_timing_queries(response.headers.get('Server-Timing'))
+        except (urllib.error.URLError, OSError):
+            return time.perf_counter() - started, False, None
+
+    return run_requests(send, concurrency, requests_per_worker)
+
+
+def wait_until_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                response.read()
+            return True
+        except urllib.error.HTTPError:
+            return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    return False
+
+
+def dumps(result):
+    return json.dumps(result, indent=2, sort_keys=True)
+
+
+def compare(results, baseline, tolerance=0.2, min_ms=2):
+    """Regressions of `results` against `baseline`, both {level: {endpoint: summary}}.
+
+    A regression is a p95 more than `tolerance` (and at least `min_ms`) slower,
+    more queries per request, or more errors. Endpoints missing from either side
+    are skipped.
+    """
+    regressions = []
+    for level, endpoints in results.items():
+        for name, current in endpoints.items():
+            before = baseline.get(level, {}).get(name)
+            if not before:
+                continue
+            checks = [
+                ('p95_ms', lambda old, new: new > old * (1 + tolerance) and new - old >= min_ms),
+                ('queries_per_request', lambda old, new: new > old),
+                ('errors', lambda old, new: new > old),
+            ]
+            for metric, worse in checks:
+                old, new = before.get(metric), current.get(metric)
+                if old is not None and new is not None and worse(old, new):
+                    regressions.append({'concurrency': level, 'endpoint': name, 'metric': metric, 'baseline': old, 'current': new})
+    return regressions
@@ -0,0 +1,255 @@
+import csv
+import io
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, connection, transaction
+
+from .inventory import refresh_low_stock
+from .models import Product, ProductImage, StockMovement
+from .reference_data import CATEGORIES, SIZES
+from .slugs import SlugAllocator, slug_base
+from .stock_ledger import record_movements
+from .storefront import STOREFRONT_STATS
+
+GENDERS = {choice for choice, _ in Product.GENDER_CHOICES}
+STATUSES = {choice for choice, _ in Product.STATUS_CHOICES}
+# CSV cells holding several values use this separator, e.g. "S|M|L"
+LIST_SEPARATOR = '|'
+
+
+class RowError(Exception):
+    pass
+
+
+def _readable(numbered):
+    """Pass (number, item) pairs through, ending with a RowError where the file can no longer be read."""
+    number = 0
+    try:
+        for number, item in numbered:
+            yield number, item
+    except (UnicodeDecodeError, csv.Error) as e:
+        yield number + 1, RowError(f'Unreadable file: {e}')
+
+
+def iter_rows(fileobj, fmt):
+    """Yield (row_number, dict) from a CSV or JSONL file without reading it all into memory.
+
+    Rows that can't be parsed come through as a RowError instead of a dict.
+    """
+    if isinstance(fileobj, (io.TextIOBase, io.StringIO)):
+        text = fileobj
+    else:
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        yield from _readable(enumerate(csv.DictReader(text), start=2))
+    elif fmt == 'jsonl':
+        for number, line in _readable(enumerate(text, start=1)):
+            if isinstance(line, RowError):
+                yield number, line
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield number, RowError(f'Invalid JSON: {e}')
+                continue
+            yield number, row if isinstance(row, dict) else RowError('Expected a JSON object')
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def _as_list(value):
+    if value in (None, ''):
+        return []
+    if isinstance(value, list):
+        items = value
+    else:
+        items = str(value).split(LIST_SEPARATOR)
+    return [str(item).strip() for item in items if str(item).strip()]
+
+
+def _as_decimal(row, field, default=None):
+    value = row.get(field)
+    if value in (None, ''):
+        if default is None:
+            raise RowError(f'{field} is required')
+        return default
+    try:
+        value = Decimal(str(value))
+    except InvalidOperation:
+        raise RowError(f'{field} must be a number')
+    if value < 0:
+        raise RowError(f'{field} must not be negative')
+    return value
+
+
+def _as_int(row, field, default=0):
+    value = row.get(field)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{field} must be a whole number')
+    if value < 0:
+        raise RowError(f'{field} must not be negative')
+    return value
+
+
+def parse_row(row):
+    """Validate one catalog row and return (product_fields, sizes, categories, images)."""
+    name = str(row.get('product_name') or row.get('name') or '').strip()
+    if not name:
+        raise RowError('product_name is required')
+    if len(name) > 200:
+        raise RowError('product_name is longer than 200 characters')
+
+    gender = str(row.get('gender') or '').strip()
+    if gender not in GENDERS:
+        raise RowError(f'gender must be one of {", ".join(sorted(GENDERS))}')
+
+    item_status = str(row.get('status') or 'active').strip()
+    if item_status not in STATUSES:
+        raise RowError(f'status must be one of {", ".join(sorted(STATUSES))}')
+
+    base_price = _as_decimal(row, 'base_price')
+    discount = _as_decimal(row, 'discount_percentage', Decimal('0'))
+    if discount > 100:
+        raise RowError('discount_percentage must be at most 100')
+
+    fields = {
+        'product_name': name,
+        'description': str(row.get('description') or ''),
+        'gender': gender,
+        'status': item_status,
+        'tags': str(row.get('tags') or '')[:255],
+        'sku': str(row.get('sku') or '')[:100],
+        'barcode': str(row.get('barcode') or '')[:100],
+        'base_price': base_price,
+        'discount_percentage': discount,
+        'final_price': base_price * (Decimal('1') - discount / Decimal('100')),
+        'stock_quantity': _as_int(row, 'stock_quantity'),
+    }
+    sizes = [name[:10].strip() for name in _as_list(row.get('sizes'))]
+    categories = [name[:100].strip() for name in _as_list(row.get('categories'))]
+    return fields, sizes, categories, _as_list(row.get('images'))
+
+
+class CatalogImporter:
+    """Bulk-inserts catalog rows for one seller in chunks.
+
+    Sizes and categories are resolved through the cached name -> id maps, and
+    products, their M2M through-rows and ProductImage rows are written with one
+    bulk_create each per chunk. Invalid rows are skipped and reported.
+    """
+
+    def __init__(self, seller, chunk_size=500):
+        self.seller = seller
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.errors = []
+        # Names seen by this import; resolved through the shared reference-data cache
+        self._size_ids = {}
+        self._category_ids = {}
+
+    def run(self, rows):
+        started = time.perf_counter()
+        chunk = []
+        processed = 0
+        for number, row in rows:
+            processed += 1
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                chunk.append((number, parse_row(row)))
+            except RowError as e:
+                self.errors.append({'row': number, 'error': str(e)})
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = []
+        if chunk:
+            self._flush(chunk)
+        if self.created:
+            # bulk_create skips post_save
+            STOREFRONT_STATS.invalidate(self.seller.pk)
+
+        elapsed = time.perf_counter() - started
+        return {
+            'rows': processed,
+            'created': self.created,
+            'errors': self.errors,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(processed / elapsed, 1) if elapsed else None,
+        }
+
+    def _flush(self, chunk, retries=3):
+        self._size_ids.update(SIZES.ids_for({name for _, (_, sizes, _, _) in chunk for name in sizes}))
+        self._category_ids.update(CATEGORIES.ids_for({name for _, (_, _, categories, _) in chunk for name in categories}))
+        resolved = []
+        for number, row in chunk:
+            _, sizes, categories, _ = row
+            unknown = [name for name in sizes if name not in self._size_ids]
+            unknown += [name for name in categories if name not in self._category_ids]
+            if unknown:
+                self.errors.append({'row': number, 'error': f'Could not resolve {", ".join(unknown)}'})
+            else:
+                resolved.append((number, row))
+        chunk = resolved
+        if not chunk:
+            return
+
+        for attempt in range(retries):
+            try:
+                with transaction.atomic():
+                    self._insert(chunk)
+                break
+            except IntegrityError as e:
+                # Most likely a slug taken by a concurrent writer; re-allocate
+                if attempt == retries - 1:
+                    for number, _ in chunk:
+                        self.errors.append({'row': number, 'error': f'Database error: {e}'})
+                    return
+        self.created += len(chunk)
+
+    def _insert(self, chunk):
+        allocator = SlugAllocator()
+        allocator.prefetch({slug_base(fields['product_name']) for _, (fields, _, _, _) in chunk})
+        products = [
+            Product(seller=self.seller, slug=allocator.allocate(fields['product_name']), **fields)
+            for _, (fields, _, _, _) in chunk
+        ]
+        products = Product.objects.bulk_create(products)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            ids = dict(Product.objects.filter(slug__in=[p.slug for p in products]).values_list('slug', 'id'))
+            for product in products:
+                product.pk = ids[product.slug]
+
+        size_rows = []
+        category_rows = []
+        image_rows = []
+        for product, (_, (_, sizes, categories, images)) in zip(products, chunk):
+            for size_id in {self._size_ids[name] for name in sizes}:
+                size_rows.append(Product.sizes.through(product_id=product.pk, size_id=size_id))
+            for category_id in {self._category_ids[name] for name in categories}:
+                category_rows.append(Product.categories.through(product_id=product.pk, category_id=category_id))
+            for order, path in enumerate(images):
+                image_rows.append(ProductImage(product_id=product.pk, image=path, is_main=order == 0, order=order))
+
+        Product.sizes.through.objects.bulk_create(size_rows, batch_size=1000)
+        Product.categories.through.objects.bulk_create(category_rows, batch_size=1000)
+        ProductImage.objects.bulk_create(image_rows, batch_size=1000)
+        record_movements([
+            StockMovement(product_id=product.pk, kind='adjustment', quantity=product.stock_quantity, note='Opening stock')
+            for product in products
+            if product.stock_quantity
+        ])
+        refresh_low_stock([product.pk for product in products])
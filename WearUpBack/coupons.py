@@ -0,0 +1,128 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Coupon
+
+
+class CouponError(Exception):
+    pass
+
+
+# Active coupons keyed by upper-cased code, loaded lazily per process. A save
+# or delete (admin edits included) bumps a version in the shared cache, which
+# every process compares before using its copy; the TTL bounds staleness if
+# that key is lost. The cached instances are read-only: used_count in them is
+# a snapshot, and the conditional UPDATE in redeem_coupon() is the real count.
+VERSION_KEY = 'coupons:version'
+TTL = 300
+
+_active_coupons = None
+_loaded_version = None
+_loaded_at = 0
+_lock = threading.Lock()
+
+
+def _shared_version():
+    return cache.get_or_set(VERSION_KEY, time.time_ns(), None)
+
+
+def _load_active_coupons():
+    global _active_coupons, _loaded_version, _loaded_at
+    version = _shared_version()
+    with _lock:
+        if _active_coupons is None or _loaded_version != version or time.monotonic() - _loaded_at > TTL:
+            _active_coupons = {
+                coupon.code.upper(): coupon
+                for coupon in Coupon.objects.filter(is_active=True)
+            }
+            _loaded_version, _loaded_at = version, time.monotonic()
+        return _active_coupons
+
+
+def invalidate_coupon_cache():
+    """Drop every process's coupons, now and again once the transaction commits.
+
+    The second bump drops a copy another process loaded from pre-commit rows.
+    """
+    def bump():
+        global _active_coupons
+        cache.set(VERSION_KEY, time.time_ns(), None)
+        with _lock:
+            _active_coupons = None
+
+    bump()
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def _coupon_changed(sender, **kwargs):
+    invalidate_coupon_cache()
+
+
+def get_active_coupon(code):
+    if not code:
+        raise CouponError('Coupon code is required.')
+    if not isinstance(code, str):
+        raise CouponError('Coupon code must be a string.')
+    coupon = _load_active_coupons().get(code.strip().upper())
+    if coupon is None:
+        raise CouponError('Invalid coupon code.')
+    return coupon
+
+
+def calculate_discount(coupon, subtotal):
+    subtotal = Decimal(subtotal)
+    if coupon.discount_type == 'percentage':
+        discount = subtotal * coupon.discount_value / Decimal('100')
+    else:
+        discount = coupon.discount_value
+    return min(discount, subtotal).quantize(Decimal('0.01'))
+
+
+def evaluate_coupon(code, subtotal):
+    """Check a code against the cached coupon and return (coupon, discount).
+
+    Only the validity window, minimum purchase and a best-effort usage check are
+    done here; the usage limit is enforced for real by redeem_coupon().
+    """
+    coupon = get_active_coupon(code)
+    now = timezone.now()
+    if now < coupon.valid_from or now > coupon.valid_to:
+        raise CouponError('Coupon is not valid at this time.')
+    if Decimal(subtotal) < coupon.minimum_purchase:
+        raise CouponError(f'Minimum purchase of {coupon.minimum_purchase} required.')
+    if coupon.usage_limit is not None and coupon.used_count >= coupon.usage_limit:
+        raise CouponError('Coupon usage limit reached.')
+    return coupon, calculate_discount(coupon, subtotal)
+
+
+def redeem_coupon(code, subtotal):
+    """Validate and atomically consume one use of a coupon.
+
+    The increment is a single conditional UPDATE, so concurrent checkouts can
+    never push used_count past usage_limit.
+    """
+    coupon, discount = evaluate_coupon(code, subtotal)
+    now = timezone.now()
+    updated = Coupon.objects.filter(
+        pk=coupon.pk,
+        is_active=True,
+        valid_from__lte=now,
+        valid_to__gte=now,
+    ).filter(
+        Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit'))
+    ).update(used_count=F('used_count') + 1)
+    if not updated:
+        # The cached used_count was behind; reload so validation sees it too
+        invalidate_coupon_cache()
+        raise CouponError('Coupon usage limit reached.')
+    return coupon, discount
@@ -0,0 +1,142 @@
+"""Read-replica routing.
+
+Reads made while serving a safe (GET/HEAD/OPTIONS) request to one of
+settings.REPLICA_READ_PATHS go to a random alias from settings.DATABASE_REPLICAS;
+everything else, and everything outside a request (commands, jobs), uses the
+primary. After a request writes, its client is pinned to the primary for
+REPLICA_STICKY_SECONDS so it reads its own writes while the replicas catch up:
+anonymous clients through a cookie, authenticated users through the cache.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+def _user_pin_key(user_id):
+    return f'db-pin:user:{user_id}'
+
+
+def pin_user(user_id, seconds=None):
+    cache.set(_user_pin_key(user_id), time.time(), seconds or sticky_seconds())
+
+
+class RoutingState:
+    """Per-request routing decision, evaluated lazily because DRF authenticates inside the view."""
+
+    def __init__(self, request=None, use_replicas=False):
+        self.request = request
+        self.use_replicas = use_replicas
+        self.wrote = False
+        self._user_pinned = None
+
+    def primary_only(self):
+        if self.wrote or not self.use_replicas:
+            return True
+        if self._user_pinned is None and self.request is not None:
+            user = getattr(self.request, 'user', None)
+            if user is not None and user.is_authenticated:
+                self._user_pinned = cache.get(_user_pin_key(user.pk)) is not None
+        return bool(self._user_pinned)
+
+
+def begin_request(request):
+    path = request.path_info
+    use_replicas = (
+        bool(replicas())
+        and request.method in SAFE_METHODS
+        and PIN_COOKIE not in request.COOKIES
+        and path.startswith(tuple(getattr(settings, 'REPLICA_READ_PATHS', ())))
+    )
+    return _state.set(RoutingState(request, use_replicas))
+
+
+def end_request(token):
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+class use_primary:
+    """Context manager forcing reads in the block onto the primary."""
+
+    def __enter__(self):
+        self._token = _state.set(RoutingState())
+
+    def __exit__(self, *exc_info):
+        _state.reset(self._token)
+
+
+class unpinned:
+    """Context manager for bookkeeping writes (view counters) that shouldn't pin the client."""
+
+    def __enter__(self):
+        self._state = _state.get()
+        self._wrote = self._state.wrote if self._state else False
+
+    def __exit__(self, *exc_info):
+        if self._state is not None:
+            self._state.wrote = self._wrote
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.primary_only():
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction must see that transaction's writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        return db not in replicas()
+
+
+class ReplicaPinningMiddleware:
+    """Scopes routing to the request and pins clients to the primary after a write."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = begin_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = end_request(token)
+
+        if state.wrote and replicas():
+            seconds = sticky_seconds()
+            response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin_user(user.pk, seconds)
+        return response
@@ -0,0 +1,106 @@
+import csv
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+from .models import OrderItem, Product
+
+CHUNK_SIZE = 2000
+# Rows are grouped into roughly this many bytes before being handed to the server
+FLUSH_BYTES = 64 * 1024
+
+PRODUCT_COLUMNS = [
+    'id', 'product_name', 'slug', 'sku', 'barcode', 'gender', 'status', 'tags',
+    'base_price', 'discount_percentage', 'final_price', 'stock_quantity', 'low_stock_threshold',
+    'views', 'average_rating', 'created_at', 'updated_at',
+]
+
+# (header, ORM path) pairs; related columns are joined in the same query
+ORDER_ITEM_COLUMNS = [
+    ('order_number', 'order__order_number'),
+    ('order_date', 'order__created_at'),
+    ('order_status', 'order__status'),
+    ('payment_status', 'order__payment_status'),
+    ('buyer', 'order__user__username'),
+    ('product_id', 'product_id'),
+    ('product_name', 'product__product_name'),
+    ('product_sku', 'product__sku'),
+    ('variant_sku', 'variant__sku'),
+    ('quantity', 'quantity'),
+    ('unit_price', 'unit_price'),
+    ('total_price', 'total_price'),
+]
+
+
+# .iterator() streams through a server-side cursor on PostgreSQL (production);
+# other backends still fetch in chunk_size batches without caching the queryset.
+def product_rows(seller):
+    queryset = Product.objects.filter(seller=seller).order_by('pk').values_list(*PRODUCT_COLUMNS)
+    return PRODUCT_COLUMNS, queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+def order_item_rows(seller):
+    headers = [header for header, _ in ORDER_ITEM_COLUMNS]
+    queryset = (
+        OrderItem.objects.filter(product__seller=seller)
+        .order_by('order_id', 'pk')
+        .values_list(*[path for _, path in ORDER_ITEM_COLUMNS])
+    )
+    return headers, queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _buffered(lines):
+    lines = iter(lines)
+    # Send the first line straight away, then batch the rest
+    for line in lines:
+        yield line.encode('utf-8')
+        break
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def render_csv(headers, rows):
+    writer = csv.writer(_Echo())
+    # The header goes out on its own so the client gets a first byte before
+    # the query has even run.
+    yield writer.writerow(headers).encode('utf-8')
+    yield from _buffered(writer.writerow(row) for row in rows)
+
+
+def render_jsonl(headers, rows):
+    yield from _buffered(
+        json.dumps({header: _json_value(value) for header, value in zip(headers, row)}) + '\n'
+        for row in rows
+    )
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
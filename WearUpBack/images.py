@@ -0,0 +1,239 @@
+import base64
+import hashlib
+import io
+import posixpath
+import re
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+from PIL import Image, ImageFilter, ImageOps
+
+from .instrumentation import timed
+from .jobs import enqueue, job
+from .object_cache import PRODUCT_DETAILS
+
+DERIVATIVE_WIDTHS = (160, 480, 1080)
+PLACEHOLDER_WIDTH = 16
+
+# model label -> {image field: JSON field holding its derivatives}
+IMAGE_FIELDS = {
+    'WearUpBack.ProductImage': {'image': 'derivatives'},
+    'WearUpBack.UserProfile': {
+        'profile_image': 'profile_image_derivatives',
+        'cover_image': 'cover_image_derivatives',
+    },
+}
+
+# Names of content-addressed uploads: <prefix>/<2 hex>/<sha256>.<ext>
+CONTENT_ADDRESSED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+$')
+
+
+def _derivative_name(name, width, ext):
+    """Where a derivative of `name` goes; no two source names share one.
+
+    Content-addressed stems are unique already. Other names, such as
+    me.jpg and me.png, get a digest of the whole source name, so
+    rebuilding one source never replaces another source's files.
+    """
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    if CONTENT_ADDRESSED_NAME.search(name) is None:
+        stem = f'{stem}-{hashlib.sha256(name.encode()).hexdigest()[:12]}'
+    return posixpath.join(directory, 'derivatives', f'{stem}_{width}.{ext}')
+
+
+def _encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def build_derivatives(name, storage=None, force=False):
+    """Write resized JPEG/PNG and WebP copies of a stored image plus a blur placeholder.
+
+    Returns the map stored on the model: {'source', 'widths', 'placeholder'}.
+    Widths larger than the original are skipped rather than upscaled. Derivatives
+    of content-addressed files are shared, so existing ones are reused unless
+    `force` is set.
+    """
+    storage = storage or default_storage
+    reuse_existing = not force and CONTENT_ADDRESSED_NAME.search(name) is not None
+    with storage.open(name, 'rb') as fileobj:
+        original = ImageOps.exif_transpose(Image.open(fileobj))
+        original.load()
+
+    has_alpha = original.mode in ('RGBA', 'LA') or (original.mode == 'P' and 'transparency' in original.info)
+    original = original.convert('RGBA' if has_alpha else 'RGB')
+    fallback_format, fallback_ext = ('PNG', 'png') if has_alpha else ('JPEG', 'jpg')
+
+    widths = {}
+    for width in DERIVATIVE_WIDTHS:
+        if width > original.width and widths:
+            break
+        resized = original.copy()
+        resized.thumbnail((width, width * 10), Image.LANCZOS)
+        entry = {}
+        for fmt, ext, options in (
+            (fallback_format, fallback_ext, {'optimize': True, 'quality': 82} if fallback_format == 'JPEG' else {'optimize': True}),
+            ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+        ):
+            target = _derivative_name(name, width, ext)
+            key = ext if ext == 'webp' else 'default'
+            if storage.exists(target):
+                if reuse_existing:
+                    entry[key] = target
+                    continue
+                storage.delete(target)
+            entry[key] = storage.save(target, ContentFile(_encode(resized, fmt, **options)))
+        widths[str(min(width, original.width))] = entry
+
+    tiny = original.copy()
+    tiny.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 10))
+    tiny = tiny.filter(ImageFilter.GaussianBlur(1))
+    placeholder = 'data:image/webp;base64,' + base64.b64encode(_encode(tiny, 'WEBP', quality=30)).decode('ascii')
+
+    return {'source': name, 'widths': widths, 'placeholder': placeholder}
+
+
+@job('images.build_derivatives', queue='images', max_attempts=3)
+def process_image_field(model_label, pk, field_name, force=False):
+    model = apps.get_model(model_label)
+    json_field = IMAGE_FIELDS[model_label][field_name]
+    try:
+        instance = model.objects.get(pk=pk)
+    except model.DoesNotExist:
+        return
+    image = getattr(instance, field_name)
+    if not image:
+        model.objects.filter(pk=pk).update(**{json_field: {}})
+        return
+    derivatives = build_derivatives(image.name, image.storage, force=force)
+    # The image may have been replaced while we were working; only record
+    # derivatives for the file that is still current.
+    model.objects.filter(pk=pk, **{field_name: image.name}).update(**{json_field: derivatives})
+    if model_label == 'WearUpBack.ProductImage':
+        PRODUCT_DETAILS.invalidate(instance.product_id)
+
+
+def schedule_derivatives(instance, field_name):
+    """Queue derivative generation; the job commits with the surrounding transaction."""
+    enqueue('images.build_derivatives', {
+        'model_label': instance._meta.label,
+        'pk': instance.pk,
+        'field_name': field_name,
+    })
+
+
+def schedule_stale_derivatives(instance):
+    """Schedule every image field whose derivatives don't match the current file."""
+    for field_name, json_field in IMAGE_FIELDS[instance._meta.label].items():
+        image = getattr(instance, field_name)
+        current = (getattr(instance, json_field) or {}).get('source')
+        if (image.name or None) != current:
+            schedule_derivatives(instance, field_name)
+
+
+def store_image(upload, prefix='products', storage=None):
+    """Save an upload under a name derived from its SHA-256 and return (name, digest).
+
+    Identical bytes map to the same name, so re-submitted forms or the same
+    picture used on several products are stored once.
+    """
+    storage = storage or default_storage
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    digest = digest.hexdigest()
+    upload.seek(0)
+
+    ext = posixpath.splitext(upload.name or '')[1].lower() or '.jpg'
+    name = f'{prefix}/{digest[:2]}/{digest}{ext}'
+    with timed('storage'):
+        if not storage.exists(name):
+            name = storage.save(name, upload)
+    return name, digest
+
+
+def srcset(derivatives, storage=None):
+    """HTML srcset strings for a derivatives map, e.g. {'webp': 'a_160.webp 160w, ...'}."""
+    if not derivatives or not derivatives.get('widths'):
+        return None
+    storage = storage or default_storage
+    result = {}
+    with timed('storage'):
+        for width, entry in sorted(derivatives['widths'].items(), key=lambda item: int(item[0])):
+            for kind, name in entry.items():
+                result.setdefault(kind, []).append(f'{storage.url(name)} {width}w')
+    data = {kind: ', '.join(candidates) for kind, candidates in result.items()}
+    data['placeholder'] = derivatives.get('placeholder')
+    return data
+
+
+def _image_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_stale_derivatives(instance)
+
+
+def connect_signals():
+    for model_label in IMAGE_FIELDS:
+        post_save.connect(_image_saved, sender=model_label, dispatch_uid=f'image-derivatives-{model_label}')
+
+
+def update_product_images(product, main_image=None, additional_images=(), remove_ids=(), order_ids=(), main_image_id=None):
+    """Apply incremental image changes to a product.
+
+    New uploads are content-addressed and only get a row if the product doesn't
+    already have those bytes; removed rows leave the (possibly shared) file alone.
+    """
+    from .models import ProductImage
+
+    uploads = [(main_image, True)] if main_image is not None else []
+    uploads += [(upload, False) for upload in additional_images]
+    stored = [(store_image(upload), is_main) for upload, is_main in uploads]
+
+    with transaction.atomic():
+        if remove_ids:
+            product.images.filter(pk__in=remove_ids).delete()
+
+        existing = list(product.images.all())
+        by_hash = {image.content_hash: image for image in existing if image.content_hash}
+        next_order = max((image.order for image in existing), default=-1) + 1
+
+        # Rows elsewhere with the same bytes already have derivatives we can copy
+        new_hashes = {digest for (_, digest), _ in stored if digest not in by_hash}
+        shared = dict(
+            ProductImage.objects.filter(content_hash__in=new_hashes).exclude(derivatives={})
+            .values_list('content_hash', 'derivatives')
+        ) if new_hashes else {}
+
+        main = None
+        for (name, digest), is_main in stored:
+            image = by_hash.get(digest)
+            if image is None:
+                image = ProductImage.objects.create(
+                    product=product, image=name, content_hash=digest, is_main=False,
+                    order=next_order, derivatives=shared.get(digest, {}),
+                )
+                by_hash[digest] = image
+                next_order += 1
+            if is_main:
+                main = image
+
+        if main is None and main_image_id not in (None, ''):
+            main = product.images.filter(pk=main_image_id).first()
+        if main is not None:
+            product.images.exclude(pk=main.pk).filter(is_main=True).update(is_main=False)
+            product.images.filter(pk=main.pk, is_main=False).update(is_main=True)
+
+        if order_ids:
+            positions = {int(pk): position for position, pk in enumerate(order_ids)}
+            to_reorder = list(product.images.filter(pk__in=positions))
+            for image in to_reorder:
+                image.order = positions[image.pk]
+            ProductImage.objects.bulk_update(to_reorder, ['order'])
+
+        # The queryset updates above don't send post_save
+        PRODUCT_DETAILS.invalidate(product.pk)
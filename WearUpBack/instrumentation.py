@@ -0,0 +1,318 @@
+"""Per-request instrumentation: query count, DB time, serialization time and response size.
+
+RequestMetricsMiddleware measures every request and reports the numbers three
+ways: a Server-Timing header on the response, per-route histograms served in
+Prometheus text format at /metrics, and a slow-query log naming the view or
+serializer frame behind each query slower than settings.SLOW_QUERY_SECONDS.
+
+Histograms are kept per worker process and copied to the default cache every
+METRICS_FLUSH_SECONDS, so whichever worker answers a scrape reports them all.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from .query_log import query_origin
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_metrics', default=None)
+
+PREFIX = 'wearup_'
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# name -> (help, bucket upper bounds)
+HISTOGRAMS = {
+    'request_duration_seconds': ('Time to produce the response.', SECONDS_BUCKETS),
+    'request_db_seconds': ('Time spent executing SQL.', SECONDS_BUCKETS),
+    'request_queries': ('SQL queries executed.', (1, 2, 5, 10, 20, 50, 100, 200, 500)),
+    'request_serialize_seconds': ('Time spent in serializers and rendering the response body.', SECONDS_BUCKETS),
+    'request_storage_seconds': ('Time spent in file storage calls.', SECONDS_BUCKETS),
+    'response_size_bytes': ('Response body size.', (1_000, 10_000, 100_000, 1_000_000, 10_000_000)),
+}
+COUNTERS = {
+    'http_responses_total': 'Responses by route, method and status.',
+    'slow_queries_total': 'Queries slower than SLOW_QUERY_SECONDS.',
+}
+
+WORKERS_KEY = 'metrics:workers'
+# A worker that stops flushing (restarted, scaled down) drops out after this
+WORKER_TTL = 10 * 60
+
+
+def slow_query_seconds():
+    return getattr(settings, 'SLOW_QUERY_SECONDS', 0.2)
+
+
+def flush_seconds():
+    return getattr(settings, 'METRICS_FLUSH_SECONDS', 10)
+
+
+class RequestMetrics:
+    """What one request spent, by phase: 'db', 'serialize', 'render' and 'storage'."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = None
+        self.queries = 0
+        self.phases = {}
+        self.slow_queries = []
+        self._open = set()
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def server_timing(self, size=None):
+        def ms(seconds):
+            return f'{seconds * 1000:.1f}'
+
+        entries = [f'db;dur={ms(self.phases.get("db", 0))};desc="{self.queries} queries"']
+        entries += [f'{phase};dur={ms(self.phases[phase])}' for phase in ('serialize', 'render', 'storage') if phase in self.phases]
+        if size is not None:
+            entries.append(f'size;desc="{size} bytes"')
+        entries.append(f'total;dur={ms(self.total)}')
+        return ', '.join(entries)
+
+
+@contextmanager
+def timed(phase):
+    """Add the block's wall time to the current request's phase. Nested blocks of one phase count once."""
+    metrics = _current.get()
+    if metrics is None or phase in metrics._open:
+        yield
+        return
+    metrics._open.add(phase)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._open.discard(phase)
+        metrics.add(phase, time.perf_counter() - started)
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.queries += 1
+        metrics.add('db', seconds)
+        if seconds >= slow_query_seconds():
+            metrics.slow_queries.append((seconds, sql, query_origin()))
+
+
+@receiver(connection_created)
+def _wrap_connection(sender, connection, **kwargs):
+    # Every thread gets its own connection, including the ones async views run
+    # their queries on; the request is found through the context variable.
+    # First in the list, so `with connection.execute_wrapper()` blocks that
+    # open the connection still pop their own wrapper on exit.
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def instrument_serializers():
+    """Count the time DRF serializers spend building .data as the request's 'serialize' phase."""
+    from rest_framework import serializers
+
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        fget = cls.data.fget
+        if getattr(fget, 'instrumented', False):
+            continue
+
+        def data(self, fget=fget):
+            with timed('serialize'):
+                return fget(self)
+
+        data.instrumented = True
+        cls.data = property(data)
+
+
+def _worker_id():
+    # Looked up each time: workers forked from a preloaded master share the import
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _worker_key(worker):
+    return f'metrics:worker:{worker}'
+
+
+class MetricsRegistry:
+    """Histograms and counters for one worker process, keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # (name, labels) -> [count per bucket..., count above the last bucket, sum]
+            self.histograms = {}
+            # (name, labels) -> value
+            self.counters = {}
+            self._flushed = time.monotonic()
+
+    def _observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        series = self.histograms.get((name, labels))
+        if series is None:
+            series = self.histograms[(name, labels)] = [0] * (len(buckets) + 2)
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        series[index] += 1
+        series[-1] += value
+
+    def _increment(self, name, labels, amount=1):
+        self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def observe(self, route, method, status, metrics, size=None):
+        labels = (('route', route), ('method', method))
+        with self._lock:
+            self._observe('request_duration_seconds', labels, metrics.total)
+            self._observe('request_db_seconds', labels, metrics.phases.get('db', 0))
+            self._observe('request_queries', labels, metrics.queries)
+            self._observe('request_serialize_seconds', labels, metrics.phases.get('serialize', 0) + metrics.phases.get('render', 0))
+            self._observe('request_storage_seconds', labels, metrics.phases.get('storage', 0))
+            if size is not None:
+                self._observe('response_size_bytes', labels, size)
+            self._increment('http_responses_total', (*labels, ('status', str(status))))
+            if metrics.slow_queries:
+                self._increment('slow_queries_total', labels, len(metrics.slow_queries))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'histograms': {key: list(series) for key, series in self.histograms.items()},
+                'counters': dict(self.counters),
+            }
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed >= flush_seconds():
+            self.flush()
+
+    def flush(self):
+        """Publish this worker's numbers to the cache for /metrics to merge."""
+        self._flushed = time.monotonic()
+        worker = _worker_id()
+        cache.set(_worker_key(worker), self.snapshot(), WORKER_TTL)
+        workers = cache.get(WORKERS_KEY) or set()
+        if worker not in workers:
+            # Two workers registering at once can lose one; it re-registers next flush
+            cache.set(WORKERS_KEY, workers | {worker}, None)
+
+    def collect(self):
+        """The numbers of every live worker added together, this one's taken fresh."""
+        self.flush()
+        workers = cache.get(WORKERS_KEY) or set()
+        snapshots = cache.get_many([_worker_key(worker) for worker in workers])
+        live = {worker for worker in workers if _worker_key(worker) in snapshots}
+        if live != workers:
+            cache.set(WORKERS_KEY, live, None)
+        merged = {'histograms': {}, 'counters': {}}
+        for snapshot in snapshots.values():
+            for key, series in snapshot['histograms'].items():
+                total = merged['histograms'].setdefault(key, [0] * len(series))
+                for index, value in enumerate(series):
+                    total[index] += value
+            for key, value in snapshot['counters'].items():
+                merged['counters'][key] = merged['counters'].get(key, 0) + value
+        return merged
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render_prometheus(snapshot):
+    """Prometheus text exposition (version 0.0.4) of a MetricsRegistry snapshot."""
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        series = sorted((labels, values) for (metric, labels), values in snapshot['histograms'].items() if metric == name)
+        if not series:
+            continue
+        lines += [f'# HELP {PREFIX}{name} {help_text}', f'# TYPE {PREFIX}{name} histogram']
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), values):
+                cumulative += count
+                lines.append(f'{PREFIX}{name}_bucket{_labels((*labels, ("le", bound)))} {cumulative}')
+            lines.append(f'{PREFIX}{name}_sum{_labels(labels)} {values[-1]:g}')
+            lines.append(f'{PREFIX}{name}_count{_labels(labels)} {cumulative}')
+    for name, help_text in COUNTERS.items():
+        series = sorted((labels, value) for (metric, labels), value in snapshot['counters'].items() if metric == name)
+        if not series:
+            continue
+        lines += [f'# HELP {PREFIX}{name} {help_text}', f'# TYPE {PREFIX}{name} counter']
+        lines += [f'{PREFIX}{name}{_labels(labels)} {value}' for labels, value in series]
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetricsMiddleware:
+    """Measures each request; see the module docstring. Goes first in MIDDLEWARE to cover the others."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        metrics.total = time.perf_counter() - metrics.started
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        response['Server-Timing'] = metrics.server_timing(size)
+        REGISTRY.observe(route, request.method, response.status_code, metrics, size)
+        for seconds, sql, origin in metrics.slow_queries:
+            logger.warning('Slow query (%.1f ms) in %s %s from %s: %s', seconds * 1000, request.method, route, origin, sql[:1000])
+        REGISTRY.maybe_flush()
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, just after this hook
+        metrics = _current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: metrics.add('render', time.perf_counter() - started))
+        return response
+
+
+@require_GET
+def metrics(request):
+    """Prometheus scrape endpoint. Needs `Authorization: Bearer <METRICS_TOKEN>`.
+
+    With no token configured it is refused, unless METRICS_ALLOW_ANONYMOUS
+    is set (local debug servers).
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        if not getattr(settings, 'METRICS_ALLOW_ANONYMOUS', False):
+            return HttpResponse(status=403)
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(render_prometheus(REGISTRY.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
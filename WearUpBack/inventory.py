@@ -0,0 +1,144 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Case, Exists, F, IntegerField, Min, OuterRef, PositiveIntegerField, Q, Value, When
+from django.db.models.functions import Least
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .jobs import job
+from .models import LowStockAlert, Product, ProductVariant
+
+
+def low_stock_condition():
+    """True for products at or below their threshold, themselves or in any variant."""
+    low_variant = ProductVariant.objects.filter(
+        product=OuterRef('pk'), stock_quantity__lte=OuterRef('low_stock_threshold')
+    )
+    return Q(stock_quantity__lte=F('low_stock_threshold')) | Exists(low_variant)
+
+
+def refresh_low_stock(product_ids):
+    """Re-evaluate is_low_stock for these products and queue/resolve alerts on changes.
+
+    Call after anything that changes stock without going through Product or
+    ProductVariant save(). Costs one UPDATE plus two indexed reads, whatever the
+    number of products.
+    """
+    product_ids = list({pk for pk in product_ids if pk is not None})
+    if not product_ids:
+        return set(), set()
+
+    with transaction.atomic():
+        scope = Product.objects.filter(pk__in=product_ids)
+        was_low = set(scope.filter(is_low_stock=True).values_list('pk', flat=True))
+        scope.update(is_low_stock=Case(When(low_stock_condition(), then=Value(True)), default=Value(False)))
+        now_low = set(scope.filter(is_low_stock=True).values_list('pk', flat=True))
+
+        newly_low = now_low - was_low
+        recovered = was_low - now_low
+        if recovered:
+            LowStockAlert.objects.filter(product_id__in=recovered, resolved_at=None).update(resolved_at=timezone.now())
+        if newly_low:
+            LowStockAlert.objects.bulk_create([
+                LowStockAlert(
+                    product_id=row['pk'], seller_id=row['seller_id'],
+                    stock_quantity=row['lowest_stock'], threshold=row['low_stock_threshold'],
+                )
+                for row in with_lowest_stock(Product.objects.filter(pk__in=newly_low)).values(
+                    'pk', 'seller_id', 'lowest_stock', 'low_stock_threshold'
+                )
+            ])
+    return newly_low, recovered
+
+
+def with_lowest_stock(queryset):
+    """Annotate lowest_stock: the smaller of the product's stock and its lowest variant stock."""
+    return queryset.annotate(
+        lowest_variant_stock=Min('variants__stock_quantity'),
+    ).annotate(
+        lowest_stock=Case(
+            When(lowest_variant_stock__isnull=True, then=F('stock_quantity')),
+            default=Least('stock_quantity', 'lowest_variant_stock'),
+        ),
+    )
+
+
+def grouped_case(values, field='pk', output_field=None):
+    """CASE expression mapping {key: value}, with one WHEN per distinct value.
+
+    Bulk writes repeat the same few numbers, and a When() costs far more to
+    compile than one more entry in an IN list.
+    """
+    by_value = {}
+    for key, value in values.items():
+        by_value.setdefault(value, []).append(key)
+    return Case(
+        *[When(**{f'{field}__in': keys}, then=Value(value)) for value, keys in by_value.items()],
+        output_field=output_field or IntegerField(),
+    )
+
+
+def set_stock_levels(queryset, quantities):
+    """Write {pk: quantity} with a single UPDATE ... SET stock_quantity = CASE ... END."""
+    if not quantities:
+        return 0
+    fields = {'stock_quantity': grouped_case(quantities, output_field=PositiveIntegerField())}
+    if queryset.model is Product:
+        fields['updated_at'] = timezone.now()
+    return queryset.filter(pk__in=list(quantities)).update(**fields)
+
+
+def _stock_fields_changed(instance, fields):
+    loaded = getattr(instance, '_loaded_stock', None)
+    return loaded is None or loaded != tuple(getattr(instance, field) for field in fields)
+
+
+@receiver(post_save, sender=Product)
+def _product_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    fields = ('stock_quantity', 'low_stock_threshold')
+    if created or _stock_fields_changed(instance, fields):
+        newly_low, recovered = refresh_low_stock([instance.pk])
+        instance.is_low_stock = (instance.is_low_stock or instance.pk in newly_low) and instance.pk not in recovered
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def _variant_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_low_stock([instance.product_id])
+
+
+@job('inventory.low_stock_digest')
+def send_low_stock_digests():
+    """Email each seller one summary of their new low-stock alerts; returns the number of emails."""
+    pending = (
+        LowStockAlert.objects.filter(notified_at=None, resolved_at=None)
+        .exclude(seller=None).select_related('seller', 'product').order_by('seller_id', 'stock_quantity')
+    )
+    by_seller = defaultdict(list)
+    for alert in pending:
+        by_seller[alert.seller].append(alert)
+
+    sent = 0
+    for seller, alerts in by_seller.items():
+        if seller.email:
+            lines = [
+                f"- {alert.product.product_name} (SKU {alert.product.sku or 'n/a'}): {alert.stock_quantity} left, threshold {alert.threshold}"
+                for alert in alerts
+            ]
+            send_mail(
+                subject=f"{len(alerts)} product(s) running low on stock",
+                message="These products are at or below their low-stock threshold:\n\n" + "\n".join(lines),
+                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', None),
+                recipient_list=[seller.email],
+            )
+            sent += 1
+        # Sellers without an email address are marked too, so alerts don't pile up
+        LowStockAlert.objects.filter(pk__in=[alert.pk for alert in alerts]).update(notified_at=timezone.now())
+    return sent
@@ -0,0 +1,15 @@
+"""Entry points for process-pool job workers.
+
+Kept free of model imports: spawned children unpickle these before Django
+is set up, so setup has to happen first.
+"""
+import django
+
+
+def init_worker_process():
+    django.setup()
+
+
+def execute_job_in_process(pk):
+    from .jobs import execute_job
+    return execute_job(pk)
@@ -0,0 +1,117 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# handler name -> (function, default queue, default max_attempts)
+_registry = {}
+
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 60 * 60
+# A running job whose worker hasn't finished it in this long is assumed lost
+LOCK_TIMEOUT = timedelta(minutes=15)
+
+
+def job(name, queue='default', max_attempts=5):
+    """Register a function as a job handler. It is called with the payload as keyword arguments."""
+    def decorator(func):
+        _registry[name] = (func, queue, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, queue=None, run_at=None, max_attempts=None):
+    """Queue a job.
+
+    The row is inserted on the current connection, so it commits or rolls back
+    together with the caller's transaction. With settings.JOBS_EAGER the
+    handler instead runs in-process once the transaction commits (tests, dev).
+    """
+    if name not in _registry:
+        raise KeyError(f'No job handler registered as {name!r}')
+    func, default_queue, default_attempts = _registry[name]
+    payload = payload or {}
+
+    if getattr(settings, 'JOBS_EAGER', False):
+        transaction.on_commit(lambda: func(**payload))
+        return None
+
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        queue=queue or default_queue,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or default_attempts,
+    )
+
+
+def backoff_delay(attempts):
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), BACKOFF_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_jobs(queue, limit, worker_id):
+    """Atomically move up to `limit` due jobs of a queue to running; returns their ids.
+
+    Each claim is a conditional UPDATE on status, so two workers can never run
+    the same job.
+    """
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status='queued', queue=queue, run_at__lte=now)
+        .order_by('run_at', 'pk').values_list('pk', flat=True)[:limit * 2]
+    )
+    claimed = []
+    for pk in candidates:
+        if Job.objects.filter(pk=pk, status='queued').update(
+            status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        ):
+            claimed.append(pk)
+            if len(claimed) >= limit:
+                break
+    return claimed
+
+
+def requeue_stale_jobs():
+    cutoff = timezone.now() - LOCK_TIMEOUT
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(
+        status='queued', locked_by='', locked_at=None, last_error='Worker lost while running job',
+    )
+
+
+def execute_job(pk):
+    """Run one claimed job and record the outcome. Safe to call from thread or process pools."""
+    try:
+        try:
+            job_row = Job.objects.get(pk=pk)
+        except Job.DoesNotExist:
+            return False
+        try:
+            func = _registry[job_row.name][0]
+            func(**job_row.payload)
+        except Exception:
+            error = traceback.format_exc()
+            logger.warning('Job %s (%s) failed on attempt %s', job_row.pk, job_row.name, job_row.attempts)
+            if job_row.attempts < job_row.max_attempts:
+                Job.objects.filter(pk=pk).update(
+                    status='queued', locked_by='', locked_at=None, last_error=error,
+                    run_at=timezone.now() + backoff_delay(job_row.attempts),
+                )
+            else:
+                Job.objects.filter(pk=pk).update(status='failed', locked_by='', locked_at=None, last_error=error)
+            return False
+        Job.objects.filter(pk=pk).update(status='done', locked_by='', locked_at=None, last_error='')
+        return True
+    finally:
+        close_old_connections()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from WearUpBack.pricing import run_due_campaigns
+
+
+class Command(BaseCommand):
+    help = "Start scheduled price campaigns that are due and end expired ones. Run from cron every few minutes."
+
+    def handle(self, *args, **options):
+        started, ended = run_due_campaigns()
+        self.stdout.write(self.style.SUCCESS(f"Started {started} campaign(s), ended {ended} campaign(s)."))
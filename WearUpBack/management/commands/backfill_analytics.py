@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from WearUpBack.analytics import ROLLUP_CURSOR, rollup_days
+from WearUpBack.models import CartItem, Order, ProductLike, RollupCursor
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = (
+        "Build seller analytics rollups from existing likes, cart items and orders. "
+        "Views can't be rebuilt; they are only counted from the time tracking started."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=_parse_date, help="First day (default: oldest activity)")
+        parser.add_argument('--end', type=_parse_date, help="Last day (default: today)")
+        parser.add_argument('--chunk-days', type=int, default=7, help="Days rebuilt per transaction")
+
+    def handle(self, *args, **options):
+        started_at = timezone.now()
+        end = options['end'] or timezone.localdate()
+        start = options['start'] or self._oldest_activity() or end
+        if start > end:
+            raise CommandError('--start must not be after --end')
+
+        total = 0
+        chunk = timedelta(days=max(options['chunk_days'], 1))
+        day = start
+        while day <= end:
+            chunk_end = min(day + chunk - timedelta(days=1), end)
+            total += rollup_days(day, chunk_end)
+            self.stdout.write(f"{day} .. {chunk_end}: {total} row(s) so far")
+            day = chunk_end + timedelta(days=1)
+
+        # Let the incremental rollup carry on from here
+        RollupCursor.objects.update_or_create(name=ROLLUP_CURSOR, defaults={'position': started_at})
+        self.stdout.write(self.style.SUCCESS(f"Done. {total} product-day row(s) written."))
+
+    def _oldest_activity(self):
+        candidates = [
+            ProductLike.objects.aggregate(first=Min('created_at'))['first'],
+            CartItem.objects.aggregate(first=Min('added_at'))['first'],
+            Order.objects.aggregate(first=Min('created_at'))['first'],
+        ]
+        candidates = [value for value in candidates if value is not None]
+        return timezone.localdate(min(candidates)) if candidates else None
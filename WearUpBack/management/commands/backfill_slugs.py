@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+
+from WearUpBack.models import Product
+from WearUpBack.slugs import SlugAllocator, slug_base
+
+
+class Command(BaseCommand):
+    help = "Assign slugs to products that have none, in small keyset-paginated batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0, help="Seconds to pause between batches to ease load on a live table")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many products are missing a slug")
+
+    def handle(self, *args, **options):
+        missing = Product.objects.filter(slug='')
+        if options['dry_run']:
+            self.stdout.write(f"Products with empty slug: {missing.count()}")
+            return
+
+        batch_size = options['batch_size']
+        last_pk = 0
+        total = 0
+        while True:
+            batch = list(
+                missing.filter(pk__gt=last_pk).order_by('pk').only('pk', 'product_name')[:batch_size]
+            )
+            if not batch:
+                break
+            total += self._backfill_batch(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f"Backfilled {total} slug(s) (up to id {last_pk})")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Done. {total} slug(s) backfilled."))
+
+    def _backfill_batch(self, batch, retries=3):
+        for attempt in range(retries):
+            try:
+                # One short transaction per batch keeps row locks brief
+                with transaction.atomic():
+                    allocator = SlugAllocator()
+                    allocator.prefetch({slug_base(product.product_name) for product in batch})
+                    for product in batch:
+                        product.slug = allocator.allocate(product.product_name)
+                    Product.objects.bulk_update(batch, ['slug'])
+                return len(batch)
+            except IntegrityError:
+                # A concurrent insert took one of our slugs; re-read and retry
+                if attempt == retries - 1:
+                    raise
+        return 0
@@ -0,0 +1,72 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from WearUpBack.bench_suite import SCALES, SCENARIOS, bench_data_exists, route_names, run_suite, seed
+from WearUpBack.benchmarking import compare, dumps
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test every API route against a synthetic dataset and report p50/p95/p99 latency, "
+        "throughput and queries per request as JSON. Seed a scratch database first with --seed; "
+        "the data is owned by users named bench-*."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help="Create the dataset first (once per database)")
+        parser.add_argument('--seed-only', action='store_true', help="Create the dataset and exit")
+        parser.add_argument('--scale', choices=sorted(SCALES), default='smoke')
+        for name in SCALES['smoke']:
+            parser.add_argument(f'--{name}', type=int, help=f"Override the scale's number of {name}")
+        parser.add_argument('--url', help="Base URL of a running server, e.g. http://127.0.0.1:8000 (default: in-process)")
+        parser.add_argument('--concurrency', default='1,8,32', help="Comma-separated concurrency levels")
+        parser.add_argument('--requests', type=int, default=20, help="Requests per client thread")
+        parser.add_argument('--endpoints', help="Comma-separated route names (default: all)")
+        parser.add_argument('--baseline', help="Compare against a saved report and fail on regressions")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p95 slowdown against the baseline")
+        parser.add_argument('--save-baseline', help="Write the report to this path")
+
+    def handle(self, *args, **options):
+        log = lambda message: self.stderr.write(message)
+        report = {}
+        if options['seed'] or options['seed_only']:
+            if bench_data_exists():
+                raise CommandError('This database already holds a bench dataset; seed a fresh one')
+            scale = {name: options[name] if options[name] is not None else value for name, value in SCALES[options['scale']].items()}
+            report['seeded'] = seed(scale, log=log)
+            if options['seed_only']:
+                self.stdout.write(dumps(report))
+                return
+        elif not bench_data_exists():
+            raise CommandError('No bench dataset in this database; run with --seed first')
+
+        missing = route_names() - set(SCENARIOS)
+        if missing:
+            self.stderr.write(self.style.WARNING(f"No scenario for: {', '.join(sorted(missing))}"))
+        names = [name.strip() for name in options['endpoints'].split(',')] if options['endpoints'] else None
+        unknown = set(names or ()) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}")
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency takes comma-separated numbers')
+
+        report.update({
+            'target': options['url'] or 'in-process',
+            'requests_per_worker': options['requests'],
+            'results': run_suite(levels, options['requests'], names, options['url'],
+                                 getattr(settings, 'METRICS_TOKEN', ''), log=log),
+        })
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            report['regressions'] = compare(report['results'], baseline['results'], options['tolerance'])
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as f:
+                f.write(dumps(report))
+        self.stdout.write(dumps(report))
+        if report.get('regressions'):
+            raise CommandError(f"{len(report['regressions'])} regression(s) against {options['baseline']}")
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from WearUpBack.benchmarking import dumps, run_load, wait_until_ready
+from WearUpBack.models import Product
+
+SERVERS = {
+    # name -> (command, URL prefix of the product endpoints it serves)
+    'gunicorn': (['-m', 'gunicorn', 'Backend.wsgi:application', '--worker-class', 'sync'], '/api/products/'),
+    'uvicorn': (['-m', 'uvicorn', 'Backend.asgi:application', '--no-access-log'], '/api/async/products/'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the product read endpoints under gunicorn (sync DRF views) and "
+        "uvicorn (async views) with the same worker count and client concurrency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default='gunicorn,uvicorn')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=50, help="Requests per client thread")
+        parser.add_argument('--port', type=int, default=8790)
+        parser.add_argument('--product', type=int, help="Product id for the detail endpoint (default: newest)")
+
+    def handle(self, *args, **options):
+        product_id = options['product'] or Product.objects.order_by('-pk').values_list('pk', flat=True).first()
+        if product_id is None:
+            raise CommandError('No products to benchmark against; import a catalog first')
+
+        results = {
+            'workers': options['workers'],
+            'concurrency': options['concurrency'],
+            'product': product_id,
+        }
+        for offset, name in enumerate(filter(None, options['servers'].split(','))):
+            if name not in SERVERS:
+                raise CommandError(f"Unknown server '{name}'")
+            results[name] = self._bench(name, options['port'] + offset, product_id, options)
+        self.stdout.write(dumps(results))
+
+    def _bench(self, name, port, product_id, options):
+        args, prefix = SERVERS[name]
+        if name == 'gunicorn':
+            args = args + ['--bind', f'127.0.0.1:{port}', '--workers', str(options['workers'])]
+        else:
+            args = args + ['--host', '127.0.0.1', '--port', str(port), '--workers', str(options['workers'])]
+
+        base = f'http://127.0.0.1:{port}{prefix}'
+        process = subprocess.Popen([sys.executable] + args, env=os.environ.copy(),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_until_ready(base):
+                raise CommandError(f'{name} did not start on port {port}')
+            # Warm connections, caches and imports in every worker first
+            run_load([base], concurrency=options['workers'] * 2, requests_per_worker=5)
+            return {
+                'list': run_load([base], options['concurrency'], options['requests']),
+                'detail': run_load([f'{base}{product_id}/'], options['concurrency'], options['requests']),
+            }
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
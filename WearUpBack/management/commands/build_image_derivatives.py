@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from WearUpBack.images import IMAGE_FIELDS, process_image_field
+from WearUpBack.models import ProductImage, UserProfile
+
+
+class Command(BaseCommand):
+    help = "Build thumbnails, WebP variants and blur placeholders for images that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild derivatives for every image")
+
+    def handle(self, *args, **options):
+        built = 0
+        for model in (ProductImage, UserProfile):
+            label = model._meta.label
+            for field_name, json_field in IMAGE_FIELDS[label].items():
+                queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                if not options['all']:
+                    queryset = queryset.filter(**{json_field: {}})
+                for pk in queryset.values_list('pk', flat=True).iterator():
+                    try:
+                        process_image_field(label, pk, field_name, force=options['all'])
+                    except Exception as e:
+                        self.stderr.write(f"{label} {pk} {field_name}: {e}")
+                        continue
+                    built += 1
+        self.stdout.write(self.style.SUCCESS(f"Built derivatives for {built} image(s)."))
@@ -0,0 +1,88 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from WearUpBack.catalog_import import CatalogImporter, RowError, guess_format, iter_rows, parse_row
+from WearUpBack.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = "Bulk-import a seller's catalog from a CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--seller', required=True, help="Username of the seller the products belong to")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension")
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument(
+            '--benchmark', type=int, metavar='ROWS',
+            help="Instead of importing, time the first ROWS rows through the bulk importer and through "
+                 "ProductSerializer.create (both rolled back) and report rows per second",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(username=options['seller'])
+        except User.DoesNotExist:
+            raise CommandError(f"Seller '{options['seller']}' does not exist")
+        fmt = options['format'] or guess_format(options['path'])
+
+        if options['benchmark']:
+            self._benchmark(options['path'], fmt, seller, options['benchmark'], options['chunk_size'])
+            return
+
+        with open(options['path'], 'rb') as fileobj:
+            result = CatalogImporter(seller, chunk_size=options['chunk_size']).run(iter_rows(fileobj, fmt))
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} of {result['rows']} rows in {result['seconds']}s "
+            f"({result['rows_per_second']} rows/s), {len(result['errors'])} error(s)."
+        ))
+
+    def _read_rows(self, path, fmt, limit):
+        rows = []
+        with open(path, 'rb') as fileobj:
+            for number, row in iter_rows(fileobj, fmt):
+                if len(rows) >= limit:
+                    break
+                if not isinstance(row, Exception):
+                    rows.append((number, row))
+        return rows
+
+    def _benchmark(self, path, fmt, seller, limit, chunk_size):
+        rows = self._read_rows(path, fmt, limit)
+
+        with transaction.atomic():
+            result = CatalogImporter(seller, chunk_size=chunk_size).run(iter(rows))
+            transaction.set_rollback(True)
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            for _, row in rows:
+                try:
+                    fields, sizes, categories, _ = parse_row(row)
+                except RowError:
+                    continue
+                fields.pop('final_price')
+                serializer = ProductSerializer(data={
+                    **fields,
+                    'sizes': json.dumps(sizes),
+                    'categories': json.dumps(categories),
+                })
+                if serializer.is_valid():
+                    serializer.save(seller=seller)
+            transaction.set_rollback(True)
+        elapsed = time.perf_counter() - started
+        serializer_rate = round(len(rows) / elapsed, 1) if elapsed else None
+
+        self.stdout.write(json.dumps({
+            'rows': len(rows),
+            'bulk_import_rows_per_second': result['rows_per_second'],
+            'serializer_rows_per_second': serializer_rate,
+            'speedup': round(result['rows_per_second'] / serializer_rate, 1) if serializer_rate else None,
+        }, indent=2))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from WearUpBack.revocation import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding and blacklisted JWTs in small batches, one short transaction each. "
+        "Run from cron daily; unlike flushexpiredtokens it never holds locks on the whole table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0, help="Seconds to pause between batches to ease load on a live table")
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many tokens have expired")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            expired = OutstandingToken.objects.filter(expires_at__lte=timezone.now()).count()
+            self.stdout.write(f"Expired tokens: {expired}")
+            return
+        started = time.monotonic()
+        total = purge_expired_tokens(options['batch_size'], options['sleep'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Done. {total} expired token(s) deleted in {time.monotonic() - started:.1f}s."))
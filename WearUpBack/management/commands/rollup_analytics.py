@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from WearUpBack.analytics import run_rollup
+
+
+class Command(BaseCommand):
+    help = "Refresh seller analytics rollups for days with new activity. Run from cron every few minutes."
+
+    def handle(self, *args, **options):
+        days, written = run_rollup()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {written} product-day row(s) across {len(days)} day(s)."
+        ))
@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from WearUpBack.job_process import execute_job_in_process, init_worker_process
+from WearUpBack.jobs import claim_jobs, execute_job, requeue_stale_jobs
+
+
+def parse_queues(value):
+    """'default:4,images:2' -> {'default': 4, 'images': 2}"""
+    queues = {}
+    for item in value.split(','):
+        name, _, concurrency = item.strip().partition(':')
+        if not name:
+            continue
+        try:
+            queues[name] = int(concurrency or 1)
+        except ValueError:
+            raise CommandError(f"Invalid concurrency in '{item}'")
+    if not queues:
+        raise CommandError('At least one queue is required')
+    return queues
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the database job table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queues', default='default:4,images:2',
+                            help="Comma-separated queue:concurrency pairs (default: %(default)s)")
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help="Use processes for CPU-heavy queues such as image processing")
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--burst', action='store_true', help="Exit once no jobs are due")
+
+    def handle(self, *args, **options):
+        queues = parse_queues(options['queues'])
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        size = sum(queues.values())
+
+        if options['pool'] == 'process':
+            # Children get their own connections; never share the parent's sockets
+            connections.close_all()
+            executor = ProcessPoolExecutor(
+                max_workers=size,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker_process,
+            )
+            run = execute_job_in_process
+        else:
+            executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='job-worker')
+            run = execute_job
+
+        stopping = threading.Event()
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after in-flight jobs finish...')
+            stopping.set()
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, stop)
+            signal.signal(signal.SIGINT, stop)
+
+        in_flight = {name: set() for name in queues}
+        processed = 0
+        last_stale_check = 0
+        self.stdout.write(f"Worker {worker_id} running queues {queues} on a {options['pool']} pool")
+
+        try:
+            while not stopping.is_set():
+                if time.monotonic() - last_stale_check > 60:
+                    requeue_stale_jobs()
+                    last_stale_check = time.monotonic()
+
+                claimed_any = False
+                for name, limit in queues.items():
+                    done = {future for future in in_flight[name] if future.done()}
+                    processed += len(done)
+                    in_flight[name] -= done
+                    for pk in claim_jobs(name, limit - len(in_flight[name]), worker_id):
+                        in_flight[name].add(executor.submit(run, pk))
+                        claimed_any = True
+
+                busy = any(in_flight.values())
+                if options['burst'] and not claimed_any and not busy:
+                    break
+                if not claimed_any:
+                    time.sleep(options['poll_interval'] if not busy else min(options['poll_interval'], 0.1))
+        finally:
+            executor.shutdown(wait=True)
+            processed += sum(len(futures) for futures in in_flight.values())
+
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker_id} stopped after {processed} job(s)."))
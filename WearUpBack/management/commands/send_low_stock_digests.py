@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from WearUpBack.inventory import send_low_stock_digests
+
+
+class Command(BaseCommand):
+    help = "Email sellers a digest of newly low-stock products. Run from cron, e.g. hourly."
+
+    def handle(self, *args, **options):
+        sent = send_low_stock_digests()
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} low-stock digest(s)."))
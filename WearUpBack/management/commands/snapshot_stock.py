@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from WearUpBack.stock_ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Snapshot stock items with new ledger movements and settle their stock columns. Run from cron every few minutes."
+
+    def handle(self, *args, **options):
+        taken = take_snapshots()
+        self.stdout.write(self.style.SUCCESS(f"Took {taken} stock snapshot(s)."))
@@ -0,0 +1,98 @@
+import json
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from WearUpBack.catalog_import import guess_format, iter_rows
+from WearUpBack.models import Product
+from WearUpBack.serializers import ProductSerializer
+from WearUpBack.stock_sync import StockUpdater
+
+
+class Command(BaseCommand):
+    help = "Set a seller's stock levels from a CSV or JSONL file of sku/barcode and quantity rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?')
+        parser.add_argument('--seller', required=True, help="Username of the seller whose stock is synced")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--benchmark', type=int, metavar='ROWS',
+            help="Instead of syncing, create ROWS throwaway products and time updating all of them through "
+                 "the bulk updater and a sample through per-row ProductSerializer saves (all rolled back)",
+        )
+        parser.add_argument('--sample', type=int, default=1000, help="Rows timed through the per-row path when benchmarking")
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(username=options['seller'])
+        except User.DoesNotExist:
+            raise CommandError(f"Seller '{options['seller']}' does not exist")
+
+        if options['benchmark']:
+            self._benchmark(seller, options['benchmark'], options['sample'], options['chunk_size'])
+            return
+        if not options['path']:
+            raise CommandError("A file path is required unless --benchmark is given")
+
+        fmt = options['format'] or guess_format(options['path'])
+        with open(options['path'], 'rb') as fileobj:
+            result = StockUpdater(seller, chunk_size=options['chunk_size']).run(iter_rows(fileobj, fmt))
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        if result['unknown']:
+            self.stderr.write(f"Unknown codes: {', '.join(result['unknown'])}")
+        if result['ambiguous']:
+            self.stderr.write(f"Codes matching several products: {', '.join(result['ambiguous'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {result['updated_products']} product(s) and {result['updated_variants']} variant(s) "
+            f"from {result['rows']} rows in {result['seconds']}s ({result['rows_per_second']} rows/s)."
+        ))
+
+    def _benchmark(self, seller, rows, sample, chunk_size):
+        with transaction.atomic():
+            Product.objects.bulk_create([
+                Product(
+                    seller=seller, product_name=f'Stock benchmark {i}', slug=f'stock-benchmark-{i}',
+                    gender='Unisex', base_price=10, final_price=10, sku=f'BENCH-{i}', barcode=f'BENCH-EAN-{i}',
+                    stock_quantity=50,
+                )
+                for i in range(rows)
+            ], batch_size=1000)
+            # Half the rows by SKU, half by barcode, plus a few codes that match nothing
+            sync = [
+                (i, {'sku' if i % 2 else 'barcode': f'BENCH-{i}' if i % 2 else f'BENCH-EAN-{i}',
+                     'quantity': random.randint(0, 100)})
+                for i in range(rows)
+            ]
+            sync += [(rows + i, {'sku': f'BENCH-MISSING-{i}', 'quantity': 1}) for i in range(10)]
+
+            result = StockUpdater(seller, chunk_size=chunk_size).run(iter(sync))
+
+            sample = min(sample, rows)
+            started = time.perf_counter()
+            for i in range(sample):
+                # What a PATCH per row through ProductViewSet costs
+                product = Product.objects.get(seller=seller, sku=f'BENCH-{i}')
+                serializer = ProductSerializer(product, data={'stock_quantity': random.randint(0, 100)}, partial=True)
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+
+        per_row_rate = round(sample / elapsed, 1) if elapsed else None
+        self.stdout.write(json.dumps({
+            'rows': rows,
+            'bulk_seconds': result['seconds'],
+            'bulk_rows_per_second': result['rows_per_second'],
+            'unknown_codes': len(result['unknown']),
+            'per_row_sample': sample,
+            'per_row_rows_per_second': per_row_rate,
+            'per_row_estimated_seconds': round(rows / per_row_rate, 1) if per_row_rate else None,
+            'speedup': round(result['rows_per_second'] / per_row_rate, 1) if per_row_rate else None,
+        }, indent=2))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from WearUpBack.models import ProductVariant
+from WearUpBack.stock_ledger import adopt_columns, all_items, item_key, rebuild, verify
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that every stock item's ledger total, snapshot plus later movements and "
+        "stock_quantity column agree, and optionally repair the ones that don't. Repairs should run while "
+        "nothing else is writing stock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, action='append', help="Only check this product and its variants")
+        repair = parser.add_mutually_exclusive_group()
+        repair.add_argument(
+            '--rebuild', action='store_true',
+            help="Trust the ledger: reset snapshots and stock columns of mismatched items from it",
+        )
+        repair.add_argument(
+            '--adopt-columns', action='store_true',
+            help="Trust the stock columns: record adjustments so the ledger matches them, e.g. after stock "
+                 "was written outside the ledger",
+        )
+
+    def _items(self, product_ids):
+        if not product_ids:
+            yield from all_items()
+            return
+        items = [item_key(pk) for pk in product_ids]
+        items += [
+            item_key(product_id, pk)
+            for pk, product_id in ProductVariant.objects.filter(product_id__in=product_ids).values_list('pk', 'product_id')
+        ]
+        yield items
+
+    def handle(self, *args, **options):
+        checked = 0
+        mismatched = {}
+        for items in self._items(options['product']):
+            checked += len(items)
+            mismatched.update(verify(items))
+
+        for item, row in sorted(mismatched.items()):
+            self.stderr.write(
+                f"{item}: ledger {row['ledger']}, snapshot+tail {row['on_hand']}, column {row['column']}"
+            )
+
+        if mismatched and options['rebuild']:
+            settled = rebuild(mismatched)
+            self.stdout.write(self.style.SUCCESS(
+                f"Rebuilt {len(mismatched)} item(s) from the ledger; corrected {settled} stock column(s)."
+            ))
+        elif mismatched and options['adopt_columns']:
+            movements = adopt_columns(mismatched)
+            rebuild(mismatched)
+            self.stdout.write(self.style.SUCCESS(
+                f"Recorded {len(movements)} adjustment(s) to match the stock columns of {len(mismatched)} item(s)."
+            ))
+        elif mismatched:
+            raise CommandError(f"{len(mismatched)} of {checked} stock item(s) disagree.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"All {checked} stock item(s) agree."))
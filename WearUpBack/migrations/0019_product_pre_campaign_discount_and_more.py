@@ -0,0 +1,59 @@
+# Generated by Django 5.2.4 on 2026-10-19 02:09
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_variant_prices(apps, schema_editor):
+    Product = apps.get_model('WearUpBack', 'Product')
+    ProductVariant = apps.get_model('WearUpBack', 'ProductVariant')
+    product_price = Product.objects.filter(pk=models.OuterRef('product_id')).values('final_price')[:1]
+    ProductVariant.objects.update(
+        final_price=models.Subquery(product_price, output_field=models.DecimalField()) + models.F('price_adjustment')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WearUpBack', '0018_productcomment_productshare_productlike'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='pre_campaign_discount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='final_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='PriceCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('discount_percentage', models.DecimalField(decimal_places=2, max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('tag', models.CharField(blank=True, max_length=50)),
+                ('starts_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('active', 'Active'), ('ended', 'Ended')], default='scheduled', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(blank=True, help_text='Includes all subcategories', null=True, on_delete=django.db.models.deletion.SET_NULL, to='WearUpBack.category')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('seller', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='price_campaigns', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='campaign',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='WearUpBack.pricecampaign'),
+        ),
+        migrations.RunPython(backfill_variant_prices, migrations.RunPython.noop),
+    ]
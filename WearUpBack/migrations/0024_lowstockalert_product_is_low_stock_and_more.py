@@ -0,0 +1,65 @@
+# Generated by Django 5.2.4 on 2026-10-19 02:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def flag_low_stock(apps, schema_editor):
+    # Existing low-stock products get flagged without alerts, so the first
+    # digest isn't a dump of the whole catalog
+    Product = apps.get_model('WearUpBack', 'Product')
+    ProductVariant = apps.get_model('WearUpBack', 'ProductVariant')
+    low_variant = ProductVariant.objects.filter(
+        product=models.OuterRef('pk'), stock_quantity__lte=models.OuterRef('low_stock_threshold')
+    )
+    Product.objects.filter(
+        models.Q(stock_quantity__lte=models.F('low_stock_threshold')) | models.Exists(low_variant)
+    ).update(is_low_stock=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WearUpBack', '0023_rollupcursor_productdailystats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LowStockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_quantity', models.PositiveIntegerField()),
+                ('threshold', models.PositiveIntegerField()),
+                ('detected_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='is_low_stock',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['seller', 'is_low_stock', 'stock_quantity'], name='WearUpBack__seller__bf3ad7_idx'),
+        ),
+        migrations.AddField(
+            model_name='lowstockalert',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='low_stock_alerts', to='WearUpBack.product'),
+        ),
+        migrations.AddField(
+            model_name='lowstockalert',
+            name='seller',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='low_stock_alerts', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='lowstockalert',
+            index=models.Index(fields=['notified_at', 'seller'], name='WearUpBack__notifie_209ccd_idx'),
+        ),
+        migrations.RunPython(flag_low_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 02:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WearUpBack', '0024_lowstockalert_product_is_low_stock_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['seller', 'sku'], name='WearUpBack__seller__c56460_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['seller', 'barcode'], name='WearUpBack__seller__d15e54_idx'),
+        ),
+    ]
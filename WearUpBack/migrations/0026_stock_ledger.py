@@ -0,0 +1,86 @@
+# Generated by Django 5.2.4 on 2026-10-19 02:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_balances(apps, schema_editor):
+    """Record every item's current stock as an opening adjustment, on counter shard 0."""
+    Product = apps.get_model('WearUpBack', 'Product')
+    ProductVariant = apps.get_model('WearUpBack', 'ProductVariant')
+    StockMovement = apps.get_model('WearUpBack', 'StockMovement')
+    StockCounterShard = apps.get_model('WearUpBack', 'StockCounterShard')
+
+    items = [
+        (f'p{pk}', pk, None, quantity)
+        for pk, quantity in Product.objects.filter(stock_quantity__gt=0).values_list('pk', 'stock_quantity').iterator()
+    ] + [
+        (f'v{pk}', product_id, pk, quantity)
+        for pk, product_id, quantity in ProductVariant.objects.filter(stock_quantity__gt=0)
+        .values_list('pk', 'product_id', 'stock_quantity').iterator()
+    ]
+    StockMovement.objects.bulk_create([
+        StockMovement(item=item, product_id=product_id, variant_id=variant_id, kind='adjustment',
+                      quantity=quantity, note='Opening stock')
+        for item, product_id, variant_id, quantity in items
+    ], batch_size=1000)
+    StockCounterShard.objects.bulk_create([
+        StockCounterShard(item=item, shard=0, quantity=quantity) for item, _, _, quantity in items
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WearUpBack', '0025_product_sku_barcode_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item', models.CharField(max_length=32)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('quantity', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('item', 'shard'), name='unique_stock_counter_shard')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item', models.CharField(max_length=32)),
+                ('quantity', models.IntegerField()),
+                ('last_movement_id', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', '-last_movement_id'], name='WearUpBack__item_3abeac_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item', models.CharField(max_length=32)),
+                ('kind', models.CharField(choices=[('receipt', 'Receipt'), ('sale', 'Sale'), ('return', 'Return'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='WearUpBack.product')),
+                ('variant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='WearUpBack.productvariant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'id'], name='WearUpBack__item_3abd43_idx'), models.Index(fields=['created_at'], name='WearUpBack__created_60c013_idx')],
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:40
+
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def email_constraint():
+    # Lets WearUpBack.auth_backends.EmailBackend find a user with one index
+    # lookup. Users without an email are left out.
+    return models.UniqueConstraint(
+        Lower('email'), condition=~models.Q(email=''), name='auth_user_email_ci_unique',
+    )
+
+
+def add_email_constraint(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    duplicates = list(
+        User.objects.exclude(email='').annotate(email_lower=Lower('email'))
+        .values('email_lower').annotate(users=models.Count('pk')).filter(users__gt=1)
+        .values_list('email_lower', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'These emails belong to more than one user (ignoring case); give each user '
+            f'a distinct address before migrating: {", ".join(duplicates)}'
+        )
+    schema_editor.add_constraint(User, email_constraint())
+
+
+def remove_email_constraint(apps, schema_editor):
+    schema_editor.remove_constraint(apps.get_model('auth', 'User'), email_constraint())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WearUpBack', '0027_profile_report'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_email_constraint, remove_email_constraint),
+    ]
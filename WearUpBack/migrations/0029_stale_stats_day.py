@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WearUpBack', '0028_auth_user_email_ci_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleStatsDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WearUpBack', '0029_stale_stats_day'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='is_low_stock',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
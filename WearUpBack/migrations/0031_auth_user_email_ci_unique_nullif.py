@@ -0,0 +1,57 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:10
+
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def partial_constraint():
+    # As added by 0028; MySQL has no partial indexes and skipped it
+    return models.UniqueConstraint(
+        Lower('email'), condition=~models.Q(email=''), name='auth_user_email_ci_unique',
+    )
+
+
+def email_constraint():
+    # A plain unique index on NULLIF(LOWER(email), ''), which every backend
+    # builds. Empty emails index as NULL, and NULLs never collide. Must match
+    # WearUpBack.auth_backends.email_key() for lookups to use it.
+    email_key = models.Func(Lower('email'), template="NULLIF(%(expressions)s, '')", output_field=models.CharField())
+    return models.UniqueConstraint(email_key, name='auth_user_email_ci_unique')
+
+
+def replace_constraint(apps, schema_editor):
+    if not schema_editor.connection.features.supports_expression_indexes:
+        raise RuntimeError(
+            'The case-insensitive email index needs a database with expression indexes '
+            '(PostgreSQL, SQLite 3.9+ or MySQL 8.0.13+).'
+        )
+    User = apps.get_model('auth', 'User')
+    duplicates = list(
+        User.objects.exclude(email='').annotate(email_lower=Lower('email'))
+        .values('email_lower').annotate(users=models.Count('pk')).filter(users__gt=1)
+        .values_list('email_lower', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'These emails belong to more than one user (ignoring case); give each user '
+            f'a distinct address before migrating: {", ".join(duplicates)}'
+        )
+    schema_editor.remove_constraint(User, partial_constraint())
+    schema_editor.add_constraint(User, email_constraint())
+
+
+def restore_partial_constraint(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    schema_editor.remove_constraint(User, email_constraint())
+    schema_editor.add_constraint(User, partial_constraint())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WearUpBack', '0030_product_is_low_stock_not_editable'),
+    ]
+
+    operations = [
+        migrations.RunPython(replace_constraint, restore_partial_constraint),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.4 on 2026-10-19 04:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WearUpBack', '0031_auth_user_email_ci_unique_nullif'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='StockCounterShard',
+        ),
+    ]
@@ -2,9 +2,10 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
-from django.utils.text import slugify
 from decimal import Decimal
 
+from .slugs import allocate_slug
+
 
 # -----------------------
 # User & Profile
@@ -24,6 +25,9 @@ class UserProfile(models.Model):
     business_name = models.CharField(max_length=100, blank=True)
     profile_image = models.ImageField(upload_to='profiles/', blank=True, null=True)
     cover_image = models.ImageField(upload_to='covers/', blank=True, null=True)
+    # Resized/WebP copies and blur placeholders, filled in by WearUpBack.images
+    profile_image_derivatives = models.JSONField(default=dict, blank=True)
+    cover_image_derivatives = models.JSONField(default=dict, blank=True)
 
     # Private fields (only visible to the same user)
     phone = models.CharField(max_length=20, blank=True)
@@ -74,6 +78,19 @@ class Category(models.Model):
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, blank=True, null=True, related_name='subcategories')
 
+    def get_descendant_ids(self, include_self=True):
+        # One query for the whole (small) category table, then walk it in memory
+        children = {}
+        for category_id, parent_id in Category.objects.values_list('id', 'parent_id'):
+            children.setdefault(parent_id, []).append(category_id)
+        ids = [self.pk] if include_self else []
+        stack = list(children.get(self.pk, []))
+        while stack:
+            category_id = stack.pop()
+            ids.append(category_id)
+            stack.extend(children.get(category_id, []))
+        return ids
+
     def __str__(self):
         return self.name
 
@@ -120,8 +137,16 @@ class Product(models.Model):
     discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0, validators=[MinValueValidator(0), MaxValueValidator(100)])
     final_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)  # Calculated field
 
+    # Set while a PriceCampaign overrides discount_percentage; the product's own
+    # discount is kept aside so it can be restored when the campaign ends.
+    campaign = models.ForeignKey('PriceCampaign', on_delete=models.SET_NULL, blank=True, null=True, related_name='products')
+    pre_campaign_discount = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
+
     stock_quantity = models.PositiveIntegerField(default=0)
     low_stock_threshold = models.PositiveIntegerField(default=10)
+    # Kept current by WearUpBack.inventory whenever stock changes, and never
+    # written by save(): a stale instance would put back the flag it loaded
+    is_low_stock = models.BooleanField(default=False, editable=False)
     sku = models.CharField(max_length=100, blank=True)
     barcode = models.CharField(max_length=100, blank=True)
 
@@ -138,17 +163,48 @@ class Product(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['seller', 'is_low_stock', 'stock_quantity']),
+            # Stock syncs resolve a seller's codes against either column
+            models.Index(fields=['seller', 'sku']),
+            models.Index(fields=['seller', 'barcode']),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.product_name)
-            # Ensure unique
-            original_slug = self.slug
-            counter = 1
-            while Product.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
-                self.slug = f"{original_slug}-{counter}"
-                counter += 1
+            self.slug = allocate_slug(self.product_name, exclude_pk=self.pk)
+        loaded_discount = getattr(self, '_loaded_discount', None)
+        if self.campaign_id is not None and loaded_discount is not None and self.discount_percentage != loaded_discount:
+            # A running campaign owns the live discount; an edit replaces the
+            # one end_campaign() restores, as in pricing.reprice_products()
+            self.pre_campaign_discount = self.discount_percentage
+            self.discount_percentage = loaded_discount
         self.final_price = self.base_price * (Decimal('1') - self.discount_percentage / Decimal('100'))
+        price_changed = not self._state.adding and self.final_price != getattr(self, '_loaded_final_price', None)
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'is_low_stock' and field.attname not in deferred
+            ]
         super().save(*args, **kwargs)
+        # After post_save, so receivers can still compare against the loaded values
+        self._loaded_stock = (self.stock_quantity, self.low_stock_threshold)
+        self._loaded_discount = self.discount_percentage
+        if price_changed:
+            ProductVariant.objects.filter(product_id=self.pk).update(
+                final_price=models.Value(self.final_price) + models.F('price_adjustment')
+            )
+            self._loaded_final_price = self.final_price
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_final_price = instance.__dict__.get('final_price')
+        instance._loaded_discount = instance.__dict__.get('discount_percentage')
+        instance._loaded_stock = (instance.__dict__.get('stock_quantity'), instance.__dict__.get('low_stock_threshold'))
+        return instance
 
     def __str__(self):
         seller_name = self.seller.get_full_name() if self.seller else "Unknown Seller"
@@ -161,6 +217,8 @@ class ProductImage(models.Model):
     alt_text = models.CharField(max_length=255, blank=True)
     is_main = models.BooleanField(default=False)
     order = models.PositiveIntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the file
+    derivatives = models.JSONField(default=dict, blank=True)  # Filled in by WearUpBack.images
 
     def __str__(self):
         return f"Image for {self.product.product_name}"
@@ -173,6 +231,19 @@ class ProductVariant(models.Model):
     price_adjustment = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     stock_quantity = models.PositiveIntegerField(default=0)
     sku = models.CharField(max_length=100, unique=True, blank=True)
+    final_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)  # product.final_price + price_adjustment
+
+    def save(self, *args, **kwargs):
+        product_price = self.product.final_price
+        self.final_price = product_price + self.price_adjustment if product_price is not None else None
+        super().save(*args, **kwargs)
+        self._loaded_stock = self.stock_quantity
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stock = instance.__dict__.get('stock_quantity')
+        return instance
 
     def __str__(self):
         return f"Variant of {self.product.product_name} - {self.size} {self.color}"
@@ -328,6 +399,32 @@ class Coupon(models.Model):
         return self.code
 
 
+class PriceCampaign(models.Model):
+    STATUS_CHOICES = [
+        ('scheduled', 'Scheduled'),
+        ('active', 'Active'),
+        ('ended', 'Ended'),
+    ]
+
+    name = models.CharField(max_length=100)
+    discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, validators=[MinValueValidator(0), MaxValueValidator(100)])
+
+    # Target filters; all given filters must match
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, blank=True, null=True, help_text="Includes all subcategories")
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, related_name='price_campaigns')
+    tag = models.CharField(max_length=50, blank=True)
+
+    starts_at = models.DateTimeField(default=timezone.now)
+    ends_at = models.DateTimeField(blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='scheduled')
+
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.discount_percentage}% off)"
+
+
 class ProductView(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -339,3 +436,186 @@ class ProductView(models.Model):
 
     def __str__(self):
         return f"View of {self.product.product_name}"
+
+
+class LowStockAlert(models.Model):
+    """Queued when a product drops to its low-stock threshold; sent to the seller in a digest."""
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='low_stock_alerts', null=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='low_stock_alerts')
+    stock_quantity = models.PositiveIntegerField()  # Lowest stock (product or variant) when detected
+    threshold = models.PositiveIntegerField()
+    detected_at = models.DateTimeField(default=timezone.now)
+    notified_at = models.DateTimeField(blank=True, null=True)
+    resolved_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['notified_at', 'seller']),
+        ]
+
+    def __str__(self):
+        return f"Low stock: {self.product_id} ({self.stock_quantity}/{self.threshold})"
+
+
+# -----------------------
+# Stock ledger
+# -----------------------
+# Stock is tracked per item: a variant, or a product without one. Items are
+# keyed 'v<variant id>' / 'p<product id>' (see WearUpBack.stock_ledger.item_key).
+class StockMovement(models.Model):
+    """Append-only record of one change to an item's stock."""
+    KIND_CHOICES = [
+        ('receipt', 'Receipt'),
+        ('sale', 'Sale'),
+        ('return', 'Return'),
+        ('adjustment', 'Adjustment'),
+    ]
+
+    item = models.CharField(max_length=32)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, blank=True, null=True, related_name='stock_movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField()  # Signed change to on-hand stock
+    reference = models.CharField(max_length=100, blank=True)  # e.g. an order or delivery number
+    note = models.CharField(max_length=255, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='stock_movements')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'id']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Stock movements can't be changed; record a correcting adjustment instead")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity:+d} of {self.item}"
+
+
+class StockSnapshot(models.Model):
+    """An item's on-hand stock counting every movement up to last_movement_id."""
+    item = models.CharField(max_length=32)
+    quantity = models.IntegerField()
+    last_movement_id = models.BigIntegerField()
+    taken_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', '-last_movement_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.item}: {self.quantity} @ {self.last_movement_id}"
+
+
+# -----------------------
+# Analytics
+# -----------------------
+class ProductDailyStats(models.Model):
+    """Per-product, per-day rollup behind the seller analytics API (see WearUpBack.analytics)."""
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='product_daily_stats', null=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+
+    # Counted as they happen
+    views = models.PositiveIntegerField(default=0)
+    # Recomputed from the source tables by the rollup
+    likes = models.PositiveIntegerField(default=0)
+    add_to_carts = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='unique_product_day_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}"
+
+
+class RollupCursor(models.Model):
+    """How far an incremental rollup has read its source tables."""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+class StaleStatsDay(models.Model):
+    """A day whose rolled-up stats lost a source row; the next rollup rebuilds it."""
+    day = models.DateField(unique=True)
+
+    def __str__(self):
+        return str(self.day)
+
+
+# -----------------------
+# Background jobs
+# -----------------------
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    queue = models.CharField(max_length=50, default='default')
+    name = models.CharField(max_length=100)  # Registered handler, see WearUpBack.jobs
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'queue', 'run_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.queue}] ({self.status})"
+
+
+# -----------------------
+# Profiling
+# -----------------------
+class ProfileReport(models.Model):
+    """cProfile output and SQL log of one request a staff user asked to profile (see WearUpBack.profiling)."""
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField(default=0)
+    db_ms = models.FloatField(default=0)
+    stats = models.TextField(blank=True)  # pstats listing, by cumulative time
+    queries = models.JSONField(default=list, blank=True)  # [{sql, ms, origin}]
+    profile_file = models.CharField(max_length=255, blank=True)  # Raw .prof in the profiling storage
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,287 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Product, ProductComment, ProductImage, ProductLike, ProductShare, ProductVariant, Size
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Bounded per-process LRU with per-entry expiry."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _MISSING
+
+
+def _new_version():
+    # Versions only move forward, even if the backend evicts or loses a
+    # counter: a fresh one starts above any value handed out before.
+    return time.time_ns() // 1000
+
+
+class TieredCache:
+    """Two-tier cache for computed objects keyed by id.
+
+    Lookups check a per-process LRU, then the shared `backend` cache. Keys embed
+    a per-id version and a namespace generation kept in the shared backend. The
+    LRU also holds the versions it read for `version_ttl` seconds, so a local
+    hit costs no backend round trip. invalidate()/invalidate_all() take effect
+    at once in the calling process and within `version_ttl` in the others.
+    Recomputation is single-flight: one thread per process, and one
+    process per key (via a short backend lock), does the work while the others
+    wait for its result.
+    """
+
+    def __init__(self, namespace, ttl=300, local_ttl=30, local_size=1024, backend='objects', lock_timeout=10,
+                 version_ttl=2):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.version_ttl = version_ttl
+        self.backend_alias = backend
+        self.lock_timeout = lock_timeout
+        self.local = LocalLRU(local_size)
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.backend_alias]
+
+    def _generation_key(self):
+        return f'{self.namespace}:generation'
+
+    def _version_key(self, key_id):
+        return f'{self.namespace}:version:{key_id}'
+
+    def _versions(self, wanted):
+        """{version key: value}, from the LRU where it is fresh and otherwise in one backend round trip."""
+        versions = {}
+        for key in wanted:
+            value = self.local.get(key)
+            if value is not _MISSING:
+                versions[key] = value
+        stale = [key for key in wanted if key not in versions]
+        if not stale:
+            return versions
+        fetched = self.backend.get_many(stale)
+        missing = [key for key in stale if key not in fetched]
+        if missing:
+            for key in missing:
+                self.backend.add(key, _new_version(), None)
+            fetched.update(self.backend.get_many(missing))
+        for key, value in fetched.items():
+            self.local.set(key, value, self.version_ttl)
+        versions.update(fetched)
+        return versions
+
+    def _current_keys(self, key_ids, variant=None):
+        """{key_id: cache key for its current version}."""
+        generation_key = self._generation_key()
+        version_keys = {key_id: self._version_key(key_id) for key_id in key_ids}
+        versions = self._versions([generation_key, *version_keys.values()])
+        generation = versions.get(generation_key)
+        suffix = f':{variant}' if variant is not None else ''
+        return {
+            key_id: f'{self.namespace}:{generation}:{key_id}:{versions.get(version_key)}{suffix}'
+            for key_id, version_key in version_keys.items()
+        }
+
+    def _current_key(self, key_id, variant=None):
+        return self._current_keys([key_id], variant)[key_id]
+
+    def get_or_set(self, key_id, compute, variant=None):
+        """Return the cached value for `key_id`, computing it at most once across callers.
+
+        `variant` distinguishes representations of the same object (e.g. per
+        host); all variants share the id's version and are invalidated together.
+        """
+        key = self._current_key(key_id, variant)
+        value = self.local.get(key)
+        if value is _MISSING:
+            value = self.backend.get(key, _MISSING)
+            if value is _MISSING:
+                value = self._single_flight(key, compute)
+            self.local.set(key, value, self.local_ttl)
+        return value
+
+    def get_many(self, key_ids, compute_many):
+        """Batch lookup: {key_id: value} for every id that has or produces a value.
+
+        Misses are computed together by `compute_many(missing_ids)`, which
+        returns a dict; ids it leaves out are not cached.
+        """
+        keys = self._current_keys(set(key_ids))
+        found = {}
+        remote = {}
+        for key_id, key in keys.items():
+            value = self.local.get(key)
+            if value is _MISSING:
+                remote[key] = key_id
+            else:
+                found[key_id] = value
+
+        if remote:
+            for key, value in self.backend.get_many(list(remote)).items():
+                found[remote.pop(key)] = value
+                self.local.set(key, value, self.local_ttl)
+        if remote:
+            computed = compute_many(list(remote.values()))
+            to_store = {keys[key_id]: value for key_id, value in computed.items() if key_id in keys}
+            self.backend.set_many(to_store, self.ttl)
+            for key, value in to_store.items():
+                self.local.set(key, value, self.local_ttl)
+            found.update((key_id, value) for key_id, value in computed.items() if key_id in keys)
+        return found
+
+    def _single_flight(self, key, compute):
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait(self.lock_timeout)
+            if flight.value is not _MISSING:
+                return flight.value
+            return compute()
+
+        try:
+            flight.value = self._compute_once(key, compute)
+            return flight.value
+        finally:
+            flight.done.set()
+            with self._flights_lock:
+                self._flights.pop(key, None)
+
+    def _compute_once(self, key, compute):
+        lock_key = f'{key}:lock'
+        holding = self.backend.add(lock_key, 1, self.lock_timeout)
+        if not holding:
+            # Another process is recomputing; wait for it rather than piling on
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = self.backend.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+        try:
+            value = compute()
+            self.backend.set(key, value, self.ttl)
+            return value
+        finally:
+            if holding:
+                self.backend.delete(lock_key)
+
+    def _bump(self, key):
+        try:
+            self.backend.incr(key)
+        except ValueError:
+            self.backend.set(key, _new_version(), None)
+        self.local.delete(key)
+
+    def invalidate(self, *key_ids):
+        """Retire the cached entries for these ids, now and again once the transaction commits.
+
+        The second bump drops anything a concurrent reader recomputed from
+        pre-commit data in between.
+        """
+        key_ids = {key_id for key_id in key_ids if key_id is not None}
+        if not key_ids:
+            return
+
+        def bump():
+            for key_id in key_ids:
+                self._bump(self._version_key(key_id))
+
+        bump()
+        transaction.on_commit(bump)
+
+    def invalidate_all(self):
+        self._bump(self._generation_key())
+        transaction.on_commit(lambda: self._bump(self._generation_key()))
+
+
+# Serialized product detail payloads (without per-user fields), keyed by product id
+PRODUCT_DETAILS = TieredCache('product-detail')
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def _product_changed(sender, instance, **kwargs):
+    PRODUCT_DETAILS.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductLike)
+@receiver(post_delete, sender=ProductLike)
+@receiver(post_save, sender=ProductComment)
+@receiver(post_delete, sender=ProductComment)
+@receiver(post_save, sender=ProductShare)
+@receiver(post_delete, sender=ProductShare)
+def _product_child_changed(sender, instance, **kwargs):
+    PRODUCT_DETAILS.invalidate(instance.product_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Size)
+def _product_label_changed(sender, instance, created=False, **kwargs):
+    # A renamed category or size shows up in every product that uses it
+    if not created:
+        PRODUCT_DETAILS.invalidate(*instance.products.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=Product.sizes.through)
+def _product_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            PRODUCT_DETAILS.invalidate(instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        PRODUCT_DETAILS.invalidate(*pk_set)
+    elif action == 'pre_clear':
+        PRODUCT_DETAILS.invalidate(*instance.products.values_list('pk', flat=True))
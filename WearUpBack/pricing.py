@@ -0,0 +1,140 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+
+from .models import Category, PriceCampaign, Product, ProductVariant
+from .object_cache import PRODUCT_DETAILS
+from .storefront import STOREFRONT_STATS
+
+
+def target_products(category=None, seller=None, tag=None, queryset=None):
+    """Products matching a campaign-style filter (category subtree, seller, tag)."""
+    queryset = Product.objects.all() if queryset is None else queryset
+    if category is not None:
+        if not isinstance(category, Category):
+            category = Category.objects.get(pk=category)
+        category_ids = category.get_descendant_ids()
+        queryset = queryset.filter(
+            pk__in=Product.categories.through.objects.filter(category_id__in=category_ids).values('product_id')
+        )
+    if seller is not None:
+        queryset = queryset.filter(seller=seller)
+    if tag:
+        queryset = queryset.filter(tags__icontains=tag.strip())
+    return queryset
+
+
+def _discounted_price(discount):
+    """base_price with the given discount (a Decimal or an expression) applied, in SQL."""
+    if isinstance(discount, Decimal):
+        factor = Value(Decimal('1') - discount / Decimal('100'), output_field=DecimalField())
+    else:
+        # Multiply rather than divide: SQLite would do integer division on
+        # whole-number discounts stored with integer affinity.
+        factor = Value(Decimal('1')) - discount * Value(Decimal('0.01'))
+    return Round(F('base_price') * factor, 2, output_field=DecimalField(max_digits=10, decimal_places=2))
+
+
+def refresh_variant_prices(product_queryset):
+    """Recompute ProductVariant.final_price for the given products in one UPDATE."""
+    product_price = Product.objects.filter(pk=OuterRef('product_id')).values('final_price')[:1]
+    return ProductVariant.objects.filter(product__in=product_queryset.values('pk')).update(
+        final_price=Subquery(product_price, output_field=DecimalField()) + F('price_adjustment')
+    )
+
+
+def reprice_products(queryset, discount_percentage):
+    """Set a permanent discount on every product in the queryset.
+
+    Products in a running campaign keep the campaign price; the new discount
+    replaces the one end_campaign() restores.
+    """
+    discount = Decimal(discount_percentage)
+    pks = queryset.values('pk')
+    with transaction.atomic():
+        products = Product.objects.filter(pk__in=pks)
+        updated = products.filter(campaign__isnull=True).update(
+            discount_percentage=discount,
+            final_price=_discounted_price(discount),
+            updated_at=timezone.now(),
+        )
+        updated += products.filter(campaign__isnull=False).update(
+            pre_campaign_discount=discount,
+            updated_at=timezone.now(),
+        )
+        refresh_variant_prices(products)
+        # Bulk UPDATEs skip post_save; drop all cached payloads in one bump
+        PRODUCT_DETAILS.invalidate_all()
+        STOREFRONT_STATS.invalidate_all()
+    return updated
+
+
+def apply_campaign(campaign):
+    """Put the campaign's discount on its products and mark it active.
+
+    Products already in another running campaign are left to it, so that
+    campaign still finds and restores them when it ends.
+    """
+    unclaimed = Q(campaign__isnull=True) | Q(campaign=campaign)
+    products = target_products(campaign.category_id, campaign.seller_id, campaign.tag).filter(unclaimed)
+    pks = list(products.values_list('pk', flat=True))
+    discount = campaign.discount_percentage
+    with transaction.atomic():
+        # Assignment order matters on MySQL, which evaluates SET left to right:
+        # the product's own discount has to be stashed before it is overwritten.
+        # Re-applying a campaign keeps the stash it already made.
+        updated = Product.objects.filter(unclaimed, pk__in=pks).update(
+            pre_campaign_discount=Case(
+                When(campaign__isnull=True, then=F('discount_percentage')),
+                default=F('pre_campaign_discount'),
+            ),
+            campaign=campaign,
+            discount_percentage=discount,
+            final_price=_discounted_price(discount),
+            updated_at=timezone.now(),
+        )
+        refresh_variant_prices(Product.objects.filter(pk__in=pks))
+        PRODUCT_DETAILS.invalidate_all()
+        STOREFRONT_STATS.invalidate_all()
+        campaign.status = 'active'
+        campaign.save(update_fields=['status'])
+    return updated
+
+
+def end_campaign(campaign):
+    restored = Coalesce(F('pre_campaign_discount'), Value(Decimal('0')), output_field=DecimalField())
+    with transaction.atomic():
+        pks = list(campaign.products.values_list('pk', flat=True))
+        updated = Product.objects.filter(pk__in=pks).update(
+            campaign=None,
+            discount_percentage=restored,
+            final_price=_discounted_price(restored),
+            updated_at=timezone.now(),
+        )
+        refresh_variant_prices(Product.objects.filter(pk__in=pks))
+        PRODUCT_DETAILS.invalidate_all()
+        STOREFRONT_STATS.invalidate_all()
+        campaign.status = 'ended'
+        campaign.save(update_fields=['status'])
+    return updated
+
+
+def run_due_campaigns(now=None):
+    """Start scheduled campaigns whose window has opened and end expired ones."""
+    now = now or timezone.now()
+    ended = 0
+    for campaign in PriceCampaign.objects.filter(status='active', ends_at__lte=now):
+        end_campaign(campaign)
+        ended += 1
+    started = 0
+    for campaign in PriceCampaign.objects.filter(status='scheduled', starts_at__lte=now):
+        if campaign.ends_at and campaign.ends_at <= now:
+            campaign.status = 'ended'
+            campaign.save(update_fields=['status'])
+            continue
+        apply_campaign(campaign)
+        started += 1
+    return started, ended
@@ -0,0 +1,137 @@
+"""On-demand profiling of single requests for staff users.
+
+A staff user adds ?_profile=1 to a URL, or sends an X-Profile header, and the
+request runs under cProfile with its SQL recorded. The report is saved as a
+ProfileReport and the raw .prof file goes to local storage under
+settings.PROFILE_REPORTS_ROOT. Both are viewable in the admin, and the
+response carries the report's admin URL in X-Profile-Report. Requests without
+the flag only pay for a substring check. Staff are recognised by session or by
+JWT, since DRF authenticates only inside the view.
+
+cProfile sees only the thread the view runs on, so for async views the
+profile and SQL log cover just the synchronous part of the request.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .models import ProfileReport
+from .query_log import QueryLog
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+TOP_FUNCTIONS = 80
+
+
+def profile_storage():
+    return FileSystemStorage(location=getattr(settings, 'PROFILE_REPORTS_ROOT', settings.BASE_DIR / 'profiles'))
+
+
+def _wants_profile(request):
+    if PROFILE_HEADER in request.META:
+        return True
+    return PROFILE_PARAM in request.META.get('QUERY_STRING', '') and PROFILE_PARAM in request.GET
+
+
+def _staff_user(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user if user.is_staff else None
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except (InvalidToken, TokenError):
+        return None
+    if authenticated and authenticated[0].is_staff:
+        return authenticated[0]
+    return None
+
+
+def save_report(request, response, user, profiler, log, seconds):
+    """Store the profile and SQL log of a finished request; returns the ProfileReport."""
+    listing = io.StringIO()
+    pstats.Stats(profiler, stream=listing).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    profiler.create_stats()
+
+    match = getattr(request, 'resolver_match', None)
+    view_name = match.view_name if match else ''
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S-%f')
+    name = profile_storage().save(f"{stamp}-{view_name or 'unmatched'}.prof", ContentFile(marshal.dumps(profiler.stats)))
+
+    report = ProfileReport.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:500],
+        view_name=view_name[:200],
+        user=user,
+        status_code=response.status_code,
+        duration_ms=round(seconds * 1000, 2),
+        query_count=len(log),
+        db_ms=round(log.seconds * 1000, 2),
+        stats=listing.getvalue(),
+        queries=[
+            {'sql': query['sql'], 'ms': round(query['seconds'] * 1000, 3), 'origin': query['origin']}
+            for query in log.queries
+        ],
+        profile_file=name,
+    )
+    prune_reports()
+    return report
+
+
+def prune_reports(keep=None):
+    """Delete all but the newest `keep` reports (settings.PROFILE_REPORTS_KEEP); their files go with them."""
+    keep = keep if keep is not None else getattr(settings, 'PROFILE_REPORTS_KEEP', 200)
+    for report in ProfileReport.objects.order_by('-created_at', '-pk')[keep:]:
+        report.delete()
+
+
+@receiver(post_delete, sender=ProfileReport)
+def _report_deleted(sender, instance, **kwargs):
+    if instance.profile_file:
+        profile_storage().delete(instance.profile_file)
+
+
+class ProfilingMiddleware:
+    """Profiles requests from staff users that ask for it; see the module docstring.
+
+    Goes after AuthenticationMiddleware, so session users are known.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _wants_profile(request):
+            return self.get_response(request)
+        user = _staff_user(request)
+        if user is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return self.get_response(request)
+        started = time.perf_counter()
+        try:
+            with QueryLog() as log:
+                response = self.get_response(request)
+        finally:
+            profiler.disable()
+        seconds = time.perf_counter() - started
+
+        report = save_report(request, response, user, profiler, log, seconds)
+        response['X-Profile-Report'] = reverse('admin:WearUpBack_profilereport_change', args=[report.pk])
+        return response
@@ -0,0 +1,97 @@
+"""Record the SQL a block of code runs, and which app code issued each query.
+
+Used by the endpoint query-budget tests to name the serializer method behind
+an N+1, and by request instrumentation to attribute slow queries.
+"""
+import os
+import sys
+import time
+from collections import Counter
+
+from django.db import connections
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIPPED = (os.path.abspath(__file__), os.path.join(APP_DIR, 'tests.py'))
+# App frames that wrap every request and so say nothing about a query
+_PLUMBING = ('db_routing.py', 'instrumentation.py')
+
+
+def _app_object(frame):
+    """The app serializer or view a framework frame is working for, if any."""
+    owner = frame.f_locals.get('self')
+    owner = getattr(owner, 'child', owner)  # ListSerializer -> its item serializer
+    if type(owner).__module__.startswith(f'{__package__}.'):
+        return owner
+    return None
+
+
+def query_origin():
+    """Where the current query comes from, e.g. 'serializers.py:78 in ProductSerializer.get_sizes'.
+
+    In order of preference: the innermost serializer method in this app, an
+    app serializer being rendered by DRF (a lazy queryset evaluated there),
+    the innermost other app frame, then the app view DRF is dispatching to.
+    """
+    frame = sys._getframe(1)
+    rendering = app_frame = view = plumbing = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR):
+            if filename not in _SKIPPED:
+                label = f'{os.path.relpath(filename, APP_DIR)}:{frame.f_lineno} in {frame.f_code.co_qualname}'
+                if os.path.basename(filename) == 'serializers.py':
+                    return label
+                if os.path.basename(filename) in _PLUMBING:
+                    plumbing = plumbing or label
+                else:
+                    app_frame = app_frame or label
+        elif 'rest_framework' in filename and (rendering is None or view is None):
+            owner = _app_object(frame)
+            if owner is not None and frame.f_code.co_name == 'to_representation':
+                rendering = rendering or f'{type(owner).__name__} rendered by {frame.f_code.co_qualname}'
+            elif owner is not None and frame.f_code.co_name == 'dispatch':
+                handler = getattr(owner, 'action', None) or getattr(getattr(owner, 'request', None), 'method', '').lower()
+                view = view or f'{type(owner).__name__}.{handler}'
+        frame = frame.f_back
+    return rendering or app_frame or view or plumbing or 'outside WearUpBack'
+
+
+class QueryLog:
+    """Context manager that records {sql, seconds, origin} for every query on the given aliases."""
+
+    def __init__(self, using=None):
+        self.aliases = [using] if isinstance(using, str) else list(using or connections)
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'seconds': time.perf_counter() - started,
+                'origin': query_origin(),
+            })
+
+    def __enter__(self):
+        for alias in self.aliases:
+            connections[alias].execute_wrappers.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        for alias in self.aliases:
+            wrappers = connections[alias].execute_wrappers
+            if self in wrappers:
+                wrappers.remove(self)
+
+    def __len__(self):
+        return len(self.queries)
+
+    @property
+    def seconds(self):
+        return sum(query['seconds'] for query in self.queries)
+
+    def by_origin(self):
+        """[(origin, query count)], busiest first."""
+        return Counter(query['origin'] for query in self.queries).most_common()
@@ -0,0 +1,114 @@
+import threading
+import time
+
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Color, Size
+
+
+class NameIdCache:
+    """Process-wide name -> id map for a small lookup table (sizes, categories, colors).
+
+    Dropped on any save/delete of the model in this process; the TTL bounds how
+    long another process can keep serving a stale map.
+    """
+
+    def __init__(self, model, ttl=300):
+        self.model = model
+        self.ttl = ttl
+        self._ids = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _mapping(self):
+        with self._lock:
+            if self._ids is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._ids = dict(self.model.objects.values_list('name', 'id'))
+                self._loaded_at = time.monotonic()
+            return self._ids
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+
+    def ids_for(self, names, create=True):
+        """Return {name: id} for the given names, bulk-creating missing ones if asked.
+
+        Keys are the names as given. Under a case-insensitive collation
+        (MySQL's default) the database may answer for 'm' with the existing
+        'M' row; such names map to that row's id. Names left out of the
+        result matched nothing.
+        """
+        names = {str(name).strip() for name in names if name is not None and str(name).strip()}
+        ids = self._mapping()
+        missing = names - ids.keys()
+        if missing:
+            if create:
+                self.model.objects.bulk_create([self.model(name=name) for name in missing], ignore_conflicts=True)
+            rows = dict(self.model.objects.filter(name__in=missing).values_list('name', 'id'))
+            folded = {}
+            for name, pk in rows.items():
+                folded.setdefault(name.casefold(), pk)
+            found = {name: rows.get(name, folded.get(name.casefold())) for name in missing}
+            found = {name: pk for name, pk in found.items() if pk is not None}
+            with self._lock:
+                if self._ids is not None:
+                    self._ids.update(found)
+            ids = {**ids, **found}
+        return {name: ids[name] for name in names if name in ids}
+
+
+SIZES = NameIdCache(Size)
+CATEGORIES = NameIdCache(Category)
+COLORS = NameIdCache(Color)
+
+_CACHES = {Size: SIZES, Category: CATEGORIES, Color: COLORS}
+
+
+@receiver(post_save, sender=Size)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Size)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Color)
+def _reference_data_changed(sender, **kwargs):
+    _CACHES[sender].invalidate()
+
+
+def sync_m2m(instance, field_name, target_ids):
+    """Make a forward M2M relation hold exactly `target_ids`.
+
+    Reads the current ids once and issues at most one bulk insert and one bulk
+    delete, instead of clear() followed by an add() per item. m2m_changed is
+    still sent so receivers see the change.
+    """
+    field = instance._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = field.m2m_field_name() + '_id'
+    target = field.m2m_reverse_field_name() + '_id'
+    related_model = field.related_model
+    db = router.db_for_write(through, instance=instance)
+
+    target_ids = set(target_ids)
+    current = set(through.objects.using(db).filter(**{source: instance.pk}).values_list(target, flat=True))
+    to_add = target_ids - current
+    to_remove = current - target_ids
+
+    if not to_add and not to_remove:
+        return to_add, to_remove
+
+    signal_kwargs = {'sender': through, 'instance': instance, 'reverse': False, 'model': related_model, 'using': db}
+    with transaction.atomic(using=db):
+        if to_remove:
+            m2m_changed.send(action='pre_remove', pk_set=to_remove, **signal_kwargs)
+            through.objects.using(db).filter(**{source: instance.pk, f'{target}__in': to_remove}).delete()
+            m2m_changed.send(action='post_remove', pk_set=to_remove, **signal_kwargs)
+        if to_add:
+            m2m_changed.send(action='pre_add', pk_set=to_add, **signal_kwargs)
+            through.objects.using(db).bulk_create(
+                [through(**{source: instance.pk, target: pk}) for pk in to_add], ignore_conflicts=True
+            )
+            m2m_changed.send(action='post_add', pk_set=to_add, **signal_kwargs)
+    return to_add, to_remove
@@ -0,0 +1,151 @@
+"""Refresh-token revocation checks that skip the database for live tokens.
+
+Each worker keeps a Bloom filter of the unexpired blacklisted token ids,
+rebuilt from the database every settings.REVOCATION_SNAPSHOT_SECONDS. A
+token the filter has never seen is not revoked, so the common case costs no
+query. A hit may be a false positive (about 1 in 1000), and is confirmed
+against the blacklist table.
+
+Tokens blacklisted after a worker's snapshot was taken are covered by a
+`revoked:<jti>` key in the default cache, set when the BlacklistedToken row
+is saved. The key outlives the snapshots that could have missed the token.
+Workers sharing a cache see a logout at once; others see it at their next
+rebuild. Rows added with bulk_create or raw SQL skip the signal and wait
+for the rebuild too.
+
+purge_expired_tokens() deletes expired outstanding and blacklisted tokens
+in small batches, so the tables stop growing and snapshots stay small.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+FALSE_POSITIVE_RATE = 0.001
+# Filters start at this size; a sparse filter costs memory but no accuracy
+MIN_CAPACITY = 1024
+
+
+def snapshot_seconds():
+    return getattr(settings, 'REVOCATION_SNAPSHOT_SECONDS', 60)
+
+
+def _revoked_key(jti):
+    return f'revoked:{jti}'
+
+
+class BloomFilter:
+    """A fixed-size set of strings that answers "maybe" or "definitely not"."""
+
+    def __init__(self, capacity, error_rate=FALSE_POSITIVE_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationSnapshot:
+    """The worker's Bloom filter of blacklisted token ids; see the module docstring."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.filter = None
+            self.built = None
+
+    def rebuild(self):
+        started = time.monotonic()
+        jtis = list(
+            BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+            .values_list('token__jti', flat=True).iterator()
+        )
+        bloom = BloomFilter(max(2 * len(jtis), MIN_CAPACITY))
+        for jti in jtis:
+            bloom.add(jti)
+        self.filter, self.built = bloom, started
+        return len(jtis)
+
+    def _current(self):
+        if self.filter is None:
+            with self._lock:
+                if self.filter is None:
+                    self.rebuild()
+        elif time.monotonic() - self.built >= snapshot_seconds() and self._lock.acquire(blocking=False):
+            # One thread rebuilds; the others keep using the old filter meanwhile
+            try:
+                self.rebuild()
+            finally:
+                self._lock.release()
+        return self.filter
+
+    def add(self, jti):
+        if self.filter is not None:
+            self.filter.add(jti)
+
+    def might_be_revoked(self, jti):
+        return jti in self._current() or cache.get(_revoked_key(jti)) is not None
+
+
+REVOKED_TOKENS = RevocationSnapshot()
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def _token_blacklisted(sender, instance, created, **kwargs):
+    if not created:
+        return
+    jti = instance.token.jti
+    REVOKED_TOKENS.add(jti)
+    # Long enough for every worker's next snapshot to include the token
+    cache.set(_revoked_key(jti), True, 2 * snapshot_seconds() + 60)
+
+
+def purge_expired_tokens(batch_size=1000, sleep=0, log=None):
+    """Delete outstanding tokens that expired, with their blacklist entries, one short transaction per batch.
+
+    Walks the primary key so no batch rescans rows an earlier one kept.
+    Returns the number of outstanding tokens deleted.
+    """
+    now = timezone.now()
+    last_pk = 0
+    total = 0
+    while True:
+        batch = list(
+            OutstandingToken.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'expires_at')[:batch_size]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        expired = [pk for pk, expires_at in batch if expires_at <= now]
+        if expired:
+            with transaction.atomic():
+                BlacklistedToken.objects.filter(token_id__in=expired).delete()
+                OutstandingToken.objects.filter(pk__in=expired).delete()
+            total += len(expired)
+            if log:
+                log(f"Deleted {total} expired token(s) (up to id {last_pk})")
+            if sleep:
+                time.sleep(sleep)
+    return total
@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserProfile
+from .object_cache import TieredCache
+
+# {id, avatar, name, handle, verified} summaries embedded in product payloads
+SELLER_CARDS = TieredCache('seller-card', ttl=3600)
+
+
+def default_avatar(username):
+    return f'https://ui-avatars.com/api/?name={username}&size=40&background=667eea&color=fff'
+
+
+def build_seller_card(user):
+    try:
+        profile = user.profile
+    except UserProfile.DoesNotExist:
+        profile = None
+    return {
+        'id': user.id,
+        'avatar': profile.profile_image.url if profile and profile.profile_image else default_avatar(user.username),
+        'name': (user.get_full_name() or user.username) if profile else user.username,
+        'handle': f'@{user.username}',
+        'verified': profile is not None and profile.role in ['seller', 'admin'],
+    }
+
+
+def _build_cards(user_ids):
+    users = User.objects.filter(pk__in=user_ids).select_related('profile')
+    return {user.pk: build_seller_card(user) for user in users}
+
+
+def seller_cards(user_ids):
+    """Cards for a page of sellers, {user_id: card}; at most one query for the misses."""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    return SELLER_CARDS.get_many(user_ids, _build_cards) if user_ids else {}
+
+
+def seller_card(user_id):
+    return seller_cards([user_id]).get(user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _user_changed(sender, instance, **kwargs):
+    SELLER_CARDS.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def _profile_changed(sender, instance, **kwargs):
+    SELLER_CARDS.invalidate(instance.user_id)
@@ -1,18 +1,38 @@
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
+from django.db import models
 import json
-from django.contrib.auth.models import User
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.contrib.auth.models import AnonymousUser, User
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
+from .auth_backends import LoginThrottled, users_with_email
 from .models import (
     Product, Size, Category, Color, ProductImage, ProductVariant, UserProfile, Address,
-    Cart, CartItem, Order, OrderItem, ProductLike, ProductComment, ProductShare
+    Cart, CartItem, Order, OrderItem, ProductLike, ProductComment, ProductShare, PriceCampaign
 )
+from .images import srcset, update_product_images
+from .object_cache import PRODUCT_DETAILS
+from .reference_data import CATEGORIES, SIZES, sync_m2m
+from .seller_cards import seller_card, seller_cards
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
+    def get_srcset(self, obj):
+        return srcset(obj.derivatives, obj.image.storage)
+
     class Meta:
         model = ProductImage
-        fields = ['image', 'is_main']
+        fields = ['id', 'image', 'is_main', 'order', 'srcset']
+
+
+class ProductListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.context['seller_cards'] = seller_cards(item.seller_id for item in items)
+        return super().to_representation(items)
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -26,6 +46,7 @@ class ProductSerializer(serializers.ModelSerializer):
     name = serializers.CharField(source='product_name', read_only=True)
     price = serializers.DecimalField(source='final_price', max_digits=10, decimal_places=2, read_only=True)
     image = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     category = serializers.SerializerMethodField()
     rating = serializers.DecimalField(source='average_rating', max_digits=3, decimal_places=1, read_only=True)
     likes = serializers.SerializerMethodField()
@@ -33,6 +54,27 @@ class ProductSerializer(serializers.ModelSerializer):
     shares = serializers.SerializerMethodField()
     user_liked = serializers.SerializerMethodField()
 
+    @staticmethod
+    def setup_eager_loading(queryset, user=None):
+        """Fetch everything the read fields need up front: related rows are
+        prefetched and the engagement counters come back as annotations."""
+        def count(model):
+            rows = model.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(n=Count('pk')).values('n')
+            return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+        queryset = queryset.prefetch_related(
+            'images', 'categories', 'variants__size'
+        ).annotate(
+            likes_count=count(ProductLike),
+            comments_count=count(ProductComment),
+            shares_count=count(ProductShare),
+        )
+        if user is not None and user.is_authenticated:
+            queryset = queryset.annotate(
+                user_liked_flag=Exists(ProductLike.objects.filter(product=OuterRef('pk'), user_id=user.pk))
+            )
+        return queryset
+
     def get_sizes(self, obj):
         variants = obj.variants.all()
         return list(set([v.size.name for v in variants if v.size]))
@@ -40,65 +82,67 @@ class ProductSerializer(serializers.ModelSerializer):
     def get_categories(self, obj):
         return [category.name for category in obj.categories.all()]
 
+    def _sorted_images(self, obj):
+        # Sorting in Python keeps a prefetched images cache usable
+        if not hasattr(obj, '_sorted_images_cache'):
+            obj._sorted_images_cache = sorted(obj.images.all(), key=lambda image: (image.order, image.pk))
+        return obj._sorted_images_cache
+
     def get_images(self, obj):
-        return ProductImageSerializer(obj.images.all(), many=True).data
+        return ProductImageSerializer(self._sorted_images(obj), many=True).data
+
+    def _main_image(self, obj):
+        images = self._sorted_images(obj)
+        return next((image for image in images if image.is_main), images[0] if images else None)
 
     def get_image(self, obj):
-        main_image = obj.images.filter(is_main=True).first()
-        if main_image:
-            return main_image.image.url
-        first_image = obj.images.first()
-        if first_image:
-            return first_image.image.url
-        return None
+        main_image = self._main_image(obj)
+        return main_image.image.url if main_image else None
+
+    def get_image_srcset(self, obj):
+        main_image = self._main_image(obj)
+        return srcset(main_image.derivatives, main_image.image.storage) if main_image else None
 
     def get_category(self, obj):
-        first_category = obj.categories.first()
-        return first_category.name if first_category else None
+        categories = sorted(obj.categories.all(), key=lambda category: category.pk)
+        return categories[0].name if categories else None
 
     def get_likes(self, obj):
+        if hasattr(obj, 'likes_count'):
+            return obj.likes_count
         return obj.liked_by.count()
 
     def get_comments(self, obj):
+        if hasattr(obj, 'comments_count'):
+            return obj.comments_count
         return obj.comments.count()
 
     def get_shares(self, obj):
+        if hasattr(obj, 'shares_count'):
+            return obj.shares_count
         return obj.shared_by.count()
 
     def get_user_liked(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
+            if hasattr(obj, 'user_liked_flag'):
+                return obj.user_liked_flag
             return obj.liked_by.filter(user=request.user).exists()
         return False
 
     def get_seller(self, obj):
-        if obj.seller:
-            try:
-                profile = obj.seller.profile
-                avatar = profile.profile_image.url if profile.profile_image else f'https://ui-avatars.com/api/?name={obj.seller.username}&size=40&background=667eea&color=fff'
-                name = obj.seller.get_full_name() or obj.seller.username
-                handle = f'@{obj.seller.username}'
-                verified = profile.role in ['seller', 'admin']
-                return {
-                    'id': obj.seller.id,
-                    'avatar': avatar,
-                    'name': name,
-                    'handle': handle,
-                    'verified': verified
-                }
-            except UserProfile.DoesNotExist:
-                return {
-                    'id': obj.seller.id,
-                    'avatar': f'https://ui-avatars.com/api/?name={obj.seller.username}&size=40&background=667eea&color=fff',
-                    'name': obj.seller.username,
-                    'handle': f'@{obj.seller.username}',
-                    'verified': False
-                }
-        return None
+        if not obj.seller_id:
+            return None
+        # ProductListSerializer fetches the whole page's cards in one go
+        cards = self.context.get('seller_cards')
+        if cards is None or obj.seller_id not in cards:
+            return seller_card(obj.seller_id)
+        return cards[obj.seller_id]
 
     class Meta:
         model = Product
-        fields = ['id', 'product_name', 'description', 'gender', 'stock_quantity', 'sizes', 'categories', 'tags', 'base_price', 'discount_percentage', 'final_price', 'sku', 'status', 'is_featured', 'views', 'average_rating', 'main_image', 'additional_images', 'images', 'base_price_input', 'price', 'seller', 'name', 'image', 'category', 'rating', 'likes', 'comments', 'shares', 'user_liked']
+        list_serializer_class = ProductListSerializer
+        fields = ['id', 'product_name', 'description', 'gender', 'stock_quantity', 'sizes', 'categories', 'tags', 'base_price', 'discount_percentage', 'final_price', 'sku', 'status', 'is_featured', 'views', 'average_rating', 'main_image', 'additional_images', 'images', 'base_price_input', 'price', 'seller', 'name', 'image', 'image_srcset', 'category', 'rating', 'likes', 'comments', 'shares', 'user_liked']
 
     def create(self, validated_data):
         main_image = validated_data.pop('main_image', None)
@@ -109,33 +153,30 @@ class ProductSerializer(serializers.ModelSerializer):
 
         product = Product.objects.create(**validated_data)
 
-        for size_name in sizes_data:
-            size, created = Size.objects.get_or_create(name=size_name)
-            product.sizes.add(size)
-
-        for category_name in categories_data:
-            category, created = Category.objects.get_or_create(name=category_name)
-            product.categories.add(category)
+        sync_m2m(product, 'sizes', SIZES.ids_for(sizes_data).values())
+        sync_m2m(product, 'categories', CATEGORIES.ids_for(categories_data).values())
 
-        if main_image:
-            ProductImage.objects.create(product=product, image=main_image, is_main=True)
-
-        for img in additional_images:
-            ProductImage.objects.create(product=product, image=img, is_main=False)
+        update_product_images(product, main_image=main_image, additional_images=additional_images)
 
         return product
 
+    def _json_list(self, key):
+        value = self.initial_data.get(key)
+        if not value:
+            return []
+        try:
+            value = json.loads(value) if isinstance(value, str) else value
+        except (json.JSONDecodeError, ValueError):
+            return []
+        return [item for item in value if str(item).isdigit()] if isinstance(value, list) else []
+
     def update(self, instance, validated_data):
         # Only update sizes/categories if provided in the request
         if 'sizes' in self.initial_data and self.initial_data['sizes']:
             try:
                 sizes_data = json.loads(self.initial_data['sizes'])
                 if isinstance(sizes_data, list):
-                    instance.sizes.clear()
-                    for size_name in sizes_data:
-                        if size_name:  # Skip empty strings
-                            size, created = Size.objects.get_or_create(name=size_name)
-                            instance.sizes.add(size)
+                    sync_m2m(instance, 'sizes', SIZES.ids_for(sizes_data).values())
             except (json.JSONDecodeError, ValueError):
                 # Log error if needed, but continue without updating sizes
                 pass
@@ -144,11 +185,7 @@ class ProductSerializer(serializers.ModelSerializer):
             try:
                 categories_data = json.loads(self.initial_data['categories'])
                 if isinstance(categories_data, list):
-                    instance.categories.clear()
-                    for category_name in categories_data:
-                        if category_name:  # Skip empty strings
-                            category, created = Category.objects.get_or_create(name=category_name)
-                            instance.categories.add(category)
+                    sync_m2m(instance, 'categories', CATEGORIES.ids_for(categories_data).values())
             except (json.JSONDecodeError, ValueError):
                 # Log error if needed, but continue without updating categories
                 pass
@@ -158,28 +195,61 @@ class ProductSerializer(serializers.ModelSerializer):
 
         instance = super().update(instance, validated_data)
 
-        # Only update images if new ones are provided
-        if main_image is not None or additional_images:
+        # Images are changed incrementally: uploads are added (deduplicated by
+        # content), and existing rows are only touched when asked to
+        remove_ids = self._json_list('remove_images')
+        order_ids = self._json_list('image_order')
+        main_image_id = self.initial_data.get('main_image_id')
+        if main_image is not None or additional_images or remove_ids or order_ids or main_image_id:
             try:
-                # Delete only if updating images
-                if main_image is not None or additional_images:
-                    # Set existing main image to non-main if new main provided
-                    if main_image:
-                        instance.images.filter(is_main=True).update(is_main=False)
-                    instance.images.all().delete()  # Still delete to recreate, but only if changing
-                    if main_image:
-                        ProductImage.objects.create(product=instance, image=main_image, is_main=True)
-                    for img in additional_images:
-                        ProductImage.objects.create(product=instance, image=img, is_main=False)
+                update_product_images(
+                    instance,
+                    main_image=main_image,
+                    additional_images=additional_images,
+                    remove_ids=remove_ids,
+                    order_ids=order_ids,
+                    main_image_id=main_image_id,
+                )
             except Exception as e:
                 # Log the error, but don't fail the entire update
                 print(f"Image update error: {e}")
-                pass
 
         instance.save()
         return instance
 
 
+class _SharedRequest:
+    """Request stand-in for payloads shared between users: absolute URLs, no user."""
+
+    user = AnonymousUser()
+
+    def __init__(self, request):
+        self._request = request
+
+    def build_absolute_uri(self, location=None):
+        return self._request.build_absolute_uri(location)
+
+
+def cached_product_detail(product_id, request=None):
+    """Detail payload for a product, shared by every user.
+
+    Per-user fields are not cached: user_liked is always False here and the
+    caller fills it in. Raises Product.DoesNotExist for unknown ids.
+    """
+    def build():
+        product = ProductSerializer.setup_eager_loading(Product.objects.filter(pk=product_id)).get()
+        context = {'request': _SharedRequest(request)} if request is not None else {}
+        return ProductSerializer(product, context=context).data
+
+    # Image URLs are absolute when there is a request, so keep one copy per host
+    host = request.get_host() if request is not None else None
+    data = PRODUCT_DETAILS.get_or_set(product_id, build, variant=host)
+    # The seller card has its own cache and invalidation; take the current one
+    if data.get('seller'):
+        data = {**data, 'seller': seller_card(data['seller']['id']) or data['seller']}
+    return data
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -187,12 +257,26 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class RegisterSerializer(serializers.ModelSerializer):
+    EMAIL_TAKEN = 'A user with this email already exists.'
+
     password = serializers.CharField(write_only=True)
 
     class Meta:
         model = User
         fields = ['username', 'email', 'password', 'first_name', 'last_name']
 
+    def validate_email(self, value):
+        if value and users_with_email(value).exists():
+            raise serializers.ValidationError(self.EMAIL_TAKEN)
+        return value
+
+    def duplicate_errors(self):
+        """The errors validation would have given, for a user created after it ran."""
+        email = self.validated_data.get('email')
+        if email and users_with_email(email).exists():
+            return {'email': [self.EMAIL_TAKEN]}
+        return {'username': ['A user with that username already exists.']}
+
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
         UserProfile.objects.create(user=user)
@@ -208,10 +292,9 @@ class LoginSerializer(serializers.Serializer):
         password = data.get('password')
         if email and password:
             try:
-                user = User.objects.get(email=email)
-                user = authenticate(username=user.username, password=password)
-            except User.DoesNotExist:
-                user = None
+                user = authenticate(self.context.get('request'), email=email, password=password)
+            except LoginThrottled as e:
+                raise exceptions.Throttled(wait=e.wait)
             if user:
                 if user.is_active:
                     data['user'] = user
@@ -224,13 +307,51 @@ class LoginSerializer(serializers.Serializer):
         return data
 
 
+class BulkRepriceSerializer(serializers.Serializer):
+    discount_percentage = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=100)
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False, allow_null=True)
+    seller = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False, allow_null=True)
+    tag = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    name = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    starts_at = serializers.DateTimeField(required=False, allow_null=True)
+    ends_at = serializers.DateTimeField(required=False, allow_null=True)
+
+    def validate(self, data):
+        starts_at = data.get('starts_at')
+        ends_at = data.get('ends_at')
+        if starts_at and ends_at and ends_at <= starts_at:
+            raise serializers.ValidationError('ends_at must be after starts_at.')
+        return data
+
+
+class PriceCampaignSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PriceCampaign
+        fields = ['id', 'name', 'discount_percentage', 'category', 'seller', 'tag', 'starts_at', 'ends_at', 'status', 'created_at']
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
+    profile_image_srcset = serializers.SerializerMethodField()
+    cover_image_srcset = serializers.SerializerMethodField()
+
+    def get_profile_image_srcset(self, obj):
+        return srcset(obj.profile_image_derivatives, obj.profile_image.storage)
+
+    def get_cover_image_srcset(self, obj):
+        return srcset(obj.cover_image_derivatives, obj.cover_image.storage)
 
     class Meta:
         model = UserProfile
-        fields = ['user', 'role', 'bio', 'location', 'website', 'business_name', 'profile_image', 'cover_image', 'phone', 'alternate_email', 'date_of_birth', 'gender']
+        fields = ['user', 'role', 'bio', 'location', 'website', 'business_name', 'profile_image', 'cover_image', 'profile_image_srcset', 'cover_image_srcset', 'phone', 'alternate_email', 'date_of_birth', 'gender']
+
+
+
+class PublicProfileSerializer(UserProfileSerializer):
+    """UserProfileSerializer without the owner-only contact and personal fields."""
 
+    class Meta(UserProfileSerializer.Meta):
+        fields = ['user', 'role', 'bio', 'location', 'website', 'business_name', 'profile_image', 'cover_image', 'profile_image_srcset', 'cover_image_srcset']
 
 # class WishlistSerializer(serializers.ModelSerializer):
 #     class Meta:
@@ -255,9 +376,8 @@ class ProductCommentSerializer(serializers.ModelSerializer):
     replies = serializers.SerializerMethodField()
 
     def get_replies(self, obj):
-        if obj.replies.exists():
-            return ProductCommentSerializer(obj.replies.all(), many=True).data
-        return []
+        # .all() uses prefetched replies when the caller loaded them
+        return ProductCommentSerializer(obj.replies.all(), many=True).data
 
     class Meta:
         model = ProductComment
@@ -294,7 +414,7 @@ class OrderSerializer(serializers.ModelSerializer):
     order_items = serializers.SerializerMethodField()
 
     def get_order_items(self, obj):
-        return OrderItemSerializer(obj.order_items.all(), many=True).data
+        return OrderItemSerializer(obj.items.all(), many=True).data
 
     class Meta:
         model = Order
@@ -0,0 +1,65 @@
+import re
+
+from django.db.models import Q
+from django.utils.text import slugify
+
+SLUG_MAX_LENGTH = 50
+# Room left at the end of the slug for a "-<counter>" suffix
+SUFFIX_RESERVE = 8
+
+
+def slug_base(name):
+    base = slugify(name)[:SLUG_MAX_LENGTH - SUFFIX_RESERVE].strip('-')
+    return base or 'product'
+
+
+def _next_counter(base, slugs):
+    """0 if `base` itself is free, otherwise one past the highest "-N" suffix in use."""
+    pattern = re.compile(rf'^{re.escape(base)}(?:-(\d+))?$')
+    highest = None
+    for slug in slugs:
+        match = pattern.match(slug)
+        if match:
+            suffix = int(match.group(1) or 0)
+            highest = suffix if highest is None else max(highest, suffix)
+    return 0 if highest is None else highest + 1
+
+
+class SlugAllocator:
+    """Hands out unique product slugs with one query per batch of names.
+
+    Existing slugs sharing a base are read once with ``slug LIKE 'base%'``;
+    collisions inside the batch are then resolved in memory. Create one
+    allocator per batch/transaction so it never works from stale counters.
+    """
+
+    def __init__(self, queryset=None):
+        from .models import Product
+        self.queryset = Product.objects.all() if queryset is None else queryset
+        self._counters = {}
+
+    def prefetch(self, bases):
+        bases = {base for base in bases if base not in self._counters}
+        if not bases:
+            return
+        query = Q()
+        for base in bases:
+            query |= Q(slug__startswith=base)
+        slugs = list(self.queryset.filter(query).values_list('slug', flat=True))
+        for base in bases:
+            self._counters[base] = _next_counter(base, slugs)
+
+    def allocate(self, name):
+        base = slug_base(name)
+        self.prefetch([base])
+        counter = self._counters[base]
+        self._counters[base] = counter + 1
+        return base if counter == 0 else f'{base}-{counter}'
+
+
+def allocate_slug(name, exclude_pk=None):
+    from .models import Product
+    queryset = Product.objects.all()
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return SlugAllocator(queryset).allocate(name)
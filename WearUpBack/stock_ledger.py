@@ -0,0 +1,299 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .inventory import refresh_low_stock, set_stock_levels
+from .jobs import job
+from .models import Product, ProductVariant, RollupCursor, StockMovement, StockSnapshot
+from .object_cache import PRODUCT_DETAILS
+
+SNAPSHOT_CURSOR = 'stock-snapshots'
+# Movements younger than this wait for the next snapshot: a transaction still
+# open when a snapshot is taken can commit an id below ones it already covers.
+# verify_stock_ledger catches (and --rebuild repairs) any that take longer.
+SNAPSHOT_LAG = timedelta(minutes=5)
+CHUNK_SIZE = 1000
+# Sign each kind of movement must have; adjustments can go either way
+KIND_SIGNS = {'receipt': 1, 'sale': -1, 'return': 1}
+KINDS = {kind for kind, _ in StockMovement.KIND_CHOICES}
+
+
+def item_key(product_id, variant_id=None):
+    """Ledger key of a stock item: the variant if there is one, else the product."""
+    return f'v{variant_id}' if variant_id is not None else f'p{product_id}'
+
+
+def _split(items):
+    """({product_id: item}, {variant_id: item})."""
+    products, variants = {}, {}
+    for item in items:
+        (variants if item[0] == 'v' else products)[int(item[1:])] = item
+    return products, variants
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def record_movements(movements):
+    """Append unsaved StockMovements to the ledger.
+
+    Relative changes (receipts, sales, returns) go straight in, without
+    locking the items' rows; the snapshot run settles stock_quantity.
+    """
+    for movement in movements:
+        if movement.kind not in KINDS:
+            raise ValueError(f'Unknown stock movement kind: {movement.kind}')
+        sign = KIND_SIGNS.get(movement.kind)
+        if not movement.quantity or (sign and movement.quantity * sign < 0):
+            expected = {1: 'positive', -1: 'negative'}.get(sign, 'non-zero')
+            raise ValueError(f'{movement.kind} quantities must be {expected}')
+        movement.item = item_key(movement.product_id, movement.variant_id)
+
+    if movements:
+        StockMovement.objects.bulk_create(movements, batch_size=CHUNK_SIZE)
+    return movements
+
+
+def record_movement(product_id, kind, quantity, variant_id=None, reference='', note='', user=None):
+    """Append one movement; `quantity` is the signed change (negative for sales)."""
+    movement = StockMovement(
+        product_id=product_id, variant_id=variant_id, kind=kind, quantity=quantity,
+        reference=reference, note=note, created_by=user,
+    )
+    return record_movements([movement])[0]
+
+
+def _latest_snapshots(items):
+    """{item: (quantity, last_movement_id)} from each item's newest snapshot."""
+    snapshots = StockSnapshot.objects.filter(item__in=items)
+    latest = dict(snapshots.values('item').order_by().annotate(last=Max('last_movement_id')).values_list('item', 'last'))
+    rows = snapshots.filter(last_movement_id__in=set(latest.values())).order_by('pk')
+    return {
+        item: (quantity, last)
+        for item, last, quantity in rows.values_list('item', 'last_movement_id', 'quantity')
+        if latest[item] == last
+    }
+
+
+def _movement_sums(after, upto=None):
+    """{item: summed quantity} of each item's movements with ids above after[item] (and up to upto)."""
+    by_position = {}
+    for item, position in after.items():
+        by_position.setdefault(position, []).append(item)
+    if not by_position:
+        return {}
+    condition = Q()
+    for position, items in by_position.items():
+        condition |= Q(item__in=items, id__gt=position)
+    movements = StockMovement.objects.filter(condition)
+    if upto is not None:
+        movements = movements.filter(id__lte=upto)
+    return dict(movements.values('item').order_by().annotate(total=Sum('quantity')).values_list('item', 'total'))
+
+
+def on_hand_many(items, upto=None):
+    """{item: on-hand quantity}: each item's newest snapshot plus the movements after it."""
+    items = list(items)
+    snapshots = _latest_snapshots(items)
+    tails = _movement_sums({item: snapshots.get(item, (0, 0))[1] for item in items}, upto)
+    return {item: snapshots.get(item, (0, 0))[0] + tails.get(item, 0) for item in items}
+
+
+def on_hand(product_id, variant_id=None):
+    item = item_key(product_id, variant_id)
+    return on_hand_many([item])[item]
+
+
+def stock_columns(items):
+    """{item: stock_quantity} as currently stored on Product/ProductVariant."""
+    products, variants = _split(items)
+    columns = {}
+    for model, ids in ((Product, products), (ProductVariant, variants)):
+        for pk, quantity in model.objects.filter(pk__in=list(ids)).values_list('pk', 'stock_quantity'):
+            columns[ids[pk]] = quantity
+    return columns
+
+
+def _owners(items):
+    """{item: (product_id, variant_id)}."""
+    products, variants = _split(items)
+    owners = {item: (pk, None) for pk, item in products.items()}
+    for pk, product_id in ProductVariant.objects.filter(pk__in=list(variants)).values_list('pk', 'product_id'):
+        owners[variants[pk]] = (product_id, pk)
+    return owners
+
+
+def _lock_items(items):
+    """Lock the Product/ProductVariant rows of the items, in pk order, until the transaction ends."""
+    products, variants = _split(items)
+    for model, ids in ((Product, products), (ProductVariant, variants)):
+        if ids:
+            list(model.objects.select_for_update().filter(pk__in=list(ids)).order_by('pk').values_list('pk', flat=True))
+
+
+def set_on_hand(levels, note='', user=None, owners=None):
+    """Record the adjustments that bring items to {item: quantity}; returns the new movements.
+
+    The items' rows stay locked from reading on-hand to recording the
+    difference, so two concurrent sets of one item can't both apply it.
+    Receipts and sales append relative movements and don't take the lock.
+    Callers that know the items' {item: (product_id, variant_id)} can pass
+    `owners` to save looking them up.
+    """
+    with transaction.atomic():
+        _lock_items(levels)
+        current = on_hand_many(levels)
+        changed = {item: quantity - current[item] for item, quantity in levels.items() if quantity != current[item]}
+        owners = owners if owners is not None else _owners(changed)
+        return record_movements([
+            StockMovement(
+                product_id=owners[item][0], variant_id=owners[item][1], kind='adjustment',
+                quantity=change, note=note, created_by=user,
+            )
+            for item, change in changed.items()
+            if item in owners
+        ])
+
+
+def _settle_columns(levels):
+    """Copy {item: on-hand} onto the stock_quantity columns that differ; returns how many changed."""
+    columns = stock_columns(levels)
+    stale = {item: max(quantity, 0) for item, quantity in levels.items() if item in columns and columns[item] != max(quantity, 0)}
+    products, variants = _split(stale)
+    set_stock_levels(Product.objects.all(), {pk: stale[item] for pk, item in products.items()})
+    set_stock_levels(ProductVariant.objects.all(), {pk: stale[item] for pk, item in variants.items()})
+    if stale:
+        variant_products = ProductVariant.objects.filter(pk__in=list(variants)).values_list('product_id', flat=True)
+        refresh_low_stock({*products, *variant_products})
+    return len(stale)
+
+
+@job('inventory.stock_snapshot')
+def take_snapshots(now=None):
+    """Snapshot every item with movements since the last run and settle its stock column.
+
+    Run from cron via `manage.py snapshot_stock`; returns the number of snapshots taken.
+    """
+    now = now or timezone.now()
+    cutoff = now - SNAPSHOT_LAG
+    cursor, _ = RollupCursor.objects.get_or_create(name=SNAPSHOT_CURSOR)
+    recent = StockMovement.objects.filter(created_at__lte=cutoff)
+    if cursor.position:
+        recent = recent.filter(created_at__gt=cursor.position - SNAPSHOT_LAG)
+    upto = recent.aggregate(last=Max('id'))['last']
+
+    taken = settled = 0
+    if upto is not None:
+        items = recent.filter(id__lte=upto).order_by().values_list('item', flat=True).distinct()
+        for chunk in _chunks(sorted(items)):
+            covered = _latest_snapshots(chunk)
+            due = [item for item in chunk if covered.get(item, (0, 0))[1] < upto]
+            levels = on_hand_many(due, upto)
+            with transaction.atomic():
+                StockSnapshot.objects.bulk_create([
+                    StockSnapshot(item=item, quantity=levels[item], last_movement_id=upto) for item in due
+                ])
+                settled += _settle_columns(on_hand_many(due))
+            taken += len(due)
+    if settled:
+        # Bulk UPDATEs skip post_save; drop all cached payloads in one bump
+        PRODUCT_DETAILS.invalidate_all()
+    RollupCursor.objects.filter(pk=cursor.pk).update(position=cutoff)
+    return taken
+
+
+def all_items():
+    """Every stock item in the catalogue, in chunks."""
+    for model, key in ((Product, lambda pk: item_key(pk)), (ProductVariant, lambda pk: item_key(None, pk))):
+        last = 0
+        while True:
+            pks = list(model.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:CHUNK_SIZE])
+            if not pks:
+                break
+            yield [key(pk) for pk in pks]
+            last = pks[-1]
+
+
+def verify(items):
+    """{item: {ledger, on_hand, column}} for the items whose figures disagree.
+
+    `ledger` sums every movement; `on_hand` is snapshot plus tail; `column`
+    is stock_quantity, which lags the ledger until the next snapshot run.
+    """
+    items = list(items)
+    ledger = _movement_sums({item: 0 for item in items})
+    current = on_hand_many(items)
+    columns = stock_columns(items)
+    problems = {}
+    for item in items:
+        row = {
+            'ledger': ledger.get(item, 0),
+            'on_hand': current[item],
+            'column': columns.get(item),
+        }
+        if row['ledger'] != row['on_hand'] or row['column'] != max(row['ledger'], 0):
+            problems[item] = row
+    return problems
+
+
+def rebuild(items):
+    """Reset the snapshots and stock columns of the items from the full ledger.
+
+    Run while nothing else writes these items' stock.
+    """
+    items = list(items)
+    with transaction.atomic():
+        upto = StockMovement.objects.aggregate(last=Max('id'))['last'] or 0
+        totals = _movement_sums({item: 0 for item in items}, upto)
+        StockSnapshot.objects.bulk_create([
+            StockSnapshot(item=item, quantity=totals.get(item, 0), last_movement_id=upto) for item in items
+        ])
+        settled = _settle_columns({item: totals.get(item, 0) for item in items})
+    if settled:
+        PRODUCT_DETAILS.invalidate_all()
+    return settled
+
+
+def adopt_columns(items, user=None):
+    """Record adjustments so the ledger agrees with the stock_quantity columns; returns the movements."""
+    return set_on_hand(stock_columns(items), note='Adopted stock column', user=user)
+
+
+@receiver(post_save, sender=Product)
+def _product_stock_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        # A new item has nothing on hand yet
+        if instance.stock_quantity:
+            record_movement(instance.pk, 'adjustment', instance.stock_quantity, note='Opening stock')
+    elif getattr(instance, '_loaded_stock', (None,))[0] != instance.stock_quantity:
+        item = item_key(instance.pk)
+        set_on_hand({item: instance.stock_quantity}, note='Stock set directly', owners={item: (instance.pk, None)})
+
+
+@receiver(post_save, sender=ProductVariant)
+def _variant_stock_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        if instance.stock_quantity:
+            record_movement(instance.product_id, 'adjustment', instance.stock_quantity, instance.pk, note='Opening stock')
+    elif getattr(instance, '_loaded_stock', None) != instance.stock_quantity:
+        item = item_key(instance.product_id, instance.pk)
+        set_on_hand({item: instance.stock_quantity}, note='Stock set directly', owners={item: (instance.product_id, instance.pk)})
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductVariant)
+def _item_deleted(sender, instance, **kwargs):
+    # Movements go with the product or variant; snapshots are keyed loosely
+    item = item_key(instance.pk) if sender is Product else item_key(instance.product_id, instance.pk)
+    StockSnapshot.objects.filter(item=item).delete()
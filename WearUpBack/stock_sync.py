@@ -0,0 +1,123 @@
+import time
+
+from django.db import transaction
+
+from .catalog_import import RowError, _as_int
+from .inventory import refresh_low_stock, set_stock_levels
+from .models import Product, ProductVariant
+from .object_cache import PRODUCT_DETAILS
+from .stock_ledger import item_key, set_on_hand
+from .storefront import STOREFRONT_STATS
+
+
+def parse_stock_row(row):
+    """Validate one sync row and return (code, quantity)."""
+    code = str(row.get('code') or row.get('sku') or row.get('barcode') or '').strip()
+    if not code:
+        raise RowError('sku or barcode is required')
+    if len(code) > 100:
+        raise RowError('sku or barcode is longer than 100 characters')
+    if row.get('quantity') in (None, ''):
+        raise RowError('quantity is required')
+    return code, _as_int(row, 'quantity')
+
+
+class StockUpdater:
+    """Applies (sku or barcode, quantity) pairs from a warehouse sync to one seller's stock.
+
+    Codes are matched against ProductVariant.sku, then Product.sku, then
+    Product.barcode, with one indexed lookup per column per chunk. Each chunk is
+    written with one CASE-based UPDATE per table, and the changes are recorded
+    in the stock ledger as adjustments. Unknown and ambiguous codes
+    and invalid rows are reported rather than failing the sync; when a code
+    repeats, the last row wins.
+    """
+
+    def __init__(self, seller, chunk_size=1000):
+        self.seller = seller
+        self.chunk_size = chunk_size
+        self.updated_products = 0
+        self.updated_variants = 0
+        self.unknown = []
+        self.ambiguous = []
+        self.errors = []
+
+    def run(self, rows):
+        started = time.perf_counter()
+        chunk = {}
+        processed = 0
+        for number, row in rows:
+            processed += 1
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                code, quantity = parse_stock_row(row)
+            except RowError as e:
+                self.errors.append({'row': number, 'error': str(e)})
+                continue
+            chunk[code] = quantity
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = {}
+        if chunk:
+            self._flush(chunk)
+        if self.updated_products or self.updated_variants:
+            # Bulk UPDATEs skip post_save; drop all cached payloads in one bump
+            PRODUCT_DETAILS.invalidate_all()
+            STOREFRONT_STATS.invalidate(self.seller.pk)
+
+        elapsed = time.perf_counter() - started
+        return {
+            'rows': processed,
+            'updated_products': self.updated_products,
+            'updated_variants': self.updated_variants,
+            'unknown': self.unknown,
+            'ambiguous': self.ambiguous,
+            'errors': self.errors,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(processed / elapsed, 1) if elapsed else None,
+        }
+
+    def _resolve(self, codes):
+        """({variant_pk: code}, {variant_pk: product_pk}, {product_pk: code}) for the codes that match."""
+        variants = {}
+        variant_products = {}
+        for pk, sku, product_id in ProductVariant.objects.filter(
+            product__seller=self.seller, sku__in=codes
+        ).values_list('pk', 'sku', 'product_id'):
+            variants[pk] = sku
+            variant_products[pk] = product_id
+
+        remaining = set(codes) - set(variants.values())
+        products = {}
+        for column in ('sku', 'barcode'):
+            if not remaining:
+                break
+            matches = {}
+            for pk, code in Product.objects.filter(
+                seller=self.seller, **{f'{column}__in': remaining}
+            ).values_list('pk', column):
+                matches.setdefault(code, []).append(pk)
+            for code, pks in matches.items():
+                if len(pks) > 1:
+                    self.ambiguous.append(code)
+                else:
+                    products[pks[0]] = code
+            remaining -= set(matches)
+        self.unknown.extend(code for code in codes if code in remaining)
+        return variants, variant_products, products
+
+    def _flush(self, chunk):
+        variants, variant_products, products = self._resolve(list(chunk))
+        with transaction.atomic():
+            self.updated_variants += set_stock_levels(
+                ProductVariant.objects.all(), {pk: chunk[code] for pk, code in variants.items()}
+            )
+            self.updated_products += set_stock_levels(
+                Product.objects.all(), {pk: chunk[code] for pk, code in products.items()}
+            )
+            refresh_low_stock({*products, *variant_products.values()})
+            # The columns were set directly; record the differences in the ledger
+            levels = {item_key(pk): chunk[code] for pk, code in products.items()}
+            levels.update({item_key(variant_products[pk], pk): chunk[code] for pk, code in variants.items()})
+            set_on_hand(levels, note='Stock sync', user=self.seller)
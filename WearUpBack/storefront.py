@@ -0,0 +1,85 @@
+from django.contrib.auth.models import User
+from django.db.models import Avg, Count, DecimalField, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Order, OrderItem, Product, ProductComment, ProductLike, ProductShare
+from .object_cache import TieredCache
+
+# Per-seller storefront numbers, keyed by user id
+STOREFRONT_STATS = TieredCache('storefront-stats', ttl=600)
+
+# Orders in these states don't count towards sales
+EXCLUDED_ORDER_STATUSES = ('cancelled', 'refunded')
+
+
+def _per_seller(queryset, seller_path, aggregate, output_field=None):
+    rows = (
+        queryset.filter(**{seller_path: OuterRef('pk')}).order_by()
+        .values(seller_path).annotate(value=aggregate).values('value')
+    )
+    subquery = Subquery(rows, output_field=output_field or IntegerField())
+    return subquery if output_field is not None else Coalesce(subquery, 0)
+
+
+def stats_annotations():
+    """Correlated subqueries over a User queryset; together they are one SELECT."""
+    sold = OrderItem.objects.exclude(order__status__in=EXCLUDED_ORDER_STATUSES)
+    return {
+        'product_count': _per_seller(Product.objects.filter(status='active'), 'seller', Count('pk')),
+        'total_views': _per_seller(Product.objects.all(), 'seller', Sum('views')),
+        'average_rating': _per_seller(
+            Product.objects.filter(average_rating__gt=0), 'seller', Avg('average_rating'),
+            output_field=DecimalField(max_digits=3, decimal_places=1),
+        ),
+        'total_likes': _per_seller(ProductLike.objects.all(), 'product__seller', Count('pk')),
+        'fans': _per_seller(ProductLike.objects.all(), 'product__seller', Count('user', distinct=True)),
+        'total_comments': _per_seller(ProductComment.objects.all(), 'product__seller', Count('pk')),
+        'total_shares': _per_seller(ProductShare.objects.all(), 'product__seller', Count('pk')),
+        'customers': _per_seller(sold, 'product__seller', Count('order__user', distinct=True)),
+        'items_sold': _per_seller(sold, 'product__seller', Sum('quantity')),
+    }
+
+
+def _load_stats(user_id):
+    annotations = stats_annotations()
+    row = User.objects.filter(pk=user_id).annotate(**annotations).values(*annotations).first()
+    if row is None:
+        raise User.DoesNotExist
+    if row['average_rating'] is not None:
+        row['average_rating'] = round(float(row['average_rating']), 1)
+    return row
+
+
+def seller_stats(user_id):
+    return STOREFRONT_STATS.get_or_set(user_id, lambda: _load_stats(user_id))
+
+
+def _sellers_of_products(product_ids):
+    return Product.objects.filter(pk__in=product_ids).exclude(seller=None).values_list('seller_id', flat=True).distinct()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def _product_changed(sender, instance, **kwargs):
+    STOREFRONT_STATS.invalidate(instance.seller_id)
+
+
+@receiver(post_save, sender=ProductLike)
+@receiver(post_delete, sender=ProductLike)
+@receiver(post_save, sender=ProductComment)
+@receiver(post_delete, sender=ProductComment)
+@receiver(post_save, sender=ProductShare)
+@receiver(post_delete, sender=ProductShare)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def _engagement_changed(sender, instance, **kwargs):
+    STOREFRONT_STATS.invalidate(*_sellers_of_products([instance.product_id]))
+
+
+@receiver(post_save, sender=Order)
+def _order_changed(sender, instance, created=False, **kwargs):
+    # A new order has no items yet; later status changes move sales in or out
+    if not created:
+        STOREFRONT_STATS.invalidate(*_sellers_of_products(instance.items.values('product_id')))
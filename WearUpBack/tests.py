@@ -1,3 +1,1612 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, close_old_connections, connection, connections, transaction
+from django.db.models.signals import pre_save
+from django.db.utils import load_backend
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .analytics import record_view, rollup_days, run_rollup
+from .auth_backends import LOGIN_FAILURES, SlidingWindowCounter, users_with_email
+from .bench_suite import SCENARIOS, route_names
+from .catalog_import import CatalogImporter, iter_rows
+from .coupons import VERSION_KEY as COUPON_VERSION_KEY, CouponError, evaluate_coupon, redeem_coupon
+from .db_routing import PIN_COOKIE, ReplicaPinningMiddleware
+from .object_cache import PRODUCT_DETAILS, TieredCache
+from .query_log import QueryLog
+from .revocation import REVOKED_TOKENS, BloomFilter, purge_expired_tokens
+from .seller_cards import SELLER_CARDS, seller_cards
+from .storefront import STOREFRONT_STATS, seller_stats
+from .token_auth import ClaimsAccessToken, ClaimsRefreshToken, claims_user
+from .models import (
+    Cart, CartItem, Category, Coupon, Job, LowStockAlert, Order, OrderItem, PriceCampaign, Product, ProductComment, ProductDailyStats,
+    ProductImage, ProductLike, ProductShare, ProductVariant, ProfileReport, Size, StaleStatsDay, StockMovement, StockSnapshot, UserProfile,
+)
+from .images import update_product_images
+from .instrumentation import REGISTRY, WORKERS_KEY
+from .inventory import refresh_low_stock, send_low_stock_digests
+from .jobs import claim_jobs, enqueue, execute_job, job
+from .stock_ledger import item_key, on_hand, record_movement, set_on_hand, take_snapshots, verify
+from .stock_sync import StockUpdater
+from .profiling import profile_storage, prune_reports
+from .pricing import apply_campaign, end_campaign, reprice_products, run_due_campaigns, target_products
+from .reference_data import SIZES, sync_m2m
+from .serializers import CartSerializer, ProductSerializer, RegisterSerializer
+from .slugs import SlugAllocator, allocate_slug
+
+
+def make_coupon(**kwargs):
+    now = timezone.now()
+    defaults = {
+        'code': 'SAVE10',
+        'discount_type': 'percentage',
+        'discount_value': Decimal('10'),
+        'valid_from': now - timedelta(days=1),
+        'valid_to': now + timedelta(days=1),
+    }
+    defaults.update(kwargs)
+    return Coupon.objects.create(**defaults)
+
+
+class CouponEvaluationTests(TestCase):
+    def test_percentage_discount(self):
+        make_coupon()
+        coupon, discount = evaluate_coupon('save10', Decimal('250.00'))
+        self.assertEqual(coupon.code, 'SAVE10')
+        self.assertEqual(discount, Decimal('25.00'))
+
+    def test_fixed_discount_never_exceeds_subtotal(self):
+        make_coupon(code='FLAT500', discount_type='fixed', discount_value=Decimal('500'))
+        _, discount = evaluate_coupon('FLAT500', Decimal('120.00'))
+        self.assertEqual(discount, Decimal('120.00'))
+
+    def test_minimum_purchase_and_window(self):
+        make_coupon(minimum_purchase=Decimal('100'))
+        with self.assertRaises(CouponError):
+            evaluate_coupon('SAVE10', Decimal('99.99'))
+        make_coupon(code='EXPIRED', valid_to=timezone.now() - timedelta(minutes=1))
+        with self.assertRaises(CouponError):
+            evaluate_coupon('EXPIRED', Decimal('100'))
+
+    def test_cache_is_refreshed_on_change(self):
+        coupon = make_coupon()
+        evaluate_coupon('SAVE10', Decimal('10'))
+        coupon.is_active = False
+        coupon.save()
+        with self.assertRaises(CouponError):
+            evaluate_coupon('SAVE10', Decimal('10'))
+
+    def test_changes_from_other_processes_are_seen(self):
+        make_coupon()
+        evaluate_coupon('SAVE10', Decimal('10'))
+        # Another worker deactivates it: the row changes and the shared version moves
+        Coupon.objects.filter(code='SAVE10').update(is_active=False)
+        cache.set(COUPON_VERSION_KEY, 'bumped elsewhere', None)
+        with self.assertRaises(CouponError):
+            evaluate_coupon('SAVE10', Decimal('10'))
+
+    def test_redeem_stops_at_usage_limit(self):
+        make_coupon(usage_limit=2)
+        redeem_coupon('SAVE10', Decimal('10'))
+        redeem_coupon('SAVE10', Decimal('10'))
+        with self.assertRaises(CouponError):
+            redeem_coupon('SAVE10', Decimal('10'))
+        self.assertEqual(Coupon.objects.get(code='SAVE10').used_count, 2)
+        # Validation catches up with the exhausted coupon too
+        with self.assertRaises(CouponError):
+            evaluate_coupon('SAVE10', Decimal('10'))
+
+    def test_malformed_input_is_a_bad_request(self):
+        make_coupon()
+        for body in ({'code': 10, 'subtotal': '100'}, {'code': ['SAVE10'], 'subtotal': '100'},
+                     {'code': 'SAVE10', 'subtotal': 'NaN'}, {'code': 'SAVE10', 'subtotal': 'Infinity'}):
+            with self.subTest(body=body):
+                response = self.client.post('/api/coupons/validate/', body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+
+class CouponRedemptionStressTests(TransactionTestCase):
+    usage_limit = 5
+    workers = 16
+    attempts_per_worker = 5
+
+    def test_usage_limit_holds_under_concurrent_redemption(self):
+        make_coupon(usage_limit=self.usage_limit)
+        redeemed = []
+        start = threading.Barrier(self.workers)
+
+        def checkout():
+            try:
+                start.wait()
+                for _ in range(self.attempts_per_worker):
+                    while True:
+                        try:
+                            redeem_coupon('SAVE10', Decimal('100'))
+                            redeemed.append(1)
+                        except CouponError:
+                            pass
+                        except OperationalError:
+                            # SQLite reports lock contention instead of waiting
+                            continue
+                        break
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(redeemed), self.usage_limit)
+        self.assertEqual(Coupon.objects.get(code='SAVE10').used_count, self.usage_limit)
+
+
+class BulkRepricingTests(TestCase):
+    def setUp(self):
+        self.women = Category.objects.create(name='Women')
+        self.dresses = Category.objects.create(name='Dresses', parent=self.women)
+        self.men = Category.objects.create(name='Men')
+        self.dress = Product.objects.create(product_name='Summer Dress', gender='Women', base_price=Decimal('80.00'), discount_percentage=Decimal('5'))
+        self.dress.categories.add(self.dresses)
+        self.shirt = Product.objects.create(product_name='Oxford Shirt', gender='Men', base_price=Decimal('50.00'))
+        self.shirt.categories.add(self.men)
+        self.variant = ProductVariant.objects.create(product=self.dress, sku='DRESS-L', price_adjustment=Decimal('4.00'))
+
+    def test_reprice_category_subtree(self):
+        updated = reprice_products(target_products(category=self.women), Decimal('20'))
+        self.assertEqual(updated, 1)
+        self.dress.refresh_from_db()
+        self.shirt.refresh_from_db()
+        self.assertEqual(self.dress.final_price, Decimal('64.00'))
+        self.assertEqual(self.shirt.final_price, Decimal('50.00'))
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.final_price, Decimal('68.00'))
+
+    def test_campaign_restores_previous_discount(self):
+        campaign = PriceCampaign.objects.create(
+            name='Dress sale', discount_percentage=Decimal('20'), category=self.women,
+            starts_at=timezone.now() - timedelta(minutes=1), ends_at=timezone.now() + timedelta(hours=1),
+        )
+        self.assertEqual(run_due_campaigns(), (1, 0))
+        self.dress.refresh_from_db()
+        self.assertEqual(self.dress.campaign, campaign)
+        self.assertEqual(self.dress.final_price, Decimal('64.00'))
+
+        self.assertEqual(run_due_campaigns(now=timezone.now() + timedelta(hours=2)), (0, 1))
+        self.dress.refresh_from_db()
+        self.assertIsNone(self.dress.campaign)
+        self.assertEqual(self.dress.discount_percentage, Decimal('5'))
+        self.assertEqual(self.dress.final_price, Decimal('76.00'))
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.final_price, Decimal('80.00'))
+
+    def test_reprice_during_campaign_survives_its_end(self):
+        campaign = PriceCampaign.objects.create(
+            name='Dress sale', discount_percentage=Decimal('20'), category=self.women,
+            starts_at=timezone.now() - timedelta(minutes=1), ends_at=timezone.now() + timedelta(hours=1),
+        )
+        run_due_campaigns()
+        self.assertEqual(reprice_products(target_products(category=self.women), Decimal('10')), 1)
+        self.dress.refresh_from_db()
+        self.assertEqual((self.dress.campaign, self.dress.final_price), (campaign, Decimal('64.00')))
+
+        end_campaign(campaign)
+        self.dress.refresh_from_db()
+        self.assertEqual(self.dress.discount_percentage, Decimal('10'))
+        self.assertEqual(self.dress.final_price, Decimal('72.00'))
+
+    def _campaign(self, name, discount, **target):
+        return PriceCampaign.objects.create(
+            name=name, discount_percentage=Decimal(discount), **target,
+            starts_at=timezone.now() - timedelta(minutes=1), ends_at=timezone.now() + timedelta(hours=1),
+        )
+
+    def test_discount_edit_during_campaign_survives_its_end(self):
+        seller = User.objects.create_user(username='seller', password='pass')
+        Product.objects.filter(pk=self.dress.pk).update(seller=seller)
+        campaign = self._campaign('Dress sale', '20', category=self.women)
+        run_due_campaigns()
+        response = self.client.patch(f'/api/products/{self.dress.pk}/', {'discount_percentage': '15'}, content_type='application/json',
+                                     HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(seller).access_token}')
+        self.assertEqual(response.status_code, 200)
+        self.dress.refresh_from_db()
+        self.assertEqual((self.dress.discount_percentage, self.dress.final_price), (Decimal('20'), Decimal('64.00')))
+
+        end_campaign(campaign)
+        self.dress.refresh_from_db()
+        self.assertEqual(self.dress.discount_percentage, Decimal('15'))
+        self.assertEqual(self.dress.final_price, Decimal('68.00'))
+
+    def test_overlapping_campaign_leaves_claimed_products_alone(self):
+        first = self._campaign('Dress sale', '20', category=self.dresses)
+        second = self._campaign('Women sale', '50', category=self.women)
+        apply_campaign(first)
+        apply_campaign(second)
+        self.dress.refresh_from_db()
+        self.assertEqual(self.dress.campaign, first)
+        self.assertEqual(second.products.count(), 0)
+
+        end_campaign(first)
+        self.dress.refresh_from_db()
+        self.assertEqual((self.dress.campaign, self.dress.discount_percentage), (None, Decimal('5')))
+
+
+class SlugAllocationTests(TestCase):
+    def test_next_free_suffix(self):
+        slugs = [Product.objects.create(product_name='Black T-Shirt', gender='Unisex', base_price=Decimal('10')).slug for _ in range(3)]
+        self.assertEqual(slugs, ['black-t-shirt', 'black-t-shirt-1', 'black-t-shirt-2'])
+        # Names that merely share the prefix don't count as collisions
+        self.assertEqual(Product.objects.create(product_name='Black T-Shirt Dress', gender='Women', base_price=Decimal('10')).slug, 'black-t-shirt-dress')
+
+    def test_single_query_per_product(self):
+        for _ in range(5):
+            Product.objects.create(product_name='Black T-Shirt', gender='Unisex', base_price=Decimal('10'))
+        with self.assertNumQueries(1):
+            self.assertEqual(allocate_slug('Black T-Shirt'), 'black-t-shirt-5')
+
+    def test_batch_allocator(self):
+        Product.objects.create(product_name='Linen Kurta', gender='Men', base_price=Decimal('10'))
+        allocator = SlugAllocator()
+        with self.assertNumQueries(1):
+            allocator.prefetch(['linen-kurta', 'silk-saree'])
+            allocated = [allocator.allocate(name) for name in ['Linen Kurta', 'Silk Saree', 'Linen Kurta']]
+        self.assertEqual(allocated, ['linen-kurta-1', 'silk-saree', 'linen-kurta-2'])
+
+
+class CatalogImportTests(TestCase):
+    def test_import_resolves_reference_data_and_reports_bad_rows(self):
+        seller = User.objects.create_user(username='seller', password='pass')
+        Size.objects.create(name='M')
+        rows = io.StringIO(
+            'product_name,gender,base_price,discount_percentage,sizes,categories,images\n'
+            'Linen Kurta,Men,40,25,M|L,Ethnic,products/kurtha.webp|products/kurtha3.jpeg\n'
+            'Linen Kurta,Men,42,,L,Ethnic,\n'
+            ',Men,10,,,,\n'
+            'Scarf,Women,abc,,,,\n'
+        )
+        result = CatalogImporter(seller, chunk_size=1).run(iter_rows(rows, 'csv'))
+
+        self.assertEqual(result['created'], 2)
+        self.assertEqual([error['row'] for error in result['errors']], [4, 5])
+        first, second = Product.objects.filter(seller=seller).order_by('pk')
+        self.assertEqual((first.slug, second.slug), ('linen-kurta', 'linen-kurta-1'))
+        self.assertEqual(first.final_price, Decimal('30.00'))
+        self.assertEqual(sorted(first.sizes.values_list('name', flat=True)), ['L', 'M'])
+        self.assertEqual(Size.objects.filter(name='L').count(), 1)
+        self.assertEqual(list(first.images.order_by('order').values_list('is_main', flat=True)), [True, False])
+
+    def test_names_differing_only_in_case_resolve(self):
+        # On MySQL's case-insensitive collation 'm' finds the existing 'M' row;
+        # elsewhere it is a size of its own. Either way the row imports.
+        seller = User.objects.create_user(username='seller', password='pass')
+        Size.objects.create(name='M')
+        rows = io.StringIO('product_name,gender,base_price,sizes\nTee,Men,10,m\n')
+        result = CatalogImporter(seller).run(iter_rows(rows, 'csv'))
+        self.assertEqual((result['created'], result['errors']), (1, []))
+        self.assertEqual([name.casefold() for name in Product.objects.get(seller=seller).sizes.values_list('name', flat=True)], ['m'])
+
+    def test_unreadable_uploads_are_reported_as_row_errors(self):
+        seller = User.objects.create_user(username='seller', password='pass')
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(seller).access_token}'}
+        header = 'product_name,gender,base_price\n'
+        uploads = {
+            'latin-1': (header + 'Caf\u00e9 Tee,Men,10\n').encode('latin-1'),
+            'oversized field': (header + 'Tee,Men,10\n' + 'x' * (csv.field_size_limit() + 1) + ',Men,10\n').encode(),
+        }
+        for label, content in uploads.items():
+            with self.subTest(label):
+                upload = SimpleUploadedFile('catalog.csv', content, content_type='text/csv')
+                response = self.client.post('/api/catalog/import/', {'file': upload}, **auth)
+                self.assertEqual(response.status_code, 400 if label == 'latin-1' else 201)
+                self.assertIn('Unreadable file', response.json()['errors'][-1]['error'])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        for i in range(3):
+            Product.objects.create(seller=self.seller, product_name=f'Tee {i}', gender='Unisex', base_price=Decimal('10'))
+
+    def _authenticate(self):
+        return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.seller).access_token}'}
+
+    def test_csv_export_streams_sellers_products(self):
+        response = self.client.get('/api/seller/export/products/', **self._authenticate())
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'product_name'])
+        self.assertEqual(len(lines), 4)
+
+    def test_gzipped_jsonl_export(self):
+        response = self.client.get('/api/seller/export/orders/?output=jsonl&gzip=1', **self._authenticate())
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b'')
+
+
+class ProductM2MSyncTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(product_name='Hoodie', gender='Unisex', base_price=Decimal('30'))
+        for name in ['S', 'M', 'L']:
+            Size.objects.create(name=name)
+
+    def test_sync_only_writes_the_difference(self):
+        sync_m2m(self.product, 'sizes', SIZES.ids_for(['S', 'M']).values())
+        with CaptureQueriesContext(connection) as queries:
+            ids = SIZES.ids_for(['M', 'L'])
+            sync_m2m(self.product, 'sizes', ids.values())
+        statements = [q['sql'].split()[0] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        # Names come from the cache; one read of current ids, one delete, one insert
+        self.assertEqual(statements, ['SELECT', 'DELETE', 'INSERT'])
+        self.assertEqual(sorted(self.product.sizes.values_list('name', flat=True)), ['L', 'M'])
+        with self.assertNumQueries(1):
+            sync_m2m(self.product, 'sizes', ids.values())
+
+    def test_cache_picks_up_new_names(self):
+        self.assertEqual(SIZES.ids_for(['XL'], create=False), {})
+        Size.objects.create(name='XL')
+        self.assertIn('XL', SIZES.ids_for(['XL'], create=False))
+
+
+def make_image_file(name='photo.jpg', size=(1200, 800), fmt='JPEG', color=(200, 30, 60)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+@override_settings(JOBS_EAGER=True)
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_product_image_derivatives_and_srcset(self):
+        product = Product.objects.create(product_name='Parka', gender='Unisex', base_price=Decimal('99'))
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=product, image=make_image_file(), is_main=True)
+        image.refresh_from_db()
+
+        self.assertEqual(image.derivatives['source'], image.image.name)
+        self.assertEqual(sorted(image.derivatives['widths'], key=int), ['160', '480', '1080'])
+        for entry in image.derivatives['widths'].values():
+            for name in entry.values():
+                self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+        with Image.open(os.path.join(self.media_root, image.derivatives['widths']['160']['webp'])) as thumb:
+            self.assertEqual(thumb.size, (160, 107))
+        self.assertTrue(image.derivatives['placeholder'].startswith('data:image/webp;base64,'))
+
+        data = ProductSerializer(product).data
+        self.assertIn('160w', data['image_srcset']['webp'])
+        self.assertIn('1080w', data['images'][0]['srcset']['default'])
+
+    def test_small_avatar_is_not_upscaled(self):
+        user = User.objects.create_user(username='buyer', password='pass')
+        profile = UserProfile.objects.create(user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.profile_image = make_image_file('avatar.png', size=(120, 120), fmt='PNG')
+            profile.save()
+        profile.refresh_from_db()
+        self.assertEqual(list(profile.profile_image_derivatives['widths']), ['120'])
+        self.assertEqual(profile.cover_image_derivatives, {})
+
+    def test_sources_sharing_a_stem_keep_their_own_derivatives(self):
+        profiles = []
+        for username, fmt, color in (('a', 'JPEG', 'red'), ('b', 'PNG', 'blue')):
+            profile = UserProfile.objects.create(user=User.objects.create_user(username=username, password='pass'))
+            rgb = (220, 20, 20) if color == 'red' else (20, 20, 220)
+            upload = make_image_file(f'me.{fmt.lower()}', size=(200, 200), fmt=fmt, color=rgb)
+            with self.captureOnCommitCallbacks(execute=True):
+                profile.profile_image = upload
+                profile.save()
+            profile.refresh_from_db()
+            profiles.append((profile, color))
+        first, second = (profile.profile_image_derivatives['widths']['160']['webp'] for profile, _ in profiles)
+        self.assertNotEqual(first, second)
+        for (profile, color), name in zip(profiles, (first, second)):
+            with Image.open(os.path.join(self.media_root, name)) as thumb:
+                red, _, blue = thumb.convert('RGB').getpixel((80, 80))
+                self.assertEqual(red > blue, color == 'red', profile.profile_image.name)
+
+
+@override_settings(JOBS_EAGER=True)
+class IncrementalProductImageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.product = Product.objects.create(product_name='Kurta', gender='Men', base_price=Decimal('25'))
+
+    def _update(self, data):
+        serializer = ProductSerializer(self.product, data=data, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+
+    def test_identical_uploads_are_stored_once(self):
+        self._update({'main_image': make_image_file('front.jpg'), 'additional_images': [make_image_file('copy.jpg')]})
+        other = Product.objects.create(product_name='Kurta Set', gender='Men', base_price=Decimal('40'))
+        update_product_images(other, additional_images=[make_image_file('again.jpg')])
+
+        self.assertEqual(self.product.images.count(), 1)
+        first, second = ProductImage.objects.order_by('pk')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(second.derivatives, first.derivatives)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'products', first.content_hash[:2]))), 2)
+
+    def test_add_remove_reorder_and_set_main(self):
+        self._update({'main_image': make_image_file(size=(300, 300))})
+        self._update({'additional_images': [make_image_file(size=(301, 300)), make_image_file(size=(302, 300))]})
+        main, second, third = self.product.images.order_by('order')
+        self.assertTrue(main.is_main)
+
+        self._update({'remove_images': json.dumps([main.pk]), 'image_order': json.dumps([third.pk, second.pk]), 'main_image_id': str(third.pk)})
+        images = list(self.product.images.order_by('order').values_list('pk', 'is_main'))
+        self.assertEqual(images, [(third.pk, True), (second.pk, False)])
+        # Removing a row must not delete a file other rows may share
+        self.assertTrue(os.path.exists(main.image.path))
+
+
+@job('tests.record')
+def record_job(value, fail_times=0):
+    JOB_CALLS.append(value)
+    if JOB_CALLS.count(value) <= fail_times:
+        raise RuntimeError('boom')
+
+
+JOB_CALLS = []
+
+
+class JobRunnerTests(TransactionTestCase):
+    # Workers run on their own threads/connections, so the job rows must be committed
+    def setUp(self):
+        JOB_CALLS.clear()
+
+    def test_enqueue_rolls_back_with_the_transaction(self):
+        try:
+            with transaction.atomic():
+                enqueue('tests.record', {'value': 'a'})
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Job.objects.exists())
+
+    def test_claim_is_exclusive(self):
+        enqueue('tests.record', {'value': 'a'})
+        self.assertEqual(len(claim_jobs('default', 5, 'worker-1')), 1)
+        self.assertEqual(claim_jobs('default', 5, 'worker-2'), [])
+
+    def test_failed_job_is_retried_with_backoff(self):
+        queued = enqueue('tests.record', {'value': 'b', 'fail_times': 1}, max_attempts=2)
+        [pk] = claim_jobs('default', 1, 'worker')
+        self.assertFalse(execute_job(pk))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn('boom', queued.last_error)
+
+        Job.objects.filter(pk=pk).update(run_at=timezone.now())
+        call_command('run_workers', queues='default:2', burst=True, poll_interval=0.01, stdout=io.StringIO())
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'done')
+        self.assertEqual(JOB_CALLS, ['b', 'b'])
+
+    def test_gives_up_after_max_attempts(self):
+        queued = enqueue('tests.record', {'value': 'c', 'fail_times': 5}, max_attempts=1)
+        [pk] = claim_jobs('default', 1, 'worker')
+        execute_job(pk)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'failed')
+
+
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        UserProfile.objects.create(user=self.seller, business_name='Shop')
+        self.buyer = User.objects.create_user(username='buyer', password='pass')
+        tops = Category.objects.create(name='Tops')
+        self.products = []
+        for i in range(3):
+            product = Product.objects.create(seller=self.seller, product_name=f'Tee {i}', gender='Unisex', base_price=Decimal('10'))
+            product.categories.add(tops)
+            self.products.append(product)
+        comment = ProductComment.objects.create(user=self.buyer, product=self.products[0], content='Nice')
+        ProductComment.objects.create(user=self.seller, product=self.products[0], content='Thanks', parent=comment)
+        ProductLike.objects.create(user=self.buyer, product=self.products[0])
+
+    def _authenticate(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+    def test_list_matches_sync_endpoint(self):
+        async_data = self.client.get('/api/async/products/').json()
+        sync_data = self.client.get('/api/products/').json()
+        self.assertEqual(sorted(p['id'] for p in async_data), sorted(p['id'] for p in sync_data))
+        self.assertEqual(set(async_data[0]), set(sync_data[0]))
+
+    def test_detail_gathers_seller_comments_and_related(self):
+        product = self.products[0]
+        data = self.client.get(f'/api/async/products/{product.pk}/', **self._authenticate(self.buyer)).json()
+        self.assertTrue(data['user_liked'])
+        self.assertEqual(data['seller_profile']['business_name'], 'Shop')
+        self.assertEqual(data['seller_profile']['product_count'], 3)
+        self.assertEqual([c['content'] for c in data['comment_thread']], ['Nice'])
+        self.assertEqual([r['content'] for r in data['comment_thread'][0]['replies']], ['Thanks'])
+        self.assertEqual({p['id'] for p in data['related_products']}, {p.pk for p in self.products[1:]})
+        product.refresh_from_db()
+        self.assertEqual(product.views, 1)
+
+    def test_like_state_and_missing_product(self):
+        url = f'/api/async/products/{self.products[0].pk}/like-state/'
+        self.assertEqual(self.client.get(url, **self._authenticate(self.buyer)).json(), {'liked': True, 'likes_count': 1})
+        self.assertEqual(self.client.get(url).json(), {'liked': False, 'likes_count': 1})
+        self.assertEqual(self.client.get('/api/async/products/999999/').status_code, 404)
+        self.assertEqual(self.client.get('/api/async/products/?seller=abc').status_code, 400)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer junk').status_code, 401)
+
+
+@override_settings(DATABASE_REPLICAS=['lagging'], REPLICA_READ_PATHS=['/api/products/'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    """The 'lagging' replica is a separate SQLite file that never receives writes."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.replica_dir = tempfile.mkdtemp()
+        replica_settings = connections.configure_settings({
+            'default': connections.settings['default'],
+            'lagging': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3')},
+        })['lagging']
+        connections['lagging'] = load_backend(replica_settings['ENGINE']).DatabaseWrapper(replica_settings, 'lagging')
+        with connections['lagging'].schema_editor() as editor:
+            editor.create_model(Product)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['lagging'].close()
+        del connections['lagging']
+        shutil.rmtree(cls.replica_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(username='buyer', password='pass')
+        self.middleware_create = ReplicaPinningMiddleware(self._create_product)
+        self.middleware_read = ReplicaPinningMiddleware(self._read_product)
+
+    def _create_product(self, request):
+        product = Product.objects.create(product_name='Fresh', gender='Unisex', base_price=Decimal('10'))
+        return HttpResponse(str(product.pk))
+
+    def _read_product(self, request):
+        pk = request.GET['pk']
+        return HttpResponse('found' if Product.objects.filter(pk=pk).exists() else 'missing')
+
+    def _get(self, pk, user=None, cookies=None):
+        request = self.factory.get('/api/products/', {'pk': pk})
+        request.COOKIES.update(cookies or {})
+        if user is not None:
+            request.user = user
+        return self.middleware_read(request).content.decode()
+
+    def test_reads_go_to_replica_and_see_lag(self):
+        pk = Product.objects.create(product_name='Old', gender='Unisex', base_price=Decimal('10')).pk
+        self.assertEqual(self._get(pk), 'missing')
+        request = self.factory.post('/api/products/')
+        request.user = self.user
+        self.middleware_create(request)
+        # Writes and reads outside a request always use the primary
+        self.assertTrue(Product.objects.filter(pk=pk).exists())
+
+    def test_client_sticks_to_primary_after_write(self):
+        request = self.factory.post('/api/products/')
+        request.user = self.user
+        response = self.middleware_create(request)
+        pk = int(response.content)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        # Anonymous follow-up carrying the cookie, and the same user on another device
+        self.assertEqual(self._get(pk, cookies={PIN_COOKIE: '1'}), 'found')
+        self.assertEqual(self._get(pk, user=self.user), 'found')
+
+        # Once the window has passed the replica is used again (and still lags)
+        cache.clear()
+        self.assertEqual(self._get(pk, user=self.user), 'missing')
+
+    def test_write_inside_safe_request_pins_rest_of_request(self):
+        def view(request):
+            product = Product.objects.create(product_name='Fresh', gender='Unisex', base_price=Decimal('10'))
+            return HttpResponse(str(Product.objects.filter(pk=product.pk).exists()))
+
+        response = ReplicaPinningMiddleware(view)(self.factory.get('/api/products/'))
+        self.assertEqual(response.content, b'True')
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+
+class ProductDetailCacheTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.buyer = User.objects.create_user(username='buyer', password='pass')
+        self.product = Product.objects.create(seller=self.seller, product_name='Tee', gender='Unisex', base_price=Decimal('10'))
+        self.url = f'/api/products/{self.product.pk}/'
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.seller).access_token}'}
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get(self.url, **self.auth).json()
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(self.url, **self.auth).json()
+        # Auth, get_object, view counters (product and daily stats) and the per-user like check only
+        self.assertLessEqual(len(queries), 5)
+        self.assertEqual(second['views'], first['views'] + 1)
+        self.assertEqual({**first, 'views': None}, {**second, 'views': None})
+
+    def test_signals_invalidate_cached_payload(self):
+        self.assertEqual(self.client.get(self.url, **self.auth).json()['likes'], 0)
+        ProductLike.objects.create(user=self.seller, product=self.product)
+        data = self.client.get(self.url, **self.auth).json()
+        self.assertEqual((data['likes'], data['user_liked']), (1, True))
+
+        category = Category.objects.create(name='Tops')
+        self.product.categories.add(category)
+        self.assertEqual(self.client.get(self.url, **self.auth).json()['categories'], ['Tops'])
+        category.name = 'Shirts'
+        category.save()
+        self.assertEqual(self.client.get(self.url, **self.auth).json()['categories'], ['Shirts'])
+
+        self.product.product_name = 'Renamed'
+        self.product.save()
+        self.assertEqual(self.client.get(self.url, **self.auth).json()['product_name'], 'Renamed')
+
+    def test_bulk_reprice_invalidates_everything(self):
+        self.client.get(self.url, **self.auth)
+        reprice_products(Product.objects.filter(pk=self.product.pk), 50)
+        self.assertEqual(self.client.get(self.url, **self.auth).json()['final_price'], '5.00')
+
+    def test_concurrent_misses_compute_once(self):
+        cache = TieredCache('test-single-flight', backend='default')
+        calls = []
+        start = threading.Barrier(8)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'value': 42}
+
+        def reader(results):
+            start.wait()
+            results.append(cache.get_or_set(1, compute))
+
+        results = []
+        threads = [threading.Thread(target=reader, args=(results,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'value': 42}] * 8)
+
+        cache.invalidate(1)
+        self.assertEqual(cache.get_or_set(1, lambda: {'value': 43}), {'value': 43})
+
+    def test_local_hits_reuse_versions_until_they_expire(self):
+        # Two instances over one backend stand in for two worker processes
+        here = TieredCache('test-versions', backend='default', version_ttl=0.2)
+        there = TieredCache('test-versions', backend='default', version_ttl=0.2)
+        self.assertEqual(here.get_or_set(1, lambda: 'old'), 'old')
+
+        there.invalidate(1)
+        self.assertEqual(there.get_or_set(1, lambda: 'new'), 'new')
+        # Answered from the LRU without reading the bumped version
+        self.assertEqual(here.get_or_set(1, lambda: 'newer'), 'old')
+        time.sleep(0.25)
+        self.assertEqual(here.get_or_set(1, lambda: 'newer'), 'new')
+
+
+class SellerCardTests(TestCase):
+    def setUp(self):
+        self.sellers = []
+        for i in range(2):
+            seller = User.objects.create_user(username=f'seller{i}', password='pass', first_name=f'Seller {i}')
+            UserProfile.objects.create(user=seller, role='seller')
+            self.sellers.append(seller)
+            for j in range(5):
+                Product.objects.create(seller=seller, product_name=f'Tee {i}-{j}', gender='Unisex', base_price=Decimal('10'))
+
+    def _user_queries(self, queries):
+        return [q for q in queries.captured_queries if q['sql'].split('FROM')[1].split()[0].strip('"`') == 'auth_user']
+
+    def _serialize_page(self):
+        products = ProductSerializer.setup_eager_loading(Product.objects.all())
+        return ProductSerializer(products, many=True).data
+
+    def test_page_fetches_cards_in_one_batch(self):
+        with CaptureQueriesContext(connection) as cold:
+            data = self._serialize_page()
+        self.assertEqual(len(self._user_queries(cold)), 1)
+        self.assertEqual(data[0]['seller']['handle'], '@seller0')
+        self.assertTrue(data[0]['seller']['verified'])
+
+        with CaptureQueriesContext(connection) as warm:
+            self._serialize_page()
+        self.assertEqual(self._user_queries(warm), [])
+
+    def test_profile_and_user_saves_invalidate(self):
+        seller = self.sellers[0]
+        self.assertEqual(seller_cards([seller.pk])[seller.pk]['name'], 'Seller 0')
+        seller.first_name = 'Renamed'
+        seller.save()
+        self.assertEqual(seller_cards([seller.pk])[seller.pk]['name'], 'Renamed')
+
+        profile = seller.profile
+        profile.role = 'customer'
+        profile.save()
+        self.assertFalse(seller_cards([seller.pk])[seller.pk]['verified'])
+
+
+class StorefrontTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        UserProfile.objects.create(user=self.seller, role='seller', business_name='Shop', phone='555-0100')
+        self.buyers = [User.objects.create_user(username=f'buyer{i}', password='pass') for i in range(2)]
+        self.products = [
+            Product.objects.create(seller=self.seller, product_name=f'Tee {i}', gender='Unisex',
+                                   base_price=Decimal('10'), views=5, average_rating=Decimal(rating))
+            for i, rating in enumerate(['4.0', '5.0', '0'])
+        ]
+        Product.objects.create(seller=self.seller, product_name='Draft', gender='Unisex', base_price=Decimal('10'), status='inactive')
+        for buyer in self.buyers:
+            ProductLike.objects.create(user=buyer, product=self.products[0])
+        ProductLike.objects.create(user=self.buyers[0], product=self.products[1])
+        order = Order.objects.create(user=self.buyers[0], order_number='A1')
+        OrderItem.objects.create(order=order, product=self.products[0], quantity=2, unit_price=Decimal('10'), total_price=Decimal('20'))
+        self.url = f'/api/users/{self.seller.pk}/storefront/'
+
+    def test_storefront_payload(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['profile']['business_name'], 'Shop')
+        self.assertNotIn('phone', data['profile'])
+        self.assertEqual(data['stats'], {
+            'product_count': 3, 'total_views': 15, 'average_rating': 4.5, 'total_likes': 3, 'fans': 2,
+            'total_comments': 0, 'total_shares': 0, 'customers': 1, 'items_sold': 2,
+        })
+        self.assertEqual(len(data['products']['results']), 3)
+        self.assertIsNone(data['products']['next'])
+        self.assertEqual(self.client.get('/api/users/999999/storefront/').status_code, 404)
+
+    def test_next_link_pages_through_active_products(self):
+        for i in range(22):
+            Product.objects.create(seller=self.seller, product_name=f'Extra {i}', gender='Unisex', base_price=Decimal('10'))
+        seen = []
+        url = self.url
+        while url:
+            products = self.client.get(url).json()['products']
+            self.assertEqual(products['count'], 25)
+            seen += [product['name'] for product in products['results']]
+            url = products['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertNotIn('Draft', seen)
+        self.assertEqual(self.client.get(self.url + '?page=0').status_code, 400)
+
+    def test_bulk_imports_refresh_the_count(self):
+        before = self.client.get(self.url).json()['products']['count']
+        rows = io.StringIO('product_name,gender,base_price\n' + ''.join(f'Bulk {i},Men,10\n' for i in range(21)))
+        CatalogImporter(self.seller).run(iter_rows(rows, 'csv'))
+        products = self.client.get(self.url).json()['products']
+        self.assertEqual(products['count'], before + 21)
+        self.assertIsNotNone(products['next'])
+
+    def test_stats_are_one_query_and_cached_until_an_event(self):
+        with self.assertNumQueries(1):
+            seller_stats(self.seller.pk)
+        with self.assertNumQueries(0):
+            seller_stats(self.seller.pk)
+
+        ProductComment.objects.create(user=self.buyers[1], product=self.products[2], content='Nice')
+        self.assertEqual(seller_stats(self.seller.pk)['total_comments'], 1)
+
+        order = Order.objects.get()
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(seller_stats(self.seller.pk)['items_sold'], 0)
+
+
+class SellerAnalyticsTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.buyer = User.objects.create_user(username='buyer', password='pass')
+        self.tee = Product.objects.create(seller=self.seller, product_name='Tee', gender='Unisex', base_price=Decimal('10'))
+        self.cap = Product.objects.create(seller=self.seller, product_name='Cap', gender='Unisex', base_price=Decimal('5'))
+        self.today = timezone.localdate()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.seller).access_token}'}
+
+    def _order(self, product, quantity, status='confirmed', days_ago=0):
+        order = Order.objects.create(user=self.buyer, order_number=f'N{Order.objects.count()}', status=status)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        OrderItem.objects.create(order=order, product=product, quantity=quantity,
+                                 unit_price=product.base_price, total_price=product.base_price * quantity)
+        return order
+
+    def test_views_are_counted_live_and_survive_rollups(self):
+        for _ in range(3):
+            record_view(self.tee.pk)
+        ProductLike.objects.create(user=self.buyer, product=self.tee)
+        rollup_days(self.today)
+        rollup_days(self.today)
+        stats = ProductDailyStats.objects.get(product=self.tee, day=self.today)
+        self.assertEqual((stats.views, stats.likes, stats.seller_id), (3, 1, self.seller.pk))
+
+    def test_incremental_rollup_and_api(self):
+        record_view(self.tee.pk)
+        record_view(self.tee.pk)
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.tee)
+        self._order(self.tee, 2)
+        self._order(self.cap, 1, days_ago=1)
+        self._order(self.cap, 5, status='cancelled')
+        days, _ = run_rollup()
+        self.assertIn(self.today, days)
+
+        data = self.client.get('/api/seller/analytics/?days=7', **self.auth).json()
+        self.assertEqual(len(data['series']), 7)
+        self.assertEqual(data['totals']['orders'], 2)
+        self.assertEqual(data['totals']['units_sold'], 3)
+        self.assertEqual(data['series'][-1]['add_to_carts'], 1)
+        self.assertEqual(data['series'][-1]['conversion_rate'], 0.5)
+
+        top = self.client.get('/api/seller/analytics/top-products/?metric=revenue', **self.auth).json()
+        self.assertEqual([row['product_name'] for row in top['results']], ['Tee', 'Cap'])
+
+        # The cancelled order flipping back is picked up by the next incremental run
+        cancelled = Order.objects.get(status='cancelled')
+        cancelled.status = 'confirmed'
+        cancelled.save()
+        run_rollup()
+        self.assertEqual(ProductDailyStats.objects.get(product=self.cap, day=self.today).units_sold, 5)
+
+    def test_deleting_from_a_past_day_rerolls_it(self):
+        like = ProductLike.objects.create(user=self.buyer, product=self.tee)
+        ProductLike.objects.filter(pk=like.pk).update(created_at=timezone.now() - timedelta(days=3))
+        order = self._order(self.cap, 2, days_ago=3)
+        day = self.today - timedelta(days=3)
+        rollup_days(day)
+        stats = ProductDailyStats.objects.get(product=self.tee, day=day)
+        self.assertEqual(stats.likes, 1)
+
+        ProductLike.objects.filter(pk=like.pk).delete()
+        order.delete()
+        days, _ = run_rollup()
+        self.assertIn(day, days)
+        self.assertEqual(ProductDailyStats.objects.get(product=self.tee, day=day).likes, 0)
+        self.assertEqual(ProductDailyStats.objects.get(product=self.cap, day=day).units_sold, 0)
+        self.assertFalse(StaleStatsDay.objects.exists())
+
+    def test_backfill_builds_history(self):
+        self._order(self.cap, 4, days_ago=10)
+        call_command('backfill_analytics', stdout=io.StringIO())
+        stats = ProductDailyStats.objects.get(product=self.cap)
+        self.assertEqual((stats.day, stats.units_sold), (self.today - timedelta(days=10), 4))
+
+    def test_series_is_a_single_rollup_query(self):
+        # One for authentication, one over the rollup table
+        with self.assertNumQueries(2):
+            self.client.get('/api/seller/analytics/', **self.auth)
+        self.assertEqual(self.client.get('/api/seller/analytics/?start=2025-02-01&end=2025-01-01', **self.auth).status_code, 400)
+        self.assertEqual(self.client.get('/api/seller/analytics/top-products/?metric=bogus', **self.auth).status_code, 400)
+
+    def test_out_of_range_windows_are_a_bad_request(self):
+        for query in ('days=99999999999', 'days=0', 'days=-5', 'end=0001-01-05&days=30'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/seller/analytics/?{query}', **self.auth).status_code, 400)
+
+
+class LowStockTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass', email='seller@example.com')
+        self.product = Product.objects.create(seller=self.seller, product_name='Tee', gender='Unisex',
+                                              base_price=Decimal('10'), stock_quantity=50, low_stock_threshold=5)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.seller).access_token}'}
+
+    def test_flag_and_alert_follow_stock_changes(self):
+        self.assertFalse(self.product.is_low_stock)
+        self.product.stock_quantity = 3
+        self.product.save()
+        self.assertTrue(Product.objects.get(pk=self.product.pk).is_low_stock)
+        self.assertEqual(LowStockAlert.objects.get().stock_quantity, 3)
+
+        # Saving again without a stock change doesn't re-check or re-alert
+        self.product.description = 'Soft'
+        with CaptureQueriesContext(connection) as queries:
+            self.product.save()
+        self.assertFalse([q for q in queries.captured_queries if 'lowstockalert' in q['sql'].lower()])
+
+        self.product.stock_quantity = 20
+        self.product.save()
+        alert = LowStockAlert.objects.get()
+        self.assertFalse(Product.objects.get(pk=self.product.pk).is_low_stock)
+        self.assertIsNotNone(alert.resolved_at)
+
+    def test_variants_and_bulk_updates(self):
+        variant = ProductVariant.objects.create(product=self.product, sku='TEE-S', stock_quantity=1)
+        self.assertTrue(Product.objects.get(pk=self.product.pk).is_low_stock)
+        variant.delete()
+        self.assertFalse(Product.objects.get(pk=self.product.pk).is_low_stock)
+
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=0)
+        newly_low, _ = refresh_low_stock([self.product.pk])
+        self.assertEqual(newly_low, {self.product.pk})
+
+    def test_saving_a_stale_instance_keeps_the_flag(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        ProductVariant.objects.create(product=self.product, sku='TEE-S', stock_quantity=1)
+        self.assertFalse(stale.is_low_stock)
+        stale.description = 'Soft'
+        stale.save()
+        self.assertTrue(Product.objects.get(pk=self.product.pk).is_low_stock)
+
+    def test_endpoint_pages_lowest_first_and_digest_batches(self):
+        for stock in (4, 0, 2):
+            Product.objects.create(seller=self.seller, product_name=f'Low {stock}', gender='Unisex',
+                                   base_price=Decimal('10'), stock_quantity=stock, low_stock_threshold=5)
+        data = self.client.get('/api/seller/low-stock/', **self.auth).json()
+        self.assertEqual([row['lowest_stock'] for row in data['results']], [0, 2, 4])
+        self.assertIsNone(data['next'])
+
+        self.assertEqual(send_low_stock_digests(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('3 product(s)', mail.outbox[0].subject)
+        self.assertEqual(send_low_stock_digests(), 0)
+
+
+class BulkStockUpdateTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        other = User.objects.create_user(username='other', password='pass')
+        self.tee = Product.objects.create(seller=self.seller, product_name='Tee', gender='Unisex', base_price=Decimal('10'),
+                                          sku='TEE', barcode='4006381333931', stock_quantity=50)
+        self.cap = Product.objects.create(seller=self.seller, product_name='Cap', gender='Unisex', base_price=Decimal('10'),
+                                          barcode='DUP', stock_quantity=50)
+        Product.objects.create(seller=self.seller, product_name='Hat', gender='Unisex', base_price=Decimal('10'), barcode='DUP')
+        Product.objects.create(seller=other, product_name='Other', gender='Unisex', base_price=Decimal('10'), sku='OTHER')
+        self.variant = ProductVariant.objects.create(product=self.cap, sku='CAP-L', stock_quantity=50)
+
+    def test_codes_resolve_against_skus_barcodes_and_variants(self):
+        rows = [
+            (1, {'sku': 'TEE', 'quantity': 30}),
+            (2, {'barcode': '4006381333931', 'quantity': 40}),
+            (3, {'sku': 'CAP-L', 'quantity': 2}),
+            (4, {'sku': 'DUP', 'quantity': 5}),
+            (5, {'sku': 'OTHER', 'quantity': 5}),
+            (6, {'sku': 'TEE', 'quantity': -1}),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            result = StockUpdater(self.seller).run(iter(rows))
+        updates = [q['sql'] for q in queries.captured_queries
+                   if q['sql'].replace('"', '').replace('`', '').startswith('UPDATE WearUpBack_product SET stock_quantity')]
+
+        self.assertEqual(len(updates), 1)
+        self.assertEqual((result['updated_products'], result['updated_variants']), (1, 1))
+        self.assertEqual(result['unknown'], ['OTHER'])
+        self.assertEqual(result['ambiguous'], ['DUP'])
+        self.assertEqual(result['errors'], [{'row': 6, 'error': 'quantity must not be negative'}])
+        # Both rows name the tee; the later one wins
+        self.assertEqual(Product.objects.get(pk=self.tee.pk).stock_quantity, 40)
+        self.assertEqual(ProductVariant.objects.get(pk=self.variant.pk).stock_quantity, 2)
+        self.assertTrue(Product.objects.get(pk=self.cap.pk).is_low_stock)
+
+    def test_endpoint_accepts_json_items(self):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.seller).access_token}'}
+        response = self.client.post('/api/inventory/bulk-update/', {'items': [{'sku': 'TEE', 'quantity': 7}, 'junk']},
+                                    content_type='application/json', **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['errors'], [{'row': 2, 'error': 'Expected an object'}])
+        self.assertEqual(Product.objects.get(pk=self.tee.pk).stock_quantity, 7)
+
+        response = self.client.post('/api/inventory/bulk-update/', {'items': 'TEE'}, content_type='application/json', **auth)
+        self.assertEqual(response.status_code, 400)
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(product_name='Tee', gender='Unisex', base_price=Decimal('10'), stock_quantity=10)
+        self.item = item_key(self.product.pk)
+
+    def test_on_hand_is_snapshot_plus_tail(self):
+        record_movement(self.product.pk, 'sale', -3, reference='order-1')
+        record_movement(self.product.pk, 'return', 1)
+        self.assertEqual(on_hand(self.product.pk), 8)
+        # The column is settled by the next snapshot run
+        self.assertEqual(verify([self.item])[self.item]['column'], 10)
+
+        self.assertEqual(take_snapshots(now=timezone.now() + timedelta(minutes=10)), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 8)
+        self.assertEqual(verify([self.item]), {})
+
+        record_movement(self.product.pk, 'receipt', 5)
+        with self.assertNumQueries(3):
+            self.assertEqual(on_hand(self.product.pk), 13)
+
+    def test_setting_stock_locks_the_item_and_applies_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            set_on_hand({self.item: 4}, note='Count')
+        set_on_hand({self.item: 4}, note='Count')
+        self.assertEqual(on_hand(self.product.pk), 4)
+        self.assertEqual(StockMovement.objects.filter(note='Count').count(), 1)
+        if connection.features.has_select_for_update:
+            self.assertTrue(any('FOR UPDATE' in query['sql'] for query in queries.captured_queries))
+
+    def test_movements_are_append_only_and_signed(self):
+        movement = record_movement(self.product.pk, 'receipt', 2)
+        with self.assertRaises(ValueError):
+            record_movement(self.product.pk, 'sale', 2)
+        movement.quantity = 5
+        with self.assertRaises(ValueError):
+            movement.save()
+
+    def test_relative_movements_take_no_row_lock(self):
+        variant = ProductVariant.objects.create(product=self.product, sku='TEE-M', stock_quantity=4)
+        with CaptureQueriesContext(connection) as queries:
+            record_movement(self.product.pk, 'sale', -1, variant.pk)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(on_hand(self.product.pk, variant.pk), 3)
+
+    def test_direct_writes_are_recorded_as_adjustments(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock_quantity = 25
+        product.save()
+        self.assertEqual(
+            list(StockMovement.objects.filter(item=self.item).order_by('pk').values_list('kind', 'quantity')),
+            [('adjustment', 10), ('adjustment', 15)],
+        )
+
+        product.description = 'Soft'
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        self.assertEqual(StockMovement.objects.filter(item=self.item).count(), 2)
+        self.assertFalse([q for q in queries.captured_queries if 'stockmovement' in q['sql'].lower() or 'stocksnapshot' in q['sql'].lower()])
+
+    def test_verify_command_rebuilds_from_the_ledger(self):
+        StockSnapshot.objects.create(item=self.item, quantity=99, last_movement_id=StockMovement.objects.latest('pk').pk)
+        with self.assertRaises(CommandError):
+            call_command('verify_stock_ledger', stderr=io.StringIO())
+
+        out = io.StringIO()
+        call_command('verify_stock_ledger', '--rebuild', stdout=out, stderr=io.StringIO())
+        self.assertIn('Rebuilt 1 item(s)', out.getvalue())
+        self.assertEqual(on_hand(self.product.pk), 10)
+        call_command('verify_stock_ledger', stdout=io.StringIO())
+
+
+# name: (method, path, caller, request body, query budget, wall-time baseline in ms).
+# Paths are formatted with the fixture ids; the caller is a fixture user or None.
+# Budgets are for a cold cache and must not grow with the number of rows: the
+# fixture has several of everything, so an N+1 shows up as a blown budget.
+# Query budgets always apply. Timings vary too much between machines to fail
+# on by default; set ENDPOINT_TIME_SLACK (e.g. 1.5) to also fail endpoints
+# slower than baseline x slack.
+ENDPOINT_BUDGETS = {
+    'product-list': ('get', '/api/products/', None, None, 6, 100),
+    'product-detail': ('get', '/api/products/{product}/', 'seller', None, 14, 100),
+    'productlike-list': ('get', '/api/product-likes/', 'buyer', None, 1, 50),
+    'productlike-detail': ('get', '/api/product-likes/{like}/', 'buyer', None, 1, 50),
+    'productcomment-list': ('get', '/api/product-comments/?product={product}', None, None, 3, 75),
+    'productcomment-detail': ('get', '/api/product-comments/{comment}/', 'buyer', None, 3, 50),
+    'productshare-list': ('get', '/api/product-shares/', 'buyer', None, 1, 50),
+    'productshare-detail': ('get', '/api/product-shares/{share}/', 'buyer', None, 1, 50),
+    'cart-list': ('get', '/api/carts/', 'buyer', None, 8, 100),
+    'cart-detail': ('get', '/api/carts/{cart}/', 'buyer', None, 8, 100),
+    'cartitem-list': ('get', '/api/cart-items/', 'buyer', None, 7, 100),
+    'cartitem-detail': ('get', '/api/cart-items/{cart_item}/', 'buyer', None, 7, 100),
+    'order-list': ('get', '/api/orders/', 'buyer', None, 8, 100),
+    'order-detail': ('get', '/api/orders/{order}/', 'buyer', None, 8, 100),
+    'orderitem-list': ('get', '/api/order-items/', 'buyer', None, 7, 100),
+    'orderitem-detail': ('get', '/api/order-items/{order_item}/', 'buyer', None, 7, 100),
+    'register': ('post', '/api/auth/register/', None,
+                 {'username': 'newcomer', 'email': 'newcomer@example.com', 'password': 'pass12345'}, 7, 1500),
+    'login': ('post', '/api/auth/login/', None, {'email': 'buyer@example.com', 'password': 'pass'}, 2, 1500),
+    'logout': ('post', '/api/auth/logout/', 'buyer', {'refresh_token': '{refresh}'}, 7, 50),
+    'profile': ('get', '/api/auth/profile/', 'buyer', None, 2, 50),
+    'token_refresh': ('post', '/api/auth/token/refresh/', None, {'refresh': '{refresh}'}, 2, 50),
+    'public_user_profile': ('get', '/api/users/{seller_id}/', None, None, 1, 50),
+    'storefront': ('get', '/api/users/{seller_id}/storefront/', None, None, 8, 150),
+}
+
+
+class EndpointBudgetTests(TestCase):
+    """Query-count and wall-time budgets for the router and auth endpoints.
+
+    Wall time is the best of a few cold-cache runs; set ENDPOINT_TIME_SLACK to
+    scale the baselines on slower machines.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username='seller', password='pass', email='seller@example.com')
+        cls.buyer = User.objects.create_user(username='buyer', password='pass', email='buyer@example.com')
+        fans = [User.objects.create_user(username=f'fan{i}', password='pass') for i in range(3)]
+        UserProfile.objects.create(user=cls.seller, role='seller', business_name='Threads')
+        UserProfile.objects.create(user=cls.buyer)
+
+        sizes = [Size.objects.create(name=name) for name in ('S', 'M', 'L')]
+        categories = [Category.objects.create(name=name) for name in ('Tops', 'Summer')]
+        products = []
+        for i in range(5):
+            product = Product.objects.create(seller=cls.seller, product_name=f'Tee {i}', gender='Unisex',
+                                             base_price=Decimal('20'), stock_quantity=30, sku=f'TEE-{i}')
+            product.categories.set(categories)
+            product.sizes.set(sizes)
+            for order in range(2):
+                ProductImage.objects.create(product=product, image=f'products/tee-{i}-{order}.jpg', is_main=order == 0, order=order)
+            for size in sizes:
+                ProductVariant.objects.create(product=product, size=size, sku=f'TEE-{i}-{size.name}', stock_quantity=10)
+            for user in [cls.buyer, *fans]:
+                ProductLike.objects.create(user=user, product=product)
+                ProductShare.objects.create(user=user, product=product, platform='copy_link')
+                comment = ProductComment.objects.create(user=user, product=product, content='Nice')
+                ProductComment.objects.create(user=cls.seller, product=product, content='Thanks', parent=comment)
+            products.append(product)
+
+        cart = Cart.objects.create(user=cls.buyer)
+        for product in products[:3]:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        for number in range(2):
+            order = Order.objects.create(user=cls.buyer, order_number=f'WU-{number}',
+                                         subtotal=Decimal('60'), total_amount=Decimal('60'))
+            for product in products[:3]:
+                OrderItem.objects.create(order=order, product=product, quantity=1,
+                                         unit_price=Decimal('20'), total_price=Decimal('20'))
+
+        cls.ids = {
+            'product': products[0].pk,
+            'like': ProductLike.objects.filter(user=cls.buyer).first().pk,
+            'comment': ProductComment.objects.filter(user=cls.buyer).first().pk,
+            'share': ProductShare.objects.filter(user=cls.buyer).first().pk,
+            'cart': cart.pk,
+            'cart_item': cart.items.first().pk,
+            'order': order.pk,
+            'order_item': order.items.first().pk,
+            'seller_id': cls.seller.pk,
+        }
+
+    def _cold_caches(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        for tiered in (PRODUCT_DETAILS, SELLER_CARDS, STOREFRONT_STATS):
+            tiered.local.clear()
+        # Built once per worker and then refreshed in the background of requests
+        REVOKED_TOKENS.rebuild()
+
+    def _call(self, name):
+        method, path, caller, body, _, _ = ENDPOINT_BUDGETS[name]
+        ids = {**self.ids, 'refresh': str(RefreshToken.for_user(self.buyer))}
+        headers = {}
+        if caller:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {ClaimsAccessToken.for_user(getattr(self, caller))}'
+        if body is not None:
+            body = {key: value.format(**ids) for key, value in body.items()}
+        self._cold_caches()
+        with QueryLog() as log:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(path.format(**ids), body, content_type='application/json', **headers)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        self.assertLess(response.status_code, 400, f'{name}: {response.status_code} {getattr(response, "data", "")}')
+        return log, elapsed_ms
+
+    def test_every_router_and_auth_endpoint_has_a_budget(self):
+        from Backend.urls import router
+        routes = {f'{basename}-{suffix}' for _, _, basename in router.registry for suffix in ('list', 'detail')}
+        auth = {'register', 'login', 'logout', 'profile', 'token_refresh', 'public_user_profile', 'storefront'}
+        self.assertEqual((routes | auth) - set(ENDPOINT_BUDGETS), set())
+
+    def test_endpoints_stay_within_budget(self):
+        slack = os.environ.get('ENDPOINT_TIME_SLACK')
+        slack = float(slack) if slack else None
+        failures = []
+        for name, (method, _, _, _, max_queries, baseline_ms) in ENDPOINT_BUDGETS.items():
+            with self.subTest(endpoint=name):
+                log, elapsed_ms = self._call(name)
+                if slack and method == 'get':
+                    elapsed_ms = min([elapsed_ms] + [self._call(name)[1] for _ in range(2)])
+                if len(log) > max_queries:
+                    origins = '\n'.join(f'  {count} x {origin}' for origin, count in log.by_origin())
+                    failures.append(f'{name}: {len(log)} queries (budget {max_queries}), issued by:\n{origins}')
+                if slack and elapsed_ms > baseline_ms * slack:
+                    failures.append(f'{name}: {elapsed_ms:.0f}ms (baseline {baseline_ms}ms x {slack})')
+        self.assertEqual(failures, [], '\n'.join(failures))
+
+    def test_extra_queries_are_attributed_to_the_serializer_method(self):
+        cart = Cart.objects.get(user=self.buyer)
+        with QueryLog() as log:
+            CartSerializer(cart).data
+        origins = dict(log.by_origin())
+        self.assertIn('ProductSerializer.get_sizes', ' '.join(origins))
+        self.assertTrue(all(origin.startswith('serializers.py:') for origin in origins))
+
+
+class RequestInstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        REGISTRY.reset()
+        PRODUCT_DETAILS.local.clear()
+        self.seller = User.objects.create_user(username='seller', password='pass')
+        self.product = Product.objects.create(seller=self.seller, product_name='Tee', gender='Unisex', base_price=Decimal('20'))
+        ProductImage.objects.create(product=self.product, image='products/tee.jpg', is_main=True)
+
+    def test_server_timing_reports_queries_serialization_and_size(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/')
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        for phase in ('db;dur=', 'serialize;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(phase, timing)
+        self.assertIn(f'size;desc="{len(response.content)} bytes"', timing)
+
+    def test_metrics_endpoint_exposes_per_route_histograms(self):
+        for _ in range(2):
+            self.client.get('/api/products/')
+        self.client.get('/api/products/0/')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE wearup_request_duration_seconds histogram', body)
+        self.assertIn('wearup_request_duration_seconds_count{route="product-list",method="GET"} 2', body)
+        self.assertIn('wearup_request_queries_bucket{route="product-list",method="GET",le="+Inf"} 2', body)
+        self.assertIn('wearup_http_responses_total{route="product-detail",method="GET",status="404"} 1', body)
+
+    def test_metrics_adds_up_every_live_worker(self):
+        self.client.get('/api/products/')
+        labels = (('route', 'product-list'), ('method', 'GET'))
+        other = {'histograms': {}, 'counters': {('http_responses_total', (*labels, ('status', '200'))): 5}}
+        cache.set('metrics:worker:other', other)
+        cache.set(WORKERS_KEY, {'other', 'gone'})
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('wearup_http_responses_total{route="product-list",method="GET",status="200"} 6', body)
+        self.assertNotIn('gone', cache.get(WORKERS_KEY))
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_token_is_required_when_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOW_ANONYMOUS=False)
+    def test_metrics_is_refused_without_a_token_outside_local_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(SLOW_QUERY_SECONDS=0)
+    def test_slow_queries_are_logged_with_the_code_that_issued_them(self):
+        with self.assertLogs('WearUpBack.instrumentation', 'WARNING') as logs:
+            self.client.get('/api/products/')
+        self.assertTrue(all('GET product-list' in line for line in logs.output))
+        self.assertTrue(any('ProductViewSet' in line or 'serializers.py:' in line for line in logs.output), logs.output)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn(f'wearup_slow_queries_total{{route="product-list",method="GET"}} {len(logs.output)}', body)
+
+
+class BenchCommandTests(TestCase):
+    TINY = ['--users', '6', '--sellers', '2', '--products', '10', '--variants', '1', '--likes', '20',
+            '--comments', '10', '--shares', '5', '--carts', '2', '--orders', '5']
+
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(route_names() - set(SCENARIOS), set())
+        self.assertEqual(set(SCENARIOS) - route_names(), set())
+
+    def _bench(self, *args):
+        out = io.StringIO()
+        call_command('bench', '--concurrency', '1', '--requests', '2', *args, stdout=out, stderr=io.StringIO())
+        return json.loads(out.getvalue())
+
+    def test_seeds_runs_and_compares_against_a_baseline(self):
+        with self.assertRaises(CommandError):
+            self._bench()
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'baseline.json')
+        endpoints = 'product-detail,order-list,import_catalog,logout,storefront'
+        report = self._bench('--seed', *self.TINY, '--endpoints', endpoints, '--save-baseline', path)
+        self.assertEqual(report['seeded']['products'], 10)
+        self.assertEqual(report['seeded']['orders'], 5)
+        results = report['results']['1']
+        self.assertEqual(set(results), set(endpoints.split(',')))
+        for name, summary in results.items():
+            self.assertEqual((summary['requests'], summary['errors']), (2, 0), name)
+        self.assertGreater(results['order-list']['queries_per_request'], 0)
+        # Imports go to the writer, not the seller whose routes are measured
+        self.assertEqual(Product.objects.filter(seller__username='bench-seller-0').count(), 5)
+        self.assertGreater(Product.objects.filter(seller__username='bench-seller-1').count(), 5)
+
+        with open(path) as f:
+            baseline = json.load(f)
+        baseline['results']['1']['order-list']['queries_per_request'] = 1
+        with open(path, 'w') as f:
+            json.dump(baseline, f)
+        with self.assertRaisesMessage(CommandError, '1 regression(s)'):
+            self._bench('--endpoints', 'order-list', '--baseline', path, '--tolerance', '1000')
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(PROFILE_REPORTS_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.staff = User.objects.create_user(username='ops', password='pass', is_staff=True, is_superuser=True)
+        self.buyer = User.objects.create_user(username='buyer', password='pass')
+        seller = User.objects.create_user(username='seller', password='pass')
+        for i in range(3):
+            Product.objects.create(seller=seller, product_name=f'Tee {i}', gender='Unisex', base_price=Decimal('20'))
+
+    def _get(self, path, user=None, **extra):
+        if user is not None:
+            extra['HTTP_AUTHORIZATION'] = f'Bearer {RefreshToken.for_user(user).access_token}'
+        return self.client.get(path, **extra)
+
+    def test_staff_request_is_profiled_with_its_sql(self):
+        response = self._get('/api/products/?_profile=1', self.staff)
+        self.assertEqual(response.status_code, 200)
+        report = ProfileReport.objects.get()
+        self.assertEqual(response['X-Profile-Report'], f'/admin/WearUpBack/profilereport/{report.pk}/change/')
+        self.assertEqual((report.view_name, report.user, report.status_code), ('product-list', self.staff, 200))
+        self.assertIn('list', report.stats)
+        self.assertEqual(report.query_count, len(report.queries))
+        self.assertTrue(any('WearUpBack_product' in query['sql'] for query in report.queries))
+        self.assertTrue(profile_storage().exists(report.profile_file))
+
+    def test_header_and_session_staff_work_too(self):
+        self.client.force_login(self.staff)
+        self.client.get('/api/products/', HTTP_X_PROFILE='1')
+        self.assertEqual(ProfileReport.objects.count(), 1)
+
+    def test_other_requests_are_not_profiled(self):
+        self.assertNotIn('X-Profile-Report', self._get('/api/products/?_profile=1', self.buyer))
+        self.assertNotIn('X-Profile-Report', self._get('/api/products/?_profile=1'))
+        self.assertNotIn('X-Profile-Report', self._get('/api/products/', self.staff))
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_admin_shows_and_serves_the_report(self):
+        self._get('/api/products/?_profile=1', self.staff)
+        report = ProfileReport.objects.get()
+        self.client.force_login(self.staff)
+        page = self.client.get(f'/admin/WearUpBack/profilereport/{report.pk}/change/')
+        self.assertContains(page, 'WearUpBack_product')
+        download = self.client.get(f'/admin/WearUpBack/profilereport/{report.pk}/download/')
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(b''.join(download.streaming_content))
+
+    def test_old_reports_are_pruned_with_their_files(self):
+        for _ in range(3):
+            self._get('/api/products/?_profile=1', self.staff)
+        oldest = ProfileReport.objects.order_by('pk').first()
+        prune_reports(keep=2)
+        self.assertEqual(ProfileReport.objects.count(), 2)
+        self.assertFalse(profile_storage().exists(oldest.profile_file))
+
+
+class EmailLoginTests(TestCase):
+    def setUp(self):
+        LOGIN_FAILURES.reset()
+        self.addCleanup(LOGIN_FAILURES.reset)
+        self.user = User.objects.create_user(username='buyer', password='pass', email='Buyer@Example.com')
+
+    def _login(self, email, password='pass'):
+        return self.client.post('/api/auth/login/', {'email': email, 'password': password}, content_type='application/json')
+
+    def test_login_is_one_lookup_and_ignores_case(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._login('buyer@EXAMPLE.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['id'], self.user.pk)
+        lookups = [query['sql'] for query in queries.captured_queries if 'FROM "auth_user"' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertIn('LOWER("auth_user"."email")', lookups[0])
+
+    def test_email_index_exists(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, User._meta.db_table)
+        self.assertIn('auth_user_email_ci_unique', constraints)
+        self.assertTrue(constraints['auth_user_email_ci_unique']['unique'])
+
+    def test_lookup_uses_the_email_index(self):
+        queryset = users_with_email('buyer@example.com')
+        self.assertIn('auth_user_email_ci_unique', queryset.explain())
+        self.assertEqual(list(queryset), [self.user])
+
+    def test_email_is_unique_ignoring_case(self):
+        response = self.client.post('/api/auth/register/', {'username': 'copy', 'email': 'BUYER@example.com', 'password': 'pass12345'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.data)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username='copy', password='pass', email='buyer@example.COM')
+        # Users without an email don't collide
+        User.objects.create_user(username='a', password='pass')
+        User.objects.create_user(username='b', password='pass')
+
+    def test_repeated_failures_are_throttled_without_hashing(self):
+        for _ in range(settings.LOGIN_FAILURE_LIMIT):
+            self.assertEqual(self._login('buyer@example.com', 'wrong').status_code, 400)
+        with CaptureQueriesContext(connection) as queries:
+            response = self._login('buyer@example.com')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(len(queries), 0)
+        # Other addresses, and the same address from another client, are unaffected
+        User.objects.create_user(username='other', password='pass', email='other@example.com')
+        self.assertEqual(self._login('other@example.com').status_code, 200)
+        response = self.client.post('/api/auth/login/', {'email': 'buyer@example.com', 'password': 'pass'},
+                                    content_type='application/json', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    def test_registration_racing_another_is_a_bad_request(self):
+        def register_first(sender, instance, **kwargs):
+            if instance.username == 'late':
+                User.objects.create_user(username='early', password='pass', email='new@example.com')
+
+        pre_save.connect(register_first, sender=User)
+        self.addCleanup(pre_save.disconnect, register_first, sender=User)
+        response = self.client.post('/api/auth/register/', {'username': 'late', 'email': 'New@example.com', 'password': 'pass12345'},
+                                    content_type='application/json')
+        # The racing user rolls back with the failed insert here, so which
+        # field gets the error can't be checked; a committed one gets 'email'
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(username='late').exists())
+
+        serializer = RegisterSerializer(data={'username': 'late', 'email': 'Late@example.com', 'password': 'pass12345'})
+        self.assertTrue(serializer.is_valid())
+        User.objects.create_user(username='early2', password='pass', email='late@example.com')
+        self.assertEqual(list(serializer.duplicate_errors()), ['email'])
+
+    def test_sliding_window_forgets_old_failures(self):
+        counter = SlidingWindowCounter(limit=2, window=10, max_keys=2)
+        counter.hit('a', now=0)
+        counter.hit('a', now=5)
+        self.assertEqual(counter.retry_after('a', now=6), 4)
+        self.assertEqual(counter.retry_after('a', now=10), 0)
+        counter.hit('b', now=11)
+        counter.hit('c', now=11)
+        self.assertEqual(set(counter._events), {'b', 'c'})
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='pass', email='buyer@example.com')
+        UserProfile.objects.create(user=self.user, role='buyer')
+        seller = User.objects.create_user(username='seller', password='pass')
+        self.product = Product.objects.create(seller=seller, product_name='Tee', gender='Unisex', base_price=Decimal('20'))
+
+    def _user_queries(self, method, path, token, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path, HTTP_AUTHORIZATION=f'Bearer {token}', content_type='application/json', **kwargs)
+        return response, [query['sql'] for query in queries.captured_queries if 'FROM "auth_user"' in query['sql']]
+
+    def test_login_issues_claims(self):
+        response = self.client.post('/api/auth/login/', {'email': 'buyer@example.com', 'password': 'pass'}, content_type='application/json')
+        access = AccessToken(response.data['tokens']['access'])
+        self.assertEqual((access['username'], access['role'], access['is_staff']), ('buyer', 'buyer', False))
+
+    def test_reads_do_not_load_the_user(self):
+        ProductLike.objects.create(user=self.user, product=self.product)
+        response, lookups = self._user_queries('get', '/api/product-likes/', ClaimsAccessToken.for_user(self.user))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results'] if 'results' in response.data else response.data), 1)
+        self.assertEqual(lookups, [])
+        # Tokens without the claims still work, with the lookup
+        response, lookups = self._user_queries('get', '/api/product-likes/', RefreshToken.for_user(self.user).access_token)
+        self.assertEqual((response.status_code, len(lookups)), (200, 1))
+
+    def test_claims_user_loads_other_fields_on_demand(self):
+        token = ClaimsAccessToken.for_user(self.user)
+        user = claims_user(token)
+        self.assertEqual((user.pk, user.username, user.role), (self.user.pk, 'buyer', 'buyer'))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'buyer@example.com')
+
+    def test_writes_load_the_full_user(self):
+        token = ClaimsAccessToken.for_user(self.user)
+        response, lookups = self._user_queries('put', '/api/auth/profile/', token, data={'first_name': 'Ada'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(lookups)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.email), ('Ada', 'buyer@example.com'))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response, _ = self._user_queries('put', '/api/auth/profile/', token, data={'first_name': 'Bea'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_picks_up_role_changes(self):
+        refresh = ClaimsRefreshToken.for_user(self.user)
+        UserProfile.objects.filter(user=self.user).update(role='seller')
+        response = self.client.post('/api/auth/token/refresh/', {'refresh': str(refresh)}, content_type='application/json')
+        self.assertEqual(AccessToken(response.data['access'])['role'], 'seller')
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        REVOKED_TOKENS.reset()
+        self.addCleanup(REVOKED_TOKENS.reset)
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='pass')
+
+    def _refresh(self, token):
+        return self.client.post('/api/auth/token/refresh/', {'refresh': str(token)}, content_type='application/json')
+
+    def _blacklist_queries(self, token):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._refresh(token)
+        return response, [query['sql'] for query in queries.captured_queries if 'token_blacklist_blacklistedtoken' in query['sql']]
+
+    def test_live_tokens_skip_the_blacklist_table(self):
+        token = ClaimsRefreshToken.for_user(self.user)
+        REVOKED_TOKENS.rebuild()
+        response, lookups = self._blacklist_queries(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(lookups, [])
+
+    def test_logout_revokes_before_the_next_snapshot(self):
+        token = ClaimsRefreshToken.for_user(self.user)
+        REVOKED_TOKENS.rebuild()
+        access = ClaimsAccessToken.for_user(self.user)
+        response = self.client.post('/api/auth/logout/', {'refresh_token': str(token)}, content_type='application/json',
+                                    HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 205)
+        # Another worker: a snapshot from before the logout, but the same cache
+        REVOKED_TOKENS.filter = BloomFilter(1024)
+        response, lookups = self._blacklist_queries(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(len(lookups), 1)
+
+    def test_snapshot_holds_blacklisted_tokens(self):
+        token = ClaimsRefreshToken.for_user(self.user)
+        token.blacklist()
+        cache.clear()
+        REVOKED_TOKENS.rebuild()
+        self.assertTrue(REVOKED_TOKENS.might_be_revoked(token['jti']))
+        self.assertFalse(REVOKED_TOKENS.might_be_revoked('never-issued'))
+
+    def test_bloom_filter_false_positive_rate(self):
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 50)
+
+    def test_purge_deletes_only_expired_tokens(self):
+        live = ClaimsRefreshToken.for_user(self.user)
+        live.blacklist()
+        for _ in range(5):
+            ClaimsRefreshToken.for_user(self.user).blacklist()
+        expired = OutstandingToken.objects.exclude(jti=live['jti'])
+        expired.update(expires_at=timezone.now() - timedelta(days=1))
+        out = io.StringIO()
+        call_command('purge_tokens', '--batch-size', '2', stdout=out)
+        self.assertIn('5 expired token(s) deleted', out.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+        self.assertEqual(purge_expired_tokens(), 0)
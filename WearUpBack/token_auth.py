@@ -0,0 +1,117 @@
+"""JWT authentication that answers read requests from the token's claims.
+
+Tokens issued by login and register (ClaimsRefreshToken) carry the user's
+username, staff flags and UserProfile.role next to the user id. For GET, HEAD
+and OPTIONS requests ClaimsJWTAuthentication builds request.user from those
+claims without touching the database: a real User instance whose other
+fields are deferred, so reading one of them loads it on demand. It also
+carries the profile role as user.role. Write requests get the full User,
+loaded from the database the first time request.user is used, with the
+usual active-account check.
+
+Claims can be as old as the access token; a token refresh re-reads them, so
+a role, staff or active change reaches read requests within
+SIMPLE_JWT['ACCESS_TOKEN_LIFETIME']. Tokens without the claims, issued
+before this, authenticate as before.
+"""
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.utils.functional import SimpleLazyObject
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .models import UserProfile
+from .revocation import REVOKED_TOKENS
+
+CLAIMS = ('username', 'role', 'is_staff', 'is_superuser')
+
+
+def user_claims(user):
+    try:
+        role = user.profile.role
+    except UserProfile.DoesNotExist:
+        role = None
+    return {'username': user.username, 'role': role, 'is_staff': user.is_staff, 'is_superuser': user.is_superuser}
+
+
+def stamp_claims(token, user):
+    for claim, value in user_claims(user).items():
+        token[claim] = value
+    return token
+
+
+class _ClaimsMixin:
+    @classmethod
+    def for_user(cls, user):
+        return stamp_claims(super().for_user(user), user)
+
+
+class ClaimsAccessToken(_ClaimsMixin, AccessToken):
+    pass
+
+
+class ClaimsRefreshToken(_ClaimsMixin, RefreshToken):
+    """A refresh token whose access tokens carry the claims ClaimsJWTAuthentication reads.
+
+    Its blacklist check asks the database only about tokens the revocation
+    snapshot may hold (WearUpBack/revocation.py).
+    """
+
+    def check_blacklist(self):
+        if REVOKED_TOKENS.might_be_revoked(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+
+def claims_user(token):
+    """A User built from the token, with every field the token doesn't carry deferred."""
+    values = {
+        api_settings.USER_ID_FIELD: User._meta.pk.to_python(token[api_settings.USER_ID_CLAIM]),
+        'username': token['username'],
+        'is_staff': token['is_staff'],
+        'is_superuser': token['is_superuser'],
+        # The token was only issued to, and is only refreshed for, an active user
+        'is_active': True,
+    }
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    user = User.from_db(None, names, [values[name] for name in names])
+    user.role = token['role']
+    return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication with DB-free reads; see the module docstring."""
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        if request.method not in SAFE_METHODS:
+            return SimpleLazyObject(partial(self.get_user, validated_token)), validated_token
+        if all(claim in validated_token for claim in CLAIMS):
+            return claims_user(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refreshes as usual, then stamps the new access token with the user's current claims."""
+
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data['access'])
+        user = User.objects.select_related('profile').filter(
+            **{api_settings.USER_ID_FIELD: access[api_settings.USER_ID_CLAIM]}
+        ).first()
+        if user is not None:
+            data['access'] = str(stamp_claims(access, user))
+        return data
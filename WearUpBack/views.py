@@ -1,13 +1,27 @@
 
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
-from .models import Product, UserProfile, Cart, CartItem, Order, OrderItem, ProductLike, ProductComment, ProductShare
-from .serializers import ProductSerializer, RegisterSerializer, LoginSerializer, UserSerializer, UserProfileSerializer, CartSerializer, CartItemSerializer, OrderSerializer, OrderItemSerializer, ProductLikeSerializer, ProductCommentSerializer, ProductShareSerializer
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch
+from django.utils import timezone
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from .models import Product, ProductVariant, PriceCampaign, UserProfile, Cart, CartItem, Order, OrderItem, ProductLike, ProductComment, ProductShare
+from .analytics import METRICS, record_view, time_series, top_products
+from .coupons import CouponError, evaluate_coupon, redeem_coupon
+from .pricing import apply_campaign, reprice_products, target_products
+from .catalog_import import CatalogImporter, RowError, guess_format, iter_rows
+from .storefront import seller_stats
+from .inventory import with_lowest_stock
+from .stock_sync import StockUpdater
+from .token_auth import ClaimsRefreshToken
+from .exports import gzip_stream, order_item_rows, product_rows, render_csv, render_jsonl
+from .serializers import cached_product_detail, ProductSerializer, RegisterSerializer, LoginSerializer, UserSerializer, UserProfileSerializer, PublicProfileSerializer, CartSerializer, CartItemSerializer, OrderSerializer, OrderItemSerializer, ProductLikeSerializer, ProductCommentSerializer, ProductShareSerializer, BulkRepriceSerializer, PriceCampaignSerializer
 
 
 # class CategoryViewSet(viewsets.ModelViewSet):
@@ -26,10 +40,10 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        instance.views += 1
-        instance.save()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        record_view(instance.pk)
+        data = cached_product_detail(instance.pk, request)
+        user_liked = request.user.is_authenticated and ProductLike.objects.filter(product=instance, user=request.user).exists()
+        return Response({**data, 'views': instance.views + 1, 'user_liked': user_liked})
 
     def get_queryset(self):
         if self.action == 'list':
@@ -49,10 +63,11 @@ class ProductViewSet(viewsets.ModelViewSet):
                 ) | queryset.filter(
                     description__icontains=search_query
                 ) | queryset.filter(
-                    categories__icontains=search_query
+                    categories__name__icontains=search_query
                 )
+                queryset = queryset.distinct()
 
-            return queryset
+            return ProductSerializer.setup_eager_loading(queryset, self.request.user)
         elif self.request.user.is_authenticated:
             return Product.objects.filter(seller=self.request.user)
         return Product.objects.none()
@@ -95,6 +110,11 @@ class ProductViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _eager_products(lookup, user):
+    # Cart and order lines nest a full ProductSerializer per line
+    return Prefetch(lookup, queryset=ProductSerializer.setup_eager_loading(Product.objects.all(), user))
+
+
 class ProductLikeViewSet(viewsets.ModelViewSet):
     queryset = ProductLike.objects.all()
     serializer_class = ProductLikeSerializer
@@ -121,8 +141,11 @@ class ProductCommentViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         product_id = self.request.query_params.get('product')
         if product_id:
-            return ProductComment.objects.filter(product_id=product_id)
-        return ProductComment.objects.filter(user=self.request.user)
+            queryset = ProductComment.objects.filter(product_id=product_id)
+        else:
+            queryset = ProductComment.objects.filter(user=self.request.user)
+        replies = ProductComment.objects.select_related('user').prefetch_related('replies')
+        return queryset.select_related('user').prefetch_related(Prefetch('replies', queryset=replies))
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -146,7 +169,7 @@ class CartViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        return Cart.objects.filter(user=self.request.user).prefetch_related(_eager_products('items__product', self.request.user))
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -158,7 +181,7 @@ class CartItemViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return CartItem.objects.filter(cart__user=self.request.user)
+        return CartItem.objects.filter(cart__user=self.request.user).prefetch_related(_eager_products('product', self.request.user))
 
     def perform_create(self, serializer):
         cart, created = Cart.objects.get_or_create(user=self.request.user)
@@ -171,7 +194,7 @@ class OrderViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).prefetch_related(_eager_products('items__product', self.request.user))
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -183,7 +206,7 @@ class OrderItemViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return OrderItem.objects.filter(order__user=self.request.user)
+        return OrderItem.objects.filter(order__user=self.request.user).prefetch_related(_eager_products('product', self.request.user))
 
 
 @api_view(['POST'])
@@ -191,8 +214,13 @@ class OrderItemViewSet(viewsets.ModelViewSet):
 def register_user(request):
     serializer = RegisterSerializer(data=request.data)
     if serializer.is_valid():
-        user = serializer.save()
-        refresh = RefreshToken.for_user(user)
+        try:
+            with transaction.atomic():
+                user = serializer.save()
+        except IntegrityError:
+            # A concurrent registration took the email or username after validation
+            return Response(serializer.duplicate_errors(), status=status.HTTP_400_BAD_REQUEST)
+        refresh = ClaimsRefreshToken.for_user(user)
         return Response({
             'user': UserSerializer(user).data,
             'tokens': {
@@ -206,10 +234,10 @@ def register_user(request):
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login_user(request):
-    serializer = LoginSerializer(data=request.data)
+    serializer = LoginSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         return Response({
             'user': UserSerializer(user).data,
             'tokens': {
@@ -225,7 +253,7 @@ def login_user(request):
 def logout_user(request):
     try:
         refresh_token = request.data["refresh_token"]
-        token = RefreshToken(refresh_token)
+        token = ClaimsRefreshToken(refresh_token)
         token.blacklist()
         return Response(status=status.HTTP_205_RESET_CONTENT)
     except Exception as e:
@@ -270,15 +298,51 @@ def user_profile(request):
 @permission_classes([AllowAny])
 def public_user_profile(request, user_id):
     try:
-        user = User.objects.get(id=user_id)
-        profile = UserProfile.objects.get(user=user)
-    except (User.DoesNotExist, UserProfile.DoesNotExist):
+        profile = UserProfile.objects.select_related('user').get(user_id=user_id)
+    except UserProfile.DoesNotExist:
         return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
     serializer = UserProfileSerializer(profile)
     return Response(serializer.data)
 
 
+STOREFRONT_PAGE_SIZE = 20
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def storefront(request, user_id):
+    """Seller profile, cached aggregate stats and one page (?page=, from 1) of active products."""
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 0
+    if page < 1:
+        return Response({'error': 'page must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        profile = UserProfile.objects.select_related('user').get(user_id=user_id)
+        stats = seller_stats(user_id)
+    except (UserProfile.DoesNotExist, User.DoesNotExist):
+        return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    # One row past the page tells whether there is a next one; the cached
+    # count can lag behind bulk writes
+    products = list(ProductSerializer.setup_eager_loading(
+        Product.objects.filter(seller_id=user_id, status='active'), request.user
+    ).order_by('-created_at', '-pk')[(page - 1) * STOREFRONT_PAGE_SIZE:page * STOREFRONT_PAGE_SIZE + 1])
+    has_next = len(products) > STOREFRONT_PAGE_SIZE
+    products = products[:STOREFRONT_PAGE_SIZE]
+    return Response({
+        'profile': PublicProfileSerializer(profile, context={'request': request}).data,
+        'stats': stats,
+        'products': {
+            'count': stats['product_count'],
+            'next': f'/api/users/{user_id}/storefront/?page={page + 1}' if has_next else None,
+            'results': ProductSerializer(products, many=True, context={'request': request}).data,
+        },
+    })
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def toggle_product_like(request, product_id):
@@ -320,3 +384,293 @@ def share_product(request, product_id):
         'platform': platform,
         'shares_count': product.shared_by.count()
     })
+
+
+def _parse_subtotal(value):
+    try:
+        subtotal = Decimal(str(value))
+    except (InvalidOperation, TypeError):
+        return None
+    # NaN and Infinity parse, but can't be compared or priced
+    return subtotal if subtotal.is_finite() and subtotal >= 0 else None
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def validate_coupon(request):
+    subtotal = _parse_subtotal(request.data.get('subtotal', 0))
+    if subtotal is None:
+        return Response({'error': 'Invalid subtotal'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        coupon, discount = evaluate_coupon(request.data.get('code'), subtotal)
+    except CouponError as e:
+        return Response({'valid': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'valid': True,
+        'code': coupon.code,
+        'discount_type': coupon.discount_type,
+        'discount_amount': discount,
+        'total_after_discount': subtotal - discount,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def redeem_coupon_view(request):
+    order = None
+    order_id = request.data.get('order')
+    if order_id:
+        try:
+            order = Order.objects.get(id=order_id, user=request.user)
+        except (Order.DoesNotExist, ValueError, TypeError):
+            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        if order.discount_amount:
+            return Response({'error': 'A coupon has already been applied to this order'}, status=status.HTTP_400_BAD_REQUEST)
+        subtotal = order.subtotal
+    else:
+        subtotal = _parse_subtotal(request.data.get('subtotal', 0))
+        if subtotal is None:
+            return Response({'error': 'Invalid subtotal'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        with transaction.atomic():
+            coupon, discount = redeem_coupon(request.data.get('code'), subtotal)
+            if order is not None:
+                # Conditional update so two concurrent redemptions can't both
+                # discount the same order; losing one rolls its coupon use back.
+                applied = Order.objects.filter(pk=order.pk, discount_amount=0).update(
+                    discount_amount=discount,
+                    total_amount=F('subtotal') + F('tax_amount') + F('shipping_amount') - discount,
+                )
+                if not applied:
+                    raise CouponError('A coupon has already been applied to this order')
+    except CouponError as e:
+        return Response({'redeemed': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'redeemed': True,
+        'code': coupon.code,
+        'discount_amount': discount,
+        'total_after_discount': subtotal - discount,
+        'order': order.id if order else None,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_reprice(request):
+    serializer = BulkRepriceSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+
+    # Sellers can only reprice their own catalogue; staff can target anyone's
+    seller = data.get('seller')
+    if not request.user.is_staff:
+        seller = request.user
+    category = data.get('category')
+    tag = data.get('tag', '')
+
+    if not data.get('starts_at') and not data.get('ends_at'):
+        products = target_products(category=category, seller=seller, tag=tag)
+        updated = reprice_products(products, data['discount_percentage'])
+        return Response({'updated': updated})
+
+    campaign = PriceCampaign.objects.create(
+        name=data.get('name') or f"{data['discount_percentage']}% off",
+        discount_percentage=data['discount_percentage'],
+        category=category,
+        seller=seller,
+        tag=tag,
+        starts_at=data.get('starts_at') or timezone.now(),
+        ends_at=data.get('ends_at'),
+        created_by=request.user,
+    )
+    updated = 0
+    if campaign.starts_at <= timezone.now():
+        updated = apply_campaign(campaign)
+    return Response({'campaign': PriceCampaignSerializer(campaign).data, 'updated': updated}, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_catalog(request):
+    upload = request.FILES.get('file')
+    if not upload:
+        return Response({'error': 'A CSV or JSONL file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    fmt = request.data.get('format') or guess_format(upload.name)
+    if fmt not in ('csv', 'jsonl'):
+        return Response({'error': 'format must be csv or jsonl'}, status=status.HTTP_400_BAD_REQUEST)
+
+    importer = CatalogImporter(request.user)
+    upload.open('rb')
+    result = importer.run(iter_rows(upload.file, fmt))
+    response_status = status.HTTP_201_CREATED if result['created'] else status.HTTP_400_BAD_REQUEST
+    return Response(result, status=response_status)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_update_stock(request):
+    """Set stock levels by SKU or barcode from a JSON `items` list or an uploaded CSV/JSONL `file`."""
+    upload = request.FILES.get('file')
+    if upload:
+        fmt = request.data.get('format') or guess_format(upload.name)
+        if fmt not in ('csv', 'jsonl'):
+            return Response({'error': 'format must be csv or jsonl'}, status=status.HTTP_400_BAD_REQUEST)
+        upload.open('rb')
+        rows = iter_rows(upload.file, fmt)
+    else:
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response(
+                {'error': 'Send items as a list of {"sku" or "barcode", "quantity"} objects, or a CSV/JSONL file'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        rows = (
+            (number, item if isinstance(item, dict) else RowError('Expected an object'))
+            for number, item in enumerate(items, start=1)
+        )
+
+    result = StockUpdater(request.user).run(rows)
+    return Response(result)
+
+
+def _export_response(request, name, headers, rows):
+    # ?output= rather than ?format=, which DRF reserves for renderer selection
+    output = request.query_params.get('output', 'csv')
+    if output not in ('csv', 'jsonl'):
+        return Response({'error': 'output must be csv or jsonl'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if output == 'csv':
+        stream, content_type = render_csv(headers, rows), 'text/csv'
+    else:
+        stream, content_type = render_jsonl(headers, rows), 'application/x-ndjson'
+    filename = f'{name}.{output}'
+
+    if request.query_params.get('gzip') in ('1', 'true'):
+        stream = gzip_stream(stream)
+        content_type = 'application/gzip'
+        filename += '.gz'
+
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_products(request):
+    headers, rows = product_rows(request.user)
+    return _export_response(request, 'products', headers, rows)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_orders(request):
+    headers, rows = order_item_rows(request.user)
+    return _export_response(request, 'orders', headers, rows)
+
+
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 366
+
+
+def _analytics_window(request):
+    """(start, end) dates from ?start=&end= (ISO dates) or ?days=, defaulting to the last 30 days."""
+    params = request.query_params
+    try:
+        end = date.fromisoformat(params['end']) if params.get('end') else timezone.localdate()
+        start = date.fromisoformat(params['start']) if params.get('start') else None
+        days = int(params.get('days', ANALYTICS_DEFAULT_DAYS)) if start is None else None
+    except ValueError:
+        raise ValueError('Use YYYY-MM-DD for start/end and a whole number for days.')
+    if start is None:
+        # Checked before the subtraction, which overflows for huge values
+        if not 1 <= days <= ANALYTICS_MAX_DAYS:
+            raise ValueError(f'days must be between 1 and {ANALYTICS_MAX_DAYS}.')
+        try:
+            start = end - timedelta(days=days - 1)
+        except OverflowError:
+            raise ValueError('The window starts before the earliest supported date.')
+    if start > end:
+        raise ValueError('start must not be after end.')
+    if (end - start).days >= ANALYTICS_MAX_DAYS:
+        raise ValueError(f'The window is limited to {ANALYTICS_MAX_DAYS} days.')
+    return start, end
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def seller_analytics(request):
+    try:
+        start, end = _analytics_window(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    product_id = request.query_params.get('product')
+    if product_id and not product_id.isdigit():
+        return Response({'error': 'product must be an id.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    totals, series = time_series(request.user, start, end, int(product_id) if product_id else None)
+    return Response({'start': start, 'end': end, 'totals': totals, 'series': series})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def seller_top_products(request):
+    try:
+        start, end = _analytics_window(request)
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    metric = request.query_params.get('metric', 'revenue')
+    if metric not in METRICS:
+        return Response({'error': f'metric must be one of {", ".join(METRICS)}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'start': start,
+        'end': end,
+        'metric': metric,
+        'results': top_products(request.user, start, end, metric, limit),
+    })
+
+
+LOW_STOCK_PAGE_SIZE = 50
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def seller_low_stock(request):
+    """The seller's low-stock products, lowest stock first, paged with ?page=."""
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+    except ValueError:
+        return Response({'error': 'page must be a whole number.'}, status=status.HTTP_400_BAD_REQUEST)
+    start = (page - 1) * LOW_STOCK_PAGE_SIZE
+
+    flagged = Product.objects.filter(seller=request.user, is_low_stock=True)
+    rows = list(
+        with_lowest_stock(flagged)
+        .order_by('lowest_stock', 'pk')
+        .values('id', 'product_name', 'sku', 'stock_quantity', 'low_stock_threshold', 'lowest_stock')
+        [start:start + LOW_STOCK_PAGE_SIZE + 1]
+    )
+    has_next = len(rows) > LOW_STOCK_PAGE_SIZE
+    rows = rows[:LOW_STOCK_PAGE_SIZE]
+
+    low_variants = {}
+    for variant in ProductVariant.objects.filter(
+        product_id__in=[row['id'] for row in rows], stock_quantity__lte=F('product__low_stock_threshold')
+    ).values('product_id', 'id', 'sku', 'stock_quantity'):
+        low_variants.setdefault(variant.pop('product_id'), []).append(variant)
+    for row in rows:
+        row['low_variants'] = low_variants.get(row['id'], [])
+
+    return Response({
+        'page': page,
+        'next': page + 1 if has_next else None,
+        'results': rows,
+    })